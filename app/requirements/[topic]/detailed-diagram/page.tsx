@@ -13,6 +13,35 @@ const DIAGRAM_EMBED_ORIGIN = "https://embed.diagrams.net";
 const API_BASE =
   process.env.NEXT_PUBLIC_API_URL ?? "http://localhost:8000";
 
+const RENDER_JOB_DEADLINE_MS = 120_000;
+const RENDER_JOB_MAX_BACKOFF_MS = 8_000;
+
+/**
+ * Image URL of a background render job, or "" when it failed, is unknown or is still pending at
+ * the deadline. Each request long-polls on the server; between requests the client backs off
+ * (doubling up to RENDER_JOB_MAX_BACKOFF_MS), so a pending job or a transient error is retried.
+ */
+async function pollRenderJob(jobId: string): Promise<string> {
+  const deadline = Date.now() + RENDER_JOB_DEADLINE_MS;
+  let backoff = 500;
+  while (Date.now() < deadline) {
+    try {
+      const res = await fetch(`${API_BASE}/renders/jobs/${jobId}`);
+      if (res.status === 404) return "";
+      if (res.ok) {
+        const job = await res.json();
+        if (job.status === "done") return job.url ?? "";
+        if (job.status === "failed") return "";
+      }
+    } catch (err) {
+      console.error(err);
+    }
+    await new Promise((resolve) => setTimeout(resolve, Math.min(backoff, deadline - Date.now())));
+    backoff = Math.min(backoff * 2, RENDER_JOB_MAX_BACKOFF_MS);
+  }
+  return "";
+}
+
 export default function DetailedDiagramPage() {
   const params = useParams();
   const topic = params.topic as string;
@@ -100,12 +129,28 @@ export default function DetailedDiagramPage() {
           return res.json();
         })
         .then((data) => {
+          // The API returns a /renders/{id}.svg or .png path (or a data URL in inline mode).
+          const imageUrl = (url: string | undefined) =>
+            url?.startsWith("/") ? `${API_BASE}${url}` : url ?? "";
           setValidationResults({
             feedback: data.feedback ?? "",
             improvements: data.improvements ?? "",
             suggestedDiagram: data.suggestedDiagram ?? "",
-            suggestedDiagramPng: data.suggestedDiagramPng ?? "",
+            suggestedDiagramPng: imageUrl(data.suggestedDiagramPng),
           });
+          // The image is rendered in the background; long-poll its render job until it finishes.
+          if (data.renderJobId && !data.suggestedDiagramPng) {
+            pollRenderJob(data.renderJobId)
+              .then((url) => {
+                if (!url) return;
+                setValidationResults((prev) =>
+                  prev && prev.suggestedDiagram === data.suggestedDiagram
+                    ? { ...prev, suggestedDiagramPng: imageUrl(url) }
+                    : prev
+                );
+              })
+              .catch((err) => console.error(err));
+          }
         })
         .catch((err) => {
           console.error(err);
@@ -443,14 +488,14 @@ export default function DetailedDiagramPage() {
                     <code>{validationResults.suggestedDiagram}</code>
                   </pre>
                 </div>
-                {validationResults.suggestedDiagramPng?.startsWith("data:image") && (
+                {validationResults.suggestedDiagramPng && (
                   <div className="mt-4 overflow-hidden rounded-xl border border-amber-200/80 bg-white/60 p-3 dark:border-amber-800 dark:bg-gray-900/40">
                     <p className="mb-2 text-xs font-medium text-gray-600 dark:text-gray-400">
-                      Server-rendered PNG (optional)
+                      Server-rendered image (optional)
                     </p>
                     <img
                       src={validationResults.suggestedDiagramPng}
-                      alt="Suggested diagram PNG"
+                      alt="Suggested diagram"
                       className="max-h-48 w-full object-contain"
                     />
                     <p className="mt-2 text-xs text-gray-500 dark:text-gray-400">
@@ -459,12 +504,14 @@ export default function DetailedDiagramPage() {
                         onClick={() => {
                           const a = document.createElement("a");
                           a.href = validationResults.suggestedDiagramPng;
-                          a.download = "suggested-detailed-diagram.png";
+                          const url = validationResults.suggestedDiagramPng;
+                          const isSvg = url.startsWith("data:image/svg") || url.endsWith(".svg");
+                          a.download = isSvg ? "suggested-detailed-diagram.svg" : "suggested-detailed-diagram.png";
                           a.click();
                         }}
                         className="font-medium text-teal-600 hover:underline dark:text-teal-400"
                       >
-                        Download PNG
+                        Download image
                       </button>
                     </p>
                   </div>
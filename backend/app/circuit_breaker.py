@@ -0,0 +1,134 @@
+"""Circuit breakers for LLM providers, one per (provider, model).
+
+closed     calls pass; CIRCUIT_FAILURE_THRESHOLD consecutive provider failures open the circuit.
+open       calls fail immediately with CircuitOpenError (callers fall back to their stub /
+           local result) for CIRCUIT_OPEN_SECONDS.
+half_open  up to CIRCUIT_HALF_OPEN_PROBES calls are let through; a success closes the circuit,
+           a failure re-opens it.
+Only transient provider failures count (see llm_scheduler.is_retryable); bad requests and
+cancellations (e.g. the caller's latency budget ran out) do not. State is reported on /health.
+"""
+
+import os
+import time
+from typing import Any, Awaitable, Callable, TypeVar
+
+from app import metrics
+from app.llm_scheduler import is_retryable
+
+T = TypeVar("T")
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+CIRCUIT_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "1"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit is open."""
+
+    def __init__(self, name: str, retry_in: float) -> None:
+        super().__init__(f"circuit {name} is open (retry in {retry_in:.1f}s)")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        *,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        open_seconds: float = CIRCUIT_OPEN_SECONDS,
+        half_open_probes: int = CIRCUIT_HALF_OPEN_PROBES,
+    ) -> None:
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.open_seconds = open_seconds
+        self.half_open_probes = max(1, half_open_probes)
+        self._state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self.probes = 0
+        return self._state
+
+    def allow(self) -> None:
+        """Reserve permission for one call; raises CircuitOpenError when it must not be made."""
+        state = self.state
+        if state == CLOSED:
+            return
+        if state == HALF_OPEN and self.probes < self.half_open_probes:
+            self.probes += 1
+            return
+        metrics.incr(f"circuit.{self.name}.short_circuited")
+        raise CircuitOpenError(self.name, max(0.0, self.opened_at + self.open_seconds - time.monotonic()))
+
+    def record_success(self) -> None:
+        if self._state != CLOSED:
+            metrics.incr(f"circuit.{self.name}.closed")
+        self._state = CLOSED
+        self.failures = 0
+        self.probes = 0
+
+    def record_failure(self, exc: BaseException) -> None:
+        if not is_retryable(exc):
+            self.release_probe()
+            return
+        self.failures += 1
+        if self._state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self._state != OPEN:
+                metrics.incr(f"circuit.{self.name}.opened")
+            self._state = OPEN
+            self.opened_at = time.monotonic()
+            self.probes = 0
+
+    def release_probe(self) -> None:
+        """Give back a half-open probe reservation when the call ended without a verdict."""
+        if self._state == HALF_OPEN and self.probes > 0:
+            self.probes -= 1
+
+    async def call(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run fn() through the breaker."""
+        self.allow()
+        try:
+            result = await fn()
+        except Exception as exc:
+            self.record_failure(exc)
+            raise
+        except BaseException:
+            self.release_probe()  # cancelled: says nothing about the provider
+            raise
+        self.record_success()
+        return result
+
+    def snapshot(self) -> dict[str, Any]:
+        state = self.state
+        info: dict[str, Any] = {"state": state, "consecutive_failures": self.failures}
+        if state == OPEN:
+            info["retry_in_seconds"] = round(max(0.0, self.opened_at + self.open_seconds - time.monotonic()), 1)
+        return info
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def breaker_for(provider: str, model: str) -> CircuitBreaker:
+    """The shared breaker for a provider/model pair (created on first use)."""
+    name = f"{provider}:{model}"
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(name)
+    return breaker
+
+
+def circuits_snapshot() -> dict[str, dict[str, Any]]:
+    return {name: breaker.snapshot() for name, breaker in sorted(_breakers.items())}
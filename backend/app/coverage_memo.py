@@ -0,0 +1,99 @@
+"""Pairwise coverage verdicts: (kind, reference item, user answer) -> matched / not matched.
+
+A reference item is resolved locally when some current user answer is a known match (matched),
+or when every current answer is a known non-match (missed). Only unresolved reference items
+need an LLM call, so re-submitting with one edited line sends at most the affected items.
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from app import metrics
+
+COVERAGE_MEMO_MAX_ENTRIES = int(os.getenv("COVERAGE_MEMO_MAX_ENTRIES", "50000"))
+
+
+def normalize_item(text: str) -> str:
+    """Lowercase, collapse whitespace, trim surrounding punctuation."""
+    s = " ".join((text or "").lower().split())
+    return re.sub(r"^[\s\-–*•.,;:]+|[\s.,;:]+$", "", s)
+
+
+class CoverageVerdictMemo:
+    """Bounded LRU of pairwise verdicts (per worker)."""
+
+    def __init__(self, max_entries: int = COVERAGE_MEMO_MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self._verdicts: OrderedDict[tuple[str, str, str], bool] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, kind: str, reference_item: str, answer: str) -> bool | None:
+        key = (kind, normalize_item(reference_item), normalize_item(answer))
+        with self._lock:
+            verdict = self._verdicts.get(key)
+            if verdict is not None:
+                self._verdicts.move_to_end(key)
+            return verdict
+
+    def put(self, kind: str, reference_item: str, answer: str, matched: bool) -> None:
+        key = (kind, normalize_item(reference_item), normalize_item(answer))
+        with self._lock:
+            self._verdicts[key] = matched
+            self._verdicts.move_to_end(key)
+            while len(self._verdicts) > self.max_entries:
+                self._verdicts.popitem(last=False)
+
+    def resolve(
+        self, kind: str, reference: list[str], answers: list[str]
+    ) -> tuple[list[str], list[str], list[str]]:
+        """Split reference into (known matched, known missed, unresolved) for these answers."""
+        answers = [a for a in answers if normalize_item(a)]
+        matched: list[str] = []
+        missed: list[str] = []
+        unresolved: list[str] = []
+        for ref in reference:
+            if not answers:
+                missed.append(ref)
+                continue
+            verdicts = [self.get(kind, ref, a) for a in answers]
+            if any(v is True for v in verdicts):
+                matched.append(ref)
+            elif all(v is False for v in verdicts):
+                missed.append(ref)
+            else:
+                unresolved.append(ref)
+        metrics.incr("coverage_memo.resolved", len(matched) + len(missed))
+        metrics.incr("coverage_memo.unresolved", len(unresolved))
+        return matched, missed, unresolved
+
+    def record(
+        self,
+        kind: str,
+        answers: list[str],
+        matched: list[str],
+        missed: list[str],
+        evidence: dict[str, str],
+    ) -> None:
+        """Learn from one LLM verdict over `answers`.
+        A missed reference item is a non-match for every answer. A matched item is a match for the
+        answer named in `evidence` (or the only answer); other answers stay unknown."""
+        answers = [a for a in answers if normalize_item(a)]
+        by_norm = {normalize_item(a): a for a in answers}
+        for ref in missed:
+            for a in answers:
+                self.put(kind, ref, a, False)
+        for ref in matched:
+            answer = by_norm.get(normalize_item(evidence.get(ref, "")))
+            if answer is None and len(answers) == 1:
+                answer = answers[0]
+            if answer is not None:
+                self.put(kind, ref, answer, True)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._verdicts.clear()
+
+
+coverage_memo = CoverageVerdictMemo()
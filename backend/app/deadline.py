@@ -0,0 +1,111 @@
+"""Per-endpoint latency budgets for LLM calls.
+
+The budget lives in a context var, so every asyncio.gather branch spawned by an endpoint
+shares it. LLM calls run with whatever time is left; when the budget is exhausted the call
+is cancelled, the budget is marked degraded, and the caller falls back to its stub result.
+"""
+
+import asyncio
+import functools
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+DEFAULT_DEADLINE_SECONDS = 15.0
+
+# Seconds per endpoint; override with LLM_DEADLINE_<ENDPOINT> (e.g. LLM_DEADLINE_VALIDATE_DETAILED_DIAGRAM=25).
+_DEFAULT_ENDPOINT_DEADLINES: dict[str, float] = {
+    "validate": 8.0,
+    "validate-apis": 8.0,
+    "validate-diagram": 10.0,
+    "validate-flow": 10.0,
+    "validate-deep-dives": 15.0,
+    "validate-detailed-diagram": 20.0,
+    "validate-estimation": 12.0,
+    "validate-data-model": 12.0,
+}
+
+
+def _env_name(endpoint: str) -> str:
+    return "LLM_DEADLINE_" + endpoint.upper().replace("-", "_")
+
+
+def endpoint_deadline(endpoint: str) -> float:
+    """Configured budget (seconds) for an endpoint."""
+    default = _DEFAULT_ENDPOINT_DEADLINES.get(endpoint, DEFAULT_DEADLINE_SECONDS)
+    return float(os.getenv(_env_name(endpoint), str(default)))
+
+
+class RequestBudget:
+    """Absolute deadline for one request plus a flag recording whether any part was degraded."""
+
+    def __init__(self, seconds: float) -> None:
+        self.expires_at = asyncio.get_running_loop().time() + seconds
+        self.degraded = False
+
+    def remaining(self) -> float:
+        return self.expires_at - asyncio.get_running_loop().time()
+
+
+_current_budget: ContextVar[RequestBudget | None] = ContextVar("request_budget", default=None)
+
+
+@contextmanager
+def request_budget(endpoint: str) -> Iterator[RequestBudget]:
+    """Install the endpoint's budget for the duration of the block (and all tasks it spawns)."""
+    budget = RequestBudget(endpoint_deadline(endpoint))
+    token = _current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _current_budget.reset(token)
+
+
+def current_budget() -> RequestBudget | None:
+    return _current_budget.get()
+
+
+def mark_degraded() -> None:
+    """Record that the current request served a stub/deterministic result instead of an LLM answer."""
+    budget = _current_budget.get()
+    if budget is not None:
+        budget.degraded = True
+
+
+async def run_within_budget(aw: Awaitable[T]) -> T:
+    """Await aw with the remaining request budget as timeout. Raises TimeoutError (and marks the
+    request degraded) when the budget is already spent or runs out; without a budget, awaits as is."""
+    budget = _current_budget.get()
+    if budget is None:
+        return await aw
+    remaining = budget.remaining()
+    if remaining <= 0:
+        if asyncio.iscoroutine(aw):
+            aw.close()
+        budget.degraded = True
+        raise TimeoutError("request budget exhausted")
+    try:
+        return await asyncio.wait_for(aw, timeout=remaining)
+    except TimeoutError:
+        budget.degraded = True
+        raise
+
+
+def with_deadline(endpoint: str) -> Callable[[Callable[..., Awaitable[Any]]], Callable[..., Awaitable[Any]]]:
+    """Endpoint decorator: run the handler under its budget and set `degraded` on the response model."""
+
+    def decorator(fn: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        @functools.wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with request_budget(endpoint) as budget:
+                result = await fn(*args, **kwargs)
+            if budget.degraded and hasattr(result, "degraded"):
+                result.degraded = True
+            return result
+
+        return wrapper
+
+    return decorator
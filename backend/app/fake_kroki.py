@@ -0,0 +1,196 @@
+"""Local stand-in for Kroki, for tests and offline render benchmarks.
+
+create_fake_kroki() returns an ASGI app that answers POST /{engine}/{format} like Kroki: a small
+valid PNG or SVG for sources the engine accepts, 400 for sources it does not (the mermaid engine
+only accepts sources starting with a Mermaid diagram keyword, d2 rejects those), 404 for unknown
+engines or formats. Latency, random 500s and hanging requests are configurable, so render
+throughput, timeouts and fallbacks can be exercised without the network:
+
+    python -m app.fake_kroki --serve --port 8001        # then KROKI_URL=http://localhost:8001
+    python -m app.fake_kroki --bench 500 --latency-ms 40 --failure-rate 0.1 --hang-rate 0.02
+
+The benchmark renders every diagram as Mermaid and as D2 through first_valid(), which races the
+two and keeps the first valid image (--no-race tries D2 only after Mermaid failed). The API itself
+does not race engines: it sends valid Mermaid to Kroki once.
+"""
+
+import argparse
+import asyncio
+import random
+import struct
+import time
+import zlib
+from html import escape
+from typing import Awaitable, Callable, TypeVar
+
+import httpx
+from fastapi import FastAPI, Request, Response
+
+ENGINES = ("mermaid", "d2")
+FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+T = TypeVar("T")
+MERMAID_KEYWORDS = (
+    "flowchart",
+    "graph",
+    "sequenceDiagram",
+    "classDiagram",
+    "stateDiagram",
+    "erDiagram",
+    "gantt",
+    "journey",
+    "pie",
+    "mindmap",
+)
+
+
+def _png(width: int = 2, height: int = 2) -> bytes:
+    """Smallest useful valid PNG: an 8-bit grayscale white image."""
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    rows = b"".join(b"\x00" + b"\xff" * width for _ in range(height))
+    header = struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b"")
+
+
+def _svg(source: str) -> bytes:
+    first_line = escape(source.strip().splitlines()[0] if source.strip() else "")
+    return (
+        '<svg xmlns="http://www.w3.org/2000/svg" width="320" height="40">'
+        f'<text x="8" y="24">{first_line}</text></svg>'
+    ).encode("utf-8")
+
+
+def _is_mermaid(source: str) -> bool:
+    first = source.strip().split(maxsplit=1)[0] if source.strip() else ""
+    return first.startswith(MERMAID_KEYWORDS)
+
+
+def create_fake_kroki(
+    *,
+    latency_ms: float = 0.0,
+    failure_rate: float = 0.0,
+    hang_rate: float = 0.0,
+    seed: int | None = None,
+) -> FastAPI:
+    """Fake Kroki app. failure_rate answers 500, hang_rate never answers (until the client gives up)."""
+    rng = random.Random(seed)
+    fake = FastAPI(title="Fake Kroki")
+    fake.state.requests = 0
+
+    @fake.post("/{engine}/{fmt}")
+    async def render(engine: str, fmt: str, request: Request) -> Response:
+        fake.state.requests += 1
+        source = (await request.body()).decode("utf-8", errors="replace")
+        if engine not in ENGINES or fmt not in FORMATS:
+            return Response(status_code=404, content=b"Unsupported diagram type or format")
+        roll = rng.random()
+        if roll < hang_rate:
+            await asyncio.sleep(3600)
+        if latency_ms:
+            await asyncio.sleep(rng.uniform(0.5, 1.5) * latency_ms / 1000)
+        if roll < hang_rate + failure_rate:
+            return Response(status_code=500, content=b"Internal error")
+        if not source.strip() or _is_mermaid(source) != (engine == "mermaid"):
+            return Response(status_code=400, content=f"Error 400: syntax error in {engine} source".encode())
+        body = _png() if fmt == "png" else _svg(source)
+        return Response(content=body, media_type=FORMATS[fmt])
+
+    return fake
+
+
+app = create_fake_kroki()
+
+
+async def first_valid(attempts: list[Callable[[], Awaitable[T | None]]], *, race: bool = True) -> T | None:
+    """Result of the first attempt that returns something other than None (None if all fail).
+    race runs the attempts concurrently and cancels the others once one succeeds; otherwise they
+    run in order."""
+    if not race or len(attempts) < 2:
+        for attempt in attempts:
+            result = await attempt()
+            if result is not None:
+                return result
+        return None
+    pending = {asyncio.ensure_future(attempt()) for attempt in attempts}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled() and task.exception() is None and task.result() is not None:
+                    return task.result()
+        return None
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def _bench(args: argparse.Namespace) -> None:
+    from app.kroki import KrokiRenderer
+
+    fake = create_fake_kroki(
+        latency_ms=args.latency_ms, failure_rate=args.failure_rate, hang_rate=args.hang_rate, seed=args.seed
+    )
+    renderer = KrokiRenderer(
+        "http://fake-kroki",
+        timeout=args.timeout,
+        max_concurrency=args.concurrency,
+        transport=httpx.ASGITransport(app=fake),
+    )
+    sources = [f"flowchart TB\n  A{i}[Client] --> B{i}[API]" for i in range(args.bench)]
+    durations: list[float] = []
+    ok = 0
+
+    async def one(source: str) -> None:
+        nonlocal ok
+        started = time.monotonic()
+        image = await first_valid(
+            [lambda: renderer.render("mermaid", "png", source), lambda: renderer.render("d2", "png", source)],
+            race=not args.no_race,
+        )
+        durations.append(time.monotonic() - started)
+        ok += image is not None
+
+    started = time.monotonic()
+    await asyncio.gather(*(one(s) for s in sources))
+    elapsed = time.monotonic() - started
+    await renderer.close()
+    durations.sort()
+    p50 = durations[len(durations) // 2]
+    p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+    print(
+        f"{args.bench} renders in {elapsed:.2f}s ({args.bench / elapsed:.1f}/s), {ok} ok, "
+        f"{args.bench - ok} failed, p50 {p50 * 1000:.0f}ms, p95 {p95 * 1000:.0f}ms, "
+        f"{fake.state.requests} Kroki requests"
+    )
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.fake_kroki", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--serve", action="store_true", help="serve the fake over HTTP")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--bench", type=int, default=0, help="render this many diagrams against the fake")
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=2.0, help="per-render timeout (seconds)")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent renders")
+    parser.add_argument("--no-race", action="store_true", help="try D2 only after Mermaid failed")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+    if args.serve:
+        import uvicorn
+
+        served = create_fake_kroki(
+            latency_ms=args.latency_ms, failure_rate=args.failure_rate, hang_rate=args.hang_rate, seed=args.seed
+        )
+        uvicorn.run(served, port=args.port)
+    elif args.bench:
+        asyncio.run(_bench(args))
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Hedged LLM requests (opt-in with LLM_HEDGING=1) to cut tail latency.
+
+Latency of successful calls is tracked per prompt kind over a sliding window. When a call has
+not returned after the kind's LLM_HEDGE_PERCENTILE latency, one duplicate is sent; the first
+successful result wins and the other call is cancelled. Duplicates are capped so that at most
+LLM_HEDGE_BUDGET (e.g. 5%) extra calls are made, and no hedging happens for a kind until
+LLM_HEDGE_MIN_SAMPLES latencies have been seen.
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, TypeVar
+
+from app import metrics
+
+T = TypeVar("T")
+
+LLM_HEDGING = os.getenv("LLM_HEDGING", "0") == "1"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_BUDGET = float(os.getenv("LLM_HEDGE_BUDGET", "0.05"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_WINDOW = int(os.getenv("LLM_HEDGE_WINDOW", "200"))
+
+
+class LatencyTracker:
+    """Recent successful-call latencies (seconds) per prompt kind."""
+
+    def __init__(self, window: int = LLM_HEDGE_WINDOW) -> None:
+        self.window = window
+        self._samples: dict[str, deque[float]] = {}
+
+    def record(self, kind: str, seconds: float) -> None:
+        samples = self._samples.get(kind)
+        if samples is None:
+            samples = self._samples[kind] = deque(maxlen=self.window)
+        samples.append(seconds)
+        metrics.observe(f"llm.latency_seconds.{kind}", seconds)
+
+    def percentile(self, kind: str, p: float, min_samples: int = LLM_HEDGE_MIN_SAMPLES) -> float | None:
+        """Nearest-rank percentile, or None until min_samples latencies are known."""
+        samples = self._samples.get(kind)
+        if not samples or len(samples) < min_samples:
+            return None
+        ordered = sorted(samples)
+        rank = max(1, math.ceil(p / 100.0 * len(ordered)))
+        return ordered[rank - 1]
+
+
+class Hedger:
+    def __init__(
+        self,
+        *,
+        enabled: bool = LLM_HEDGING,
+        percentile: float = LLM_HEDGE_PERCENTILE,
+        budget: float = LLM_HEDGE_BUDGET,
+        min_samples: int = LLM_HEDGE_MIN_SAMPLES,
+        tracker: LatencyTracker | None = None,
+    ) -> None:
+        self.enabled = enabled
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.tracker = tracker or LatencyTracker()
+        self.calls = 0
+        self.hedges = 0
+
+    def _hedge_allowed(self) -> bool:
+        return self.hedges + 1 <= self.budget * self.calls
+
+    async def _timed(self, kind: str, fn: Callable[[], Awaitable[T]]) -> T:
+        started = time.monotonic()
+        result = await fn()
+        self.tracker.record(kind, time.monotonic() - started)
+        return result
+
+    async def run(self, kind: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Call fn(); if hedging is on and it is slow for its kind, race one duplicate against it."""
+        self.calls += 1
+        delay = self.tracker.percentile(kind, self.percentile, self.min_samples) if self.enabled else None
+        primary = asyncio.ensure_future(self._timed(kind, fn))
+        if delay is None:
+            return await primary
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or not self._hedge_allowed():
+                return await primary
+            self.hedges += 1
+            metrics.incr("llm.hedge.sent")
+            tasks.append(asyncio.ensure_future(self._timed(kind, fn)))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            metrics.incr("llm.hedge.won")
+                        return task.result()
+            return primary.result()  # both failed: surface the original call's error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+
+hedger = Hedger()
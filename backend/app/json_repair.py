@@ -0,0 +1,140 @@
+"""Tolerant parsing of LLM JSON replies.
+
+parse_llm_json(kind, content) returns the JSON object even when the reply is wrapped in a
+markdown fence, has trailing text, or was cut off mid-way: an unterminated text field is closed,
+an incomplete trailing member or list element is dropped and open brackets are closed, so every
+field that was complete is kept. Outcomes are counted per prompt kind (ok / repaired / failed)
+and reported on /metrics with the parse success rate.
+"""
+
+import json
+import re
+import threading
+from collections import defaultdict
+from typing import Any
+
+from app import metrics
+
+# How many cut points (from the end) to try before giving up on a truncated reply.
+MAX_REPAIR_ATTEMPTS = 64
+
+_FENCE = re.compile(r"^\s*```[a-zA-Z]*\s*|\s*```\s*$")
+_CLOSERS = {"{": "}", "[": "]"}
+
+_lock = threading.Lock()
+_outcomes: dict[str, dict[str, int]] = defaultdict(lambda: {"ok": 0, "repaired": 0, "failed": 0})
+
+
+class UnparseableJSON(ValueError):
+    """Nothing usable could be recovered from the reply."""
+
+
+def _closing(stack: list[str]) -> str:
+    return "".join(_CLOSERS[c] for c in reversed(stack))
+
+
+def _candidates(text: str) -> list[str]:
+    """Repaired variants of a truncated document, most complete first."""
+    stack: list[str] = []
+    in_string = escape = False
+    string_is_key = False
+    expect_key: list[bool] = []
+    cuts: list[tuple[int, list[str]]] = []  # (end position, open containers) of valid prefixes
+    for i, c in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif c == "\\":
+                escape = True
+            elif c == '"':
+                in_string = False
+                if not string_is_key:
+                    cuts.append((i + 1, stack.copy()))
+            continue
+        if c == '"':
+            in_string = True
+            string_is_key = bool(stack) and stack[-1] == "{" and expect_key[-1]
+        elif c in "{[":
+            stack.append(c)
+            expect_key.append(c == "{")
+            cuts.append((i + 1, stack.copy()))
+        elif c in "}]":
+            if not stack:
+                break
+            stack.pop()
+            expect_key.pop()
+            cuts.append((i + 1, stack.copy()))
+            if not stack:
+                break
+        elif c == ",":
+            cuts.append((i, stack.copy()))
+            if stack and stack[-1] == "{":
+                expect_key[-1] = True
+        elif c == ":":
+            if expect_key:
+                expect_key[-1] = False
+    candidates: list[str] = []
+    if in_string and not string_is_key and stack and stack[-1] == "{":
+        # A cut-off text field keeps its text; a cut-off list element is dropped instead.
+        body = text[:-1] if escape else text
+        candidates.append(body + '"' + _closing(stack))
+    candidates.append(text.rstrip().rstrip(",") + _closing(stack))
+    for end, open_stack in reversed(cuts[-MAX_REPAIR_ATTEMPTS:]):
+        candidates.append(text[:end].rstrip().rstrip(",") + _closing(open_stack))
+    return candidates
+
+
+def repair_json(text: str) -> Any:
+    """Best-effort parse of a possibly fenced, padded or truncated JSON document.
+    Raises UnparseableJSON when no prefix of the reply is valid JSON."""
+    text = _FENCE.sub("", text or "")
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        raise UnparseableJSON("no JSON object in reply")
+    text = text[min(starts) :]
+    try:
+        return json.JSONDecoder().raw_decode(text)[0]  # complete document (trailing text ignored)
+    except ValueError:
+        pass
+    for candidate in _candidates(text):
+        try:
+            return json.loads(candidate)
+        except ValueError:
+            continue
+    raise UnparseableJSON("reply could not be repaired")
+
+
+def _count(kind: str, outcome: str) -> None:
+    with _lock:
+        _outcomes[kind][outcome] += 1
+    metrics.incr(f"llm.parse.{outcome}.{kind}")
+
+
+def parse_llm_json(kind: str, content: str | None) -> dict[str, Any]:
+    """JSON object from an LLM reply, repairing it if needed. Raises UnparseableJSON (a ValueError)
+    when nothing usable was returned or the reply is not an object."""
+    try:
+        data = json.loads(content or "")
+        outcome = "ok"
+    except ValueError:
+        try:
+            data = repair_json(content or "")
+        except UnparseableJSON:
+            _count(kind, "failed")
+            raise
+        outcome = "repaired"
+    if not isinstance(data, dict):
+        _count(kind, "failed")
+        raise UnparseableJSON(f"expected a JSON object, got {type(data).__name__}")
+    _count(kind, outcome)
+    return data
+
+
+def parse_stats() -> dict[str, dict[str, float]]:
+    """Per prompt kind: ok / repaired / failed counts and the success rate (ok + repaired)."""
+    with _lock:
+        return {
+            kind: {**counts, "success_rate": round((counts["ok"] + counts["repaired"]) / total, 3)}
+            for kind, counts in _outcomes.items()
+            if (total := sum(counts.values()))
+        }
@@ -0,0 +1,126 @@
+"""Incremental JSON parser for streamed LLM output.
+
+Feed the response text chunk by chunk; every value whose path is at most max_depth deep is
+reported as soon as its closing character arrives. With the default max_depth=2 that is each
+top-level field ("feedback",) and each element of a top-level array ("items", 0), so callers can
+forward finished fields while the model is still generating the rest.
+"""
+
+import json
+from typing import Any
+
+Path = tuple[str | int, ...]
+
+
+class _Frame:
+    __slots__ = ("kind", "path", "key", "index", "expect_key", "value_start")
+
+    def __init__(self, kind: str, path: Path) -> None:
+        self.kind = kind  # "{" or "["
+        self.path = path
+        self.key: str | None = None
+        self.index = 0
+        self.expect_key = kind == "{"
+        self.value_start: int | None = None
+
+    def child_path(self) -> Path:
+        return self.path + ((self.key or "",) if self.kind == "{" else (self.index,))
+
+
+class JsonStreamParser:
+    """Character-level scanner over a growing JSON document (one top-level object or array)."""
+
+    def __init__(self, max_depth: int = 2) -> None:
+        self.max_depth = max_depth
+        self.text = ""
+        self._pos = 0
+        self._stack: list[_Frame] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._string_is_key = False
+        self._started = False
+
+    def feed(self, chunk: str) -> list[tuple[Path, Any]]:
+        """Append chunk; return (path, value) for every value completed by it, in document order."""
+        self.text += chunk
+        events: list[tuple[Path, Any]] = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    frame = self._stack[-1] if self._stack else None
+                    if frame is not None and self._string_is_key:
+                        frame.key = json.loads(text[self._string_start : i + 1])
+                    elif frame is not None:
+                        self._complete(frame, i + 1, events)
+                continue
+            if c in " \t\r\n":
+                continue
+            frame = self._stack[-1] if self._stack else None
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+                self._string_is_key = frame is not None and frame.kind == "{" and frame.expect_key
+                if frame is not None and not self._string_is_key:
+                    frame.value_start = i
+            elif c == ":":
+                if frame is not None:
+                    frame.expect_key = False
+            elif c == ",":
+                if frame is not None:
+                    self._complete_scalar(frame, i, events)
+                    if frame.kind == "{":
+                        frame.expect_key = True
+                    else:
+                        frame.index += 1
+            elif c in "{[":
+                if frame is not None:
+                    frame.value_start = i
+                    path = frame.child_path()
+                elif self._started:
+                    continue  # trailing text after the document
+                else:
+                    path = ()
+                self._started = True
+                self._stack.append(_Frame(c, path))
+            elif c in "}]":
+                if frame is None:
+                    continue
+                self._complete_scalar(frame, i, events)
+                self._stack.pop()
+                parent = self._stack[-1] if self._stack else None
+                if parent is not None:
+                    self._complete(parent, i + 1, events)
+            elif frame is not None and frame.value_start is None:
+                frame.value_start = i  # number, true, false, null
+        self._pos = len(text)
+        return events
+
+    @property
+    def done(self) -> bool:
+        """True once the top-level value has been closed."""
+        return self._started and not self._stack
+
+    def _complete_scalar(self, frame: _Frame, end: int, events: list[tuple[Path, Any]]) -> None:
+        if frame.value_start is not None:
+            self._complete(frame, end, events)
+
+    def _complete(self, frame: _Frame, end: int, events: list[tuple[Path, Any]]) -> None:
+        start = frame.value_start
+        frame.value_start = None
+        if start is None:
+            return
+        path = frame.child_path()
+        if len(path) > self.max_depth:
+            return
+        try:
+            events.append((path, json.loads(self.text[start:end])))
+        except ValueError:
+            pass
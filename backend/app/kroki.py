@@ -0,0 +1,120 @@
+"""Diagram rendering through Kroki (https://kroki.io or a self-hosted instance at KROKI_URL).
+
+KrokiRenderer owns one pooled httpx client, opened in the FastAPI lifespan hook (created lazily
+for scripts and tests), bounds concurrent renders with a semaphore and gives every render a total
+timeout. A render succeeds only when Kroki returns a valid image for the format (PNG signature or
+an <svg> document); anything else counts as a failure and returns None.
+
+Mermaid in the prompted flowchart subset is rendered in-process (app.mermaid_svg); Kroki is the
+fallback for other valid flowcharts, and KROKI_FALLBACK=0 turns it off (no network renders at
+all). Sources that do not parse locally (app.mermaid_repair) are never sent.
+"""
+
+import asyncio
+import os
+import time
+
+import httpx
+
+from app import metrics
+
+KROKI_URL = os.getenv("KROKI_URL", "https://kroki.io").rstrip("/")
+KROKI_TIMEOUT_SECONDS = float(os.getenv("KROKI_TIMEOUT_SECONDS", "10"))
+KROKI_CONNECT_TIMEOUT_SECONDS = float(os.getenv("KROKI_CONNECT_TIMEOUT_SECONDS", "3"))
+KROKI_MAX_CONCURRENCY = int(os.getenv("KROKI_MAX_CONCURRENCY", "8"))
+KROKI_MAX_CONNECTIONS = int(os.getenv("KROKI_MAX_CONNECTIONS", "16"))
+KROKI_FALLBACK = os.getenv("KROKI_FALLBACK", "1") == "1"
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def is_valid_image(fmt: str, data: bytes) -> bool:
+    if fmt == "png":
+        return data.startswith(_PNG_SIGNATURE)
+    if fmt == "svg":
+        return b"<svg" in data[:4096]
+    return bool(data)
+
+
+class KrokiRenderer:
+    """Pooled, concurrency-bounded Kroki client. transport replaces the network (e.g. an
+    httpx.ASGITransport around app.fake_kroki) for tests and offline benchmarks."""
+
+    def __init__(
+        self,
+        base_url: str = KROKI_URL,
+        *,
+        timeout: float = KROKI_TIMEOUT_SECONDS,
+        max_concurrency: int = KROKI_MAX_CONCURRENCY,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.transport = transport
+        self._client: httpx.AsyncClient | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _build_client(self) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=KROKI_MAX_CONNECTIONS, max_keepalive_connections=KROKI_MAX_CONNECTIONS
+        )
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            limits=limits,
+            timeout=httpx.Timeout(self.timeout, connect=min(KROKI_CONNECT_TIMEOUT_SECONDS, self.timeout)),
+            transport=self.transport,
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = self._build_client()
+        return self._client
+
+    def _limit(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore, self._loop = asyncio.Semaphore(max(1, self.max_concurrency)), loop
+        return self._semaphore
+
+    async def open(self) -> None:
+        """Create the pooled client (FastAPI lifespan)."""
+        if self._client is None:
+            self._client = self._build_client()
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def render(self, engine: str, fmt: str, source: str) -> bytes | None:
+        """Rendered image, or None when Kroki fails, times out or returns something that is not an image."""
+        if not source.strip():
+            return None
+        started = time.monotonic()
+        outcome = "failed"
+        try:
+            async with self._limit():
+                async with asyncio.timeout(self.timeout):
+                    r = await self.client.post(
+                        f"/{engine}/{fmt}",
+                        content=source.strip().encode("utf-8"),
+                        headers={"Content-Type": "text/plain"},
+                    )
+            if r.status_code == 200 and is_valid_image(fmt, r.content):
+                outcome = "ok"
+                return r.content
+            return None
+        except TimeoutError:
+            outcome = "timeout"
+            return None
+        except httpx.HTTPError:
+            return None
+        finally:
+            metrics.incr(f"kroki.{engine}.{outcome}")
+            metrics.observe(f"kroki.seconds.{engine}", time.monotonic() - started)
+
+
+kroki_renderer = KrokiRenderer()
@@ -1,17 +1,141 @@
-"""LLM calls for system design requirements. call_llm1 = OpenAI; call_llm2 = stub (or Anthropic)."""
+"""LLM calls for system design requirements. Every call goes through the provider router (llm_router);
+the *_2 calls ask a second, different provider when one is configured."""
 
+import asyncio
+import hashlib
 import json
 import os
-from typing import TypedDict
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, TypedDict
 
 from dotenv import load_dotenv
-from openai import AsyncOpenAI
 
 from app.api_normalize import compute_api_auto_matches
+from app import metrics
+from app.circuit_breaker import CircuitOpenError
+from app.coverage_memo import coverage_memo
+from app.deadline import mark_degraded, run_within_budget
+from app.json_repair import UnparseableJSON, parse_llm_json
+from app.json_stream import JsonStreamParser, Path
+from app.llm_client import get_anthropic_client, get_llm_client
+from app.mermaid_repair import clean_mermaid
+from app.micro_batch import MicroBatcher
+from app.prompt_budget import PromptBuilder
+from app.providers import (
+    ANTHROPIC_MODEL,
+    ANTHROPIC_STRONG_MODEL,
+    LLM_PROVIDERS,
+    OPENAI_MODEL,
+    OPENAI_STRONG_MODEL,
+    AnthropicProvider,
+    FakeProvider,
+    LLMProvider,
+    LLMRouter,
+    OpenAIProvider,
+)
+from app.reference_cache import reference_cache
+from app.similarity import settle_coverage
+from app.singleflight import SingleFlight
 
 load_dotenv()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
+# Fused mode: reference generation and coverage verdicts in one round trip (see call_llm_fused).
+LLM_FUSED_MODE = os.getenv("LLM_FUSED_MODE", "0") == "1"
+
+# Deep dives: one small call per sub-topic (plus one for missing topics) instead of one batched call.
+DEEP_DIVES_FANOUT = os.getenv("DEEP_DIVES_FANOUT", "0") == "1"
+DEEP_DIVES_CONCURRENCY = int(os.getenv("DEEP_DIVES_CONCURRENCY", "4"))
+
+# Coverage cascade: the fast model reports per-item confidence; items below the threshold are
+# re-classified by the strong model (see _classify_with_cascade).
+COVERAGE_CASCADE = os.getenv("COVERAGE_CASCADE", "0") == "1"
+COVERAGE_ESCALATE_BELOW = float(os.getenv("COVERAGE_ESCALATE_BELOW", "0.7"))
+
+# Coverage micro-batching: fast-tier coverage calls of the same kind from concurrent requests are
+# collected for up to COVERAGE_BATCH_WINDOW_MS (or COVERAGE_BATCH_MAX_JOBS jobs) and sent as one call.
+COVERAGE_BATCHING = os.getenv("COVERAGE_BATCHING", "0") == "1"
+COVERAGE_BATCH_WINDOW_MS = float(os.getenv("COVERAGE_BATCH_WINDOW_MS", "25"))
+COVERAGE_BATCH_MAX_JOBS = int(os.getenv("COVERAGE_BATCH_MAX_JOBS", "8"))
+
+# Identical concurrent prompts (e.g. a class opening the same topic) share one completion.
+_llm_flights = SingleFlight("llm.singleflight")
+
+
+def llm_available(*, secondary: bool = False) -> bool:
+    """True when an LLM provider is configured (secondary: a second, different one for the *_2 calls)."""
+    return llm_router.available(secondary=secondary)
+
+
+def _flight_key(
+    kind: str, system_prompt: str, user_content: str, secondary: bool = False, strong: bool = False
+) -> str:
+    """Prompt kind (+ provider slot / model tier) + hash of the prompt with whitespace collapsed."""
+    normalized = " ".join(user_content.split())
+    digest = hashlib.sha256(f"{system_prompt}\0{normalized}".encode("utf-8")).hexdigest()
+    return f"{kind}{'/secondary' if secondary else ''}{'/strong' if strong else ''}:{digest}"
+
+
+async def _chat_json(
+    kind: str, system_prompt: str, user_content: str, *, secondary: bool = False, strong: bool = False
+) -> str | None:
+    """Run one JSON-only completion through the provider router; return the raw message content.
+    kind names the prompt (e.g. "requirements", "coverage_apis") for the call layer; secondary asks
+    for a different provider than the primary choice (independent second opinion); strong uses the
+    provider's stronger model (coverage cascade escalations).
+    Concurrent identical calls are coalesced into one. Each caller waits within its own request
+    budget; on expiry its wait is cancelled and TimeoutError propagates to the caller's stub fallback.
+    The router picks the provider (latency/error EWMA, failover); per provider the call goes through
+    its circuit breaker, the hedger and its scheduler (admission, 429-aware retries). When every
+    provider's circuit is open, CircuitOpenError propagates and the request is marked degraded."""
+
+    async def complete() -> str | None:
+        return await llm_router.complete(kind, system_prompt, user_content, secondary=secondary, strong=strong)
+
+    try:
+        return await run_within_budget(
+            _llm_flights.do(_flight_key(kind, system_prompt, user_content, secondary, strong), complete)
+        )
+    except CircuitOpenError:
+        mark_degraded()
+        raise
+
+
+async def _chat_json_stream(kind: str, system_prompt: str, user_content: str) -> AsyncIterator[str]:
+    """Streaming variant of _chat_json: yield content deltas as they arrive (no coalescing).
+    Each wait (admission, connect and every chunk) runs within the current request budget. The
+    router fails over to another provider only until the first delta was sent."""
+    started = time.monotonic()
+    stream = llm_router.stream(kind, system_prompt, user_content)
+    first = True
+    try:
+        while True:
+            try:
+                delta = await run_within_budget(anext(stream))
+            except StopAsyncIteration:
+                break
+            if first:
+                metrics.observe(f"llm.stream.first_token_seconds.{kind}", time.monotonic() - started)
+                first = False
+            yield delta
+    except CircuitOpenError:
+        mark_degraded()
+        raise
+    finally:
+        await stream.aclose()
+
+
+async def _stream_json_fields(
+    kind: str, system_prompt: str, user_content: str
+) -> AsyncIterator[tuple[Path, Any]]:
+    """Stream a JSON-mode completion and yield (path, value) for each top-level field and each
+    element of a top-level array as soon as it is complete; the last item is ((), full object)."""
+    parser = JsonStreamParser(max_depth=2)
+    async for delta in _chat_json_stream(kind, system_prompt, user_content):
+        for event in parser.feed(delta):
+            yield event
+    yield (), parse_llm_json(kind, parser.text)
 
 
 class LLMResponse(TypedDict):
@@ -20,7 +144,7 @@ class LLMResponse(TypedDict):
 
 
 def _stub_llm1(_topic: str) -> LLMResponse:
-    """Fallback when OpenAI is not configured or fails."""
+    """Fallback when no LLM provider is configured or the call fails."""
     return {
         "functional_requirements": [
             "User authentication and authorization",
@@ -64,42 +188,52 @@ LLM1_SYSTEM_PROMPT = """You are a system design expert. For a given system desig
 
 
 async def call_llm1(topic: str) -> LLMResponse:
-    """Call OpenAI for topic. Returns functional + non-functional requirement lists. Falls back to stub if no key or on error."""
-    if not OPENAI_API_KEY:
-        print("OPENAI_API_KEY is not set")
-        return _stub_llm1(topic)
-
-    client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+    """Ask the provider router (llm_router) for the topic's functional + non-functional requirement lists.
+    Falls back to stub if no provider is configured or on error.
+    Results are served from the topic-keyed reference cache when available."""
+    if not llm_available():
+        print("No LLM provider configured (set OPENAI_API_KEY and/or ANTHROPIC_API_KEY)")
+        return reference_cache.bundled("requirements", topic) or _stub_llm1(topic)
+    result = await reference_cache.get_or_compute("requirements", topic, None, lambda: _generate_llm1(topic))
+    return result if result is not None else _stub_llm1(topic)
+
+
+async def _generate_llm1(topic: str, secondary: bool = False) -> LLMResponse | None:
+    """One LLM generation of the requirement lists; None on failure (never cached)."""
     try:
-        response = await client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": LLM1_SYSTEM_PROMPT},
-                {"role": "user", "content": f"System design topic: {topic}"},
-            ],
-            response_format={"type": "json_object"},
+        content = await _chat_json(
+            "requirements", LLM1_SYSTEM_PROMPT, f"System design topic: {topic}", secondary=secondary
         )
-        content = response.choices[0].message.content
         if not content:
-            return _stub_llm1(topic)
-        data = json.loads(content)
+            return None
+        data = parse_llm_json("requirements", content)
         func = data.get("functional_requirements") or []
         non_func = data.get("non_functional_requirements") or []
         if not isinstance(func, list):
             func = [str(x) for x in func] if func else []
         if not isinstance(non_func, list):
             non_func = [str(x) for x in non_func] if non_func else []
+        if not func and not non_func:
+            return None
+        # A reply cut off before one of the lists keeps the other; the missing one comes from the stub.
+        stub = _stub_llm1(topic)
         return {
-            "functional_requirements": [str(x) for x in func][:5],
-            "non_functional_requirements": [str(x) for x in non_func][:5],
+            "functional_requirements": [str(x) for x in func][:5] or stub["functional_requirements"],
+            "non_functional_requirements": [str(x) for x in non_func][:5] or stub["non_functional_requirements"],
         }
     except Exception:
-        return _stub_llm1(topic)
+        return None
 
 
 async def call_llm2(topic: str) -> LLMResponse:
-    """Call second LLM (e.g. Anthropic) for topic. Returns functional + non-functional requirement lists."""
-    return _stub_llm2(topic)
+    """Second opinion from a different provider than the one llm_router ranks first for call_llm1.
+    Returns functional + non-functional requirement lists; stub when only one provider is configured."""
+    if not llm_available(secondary=True):
+        return reference_cache.bundled("requirements_2", topic) or _stub_llm2(topic)
+    result = await reference_cache.get_or_compute(
+        "requirements_2", topic, None, lambda: _generate_llm1(topic, secondary=True)
+    )
+    return result if result is not None else _stub_llm2(topic)
 
 
 # --- API design: top APIs from two LLMs ---
@@ -129,34 +263,33 @@ def _stub_apis_2(_topic: str) -> list[str]:
 
 
 async def call_llm_apis_1(topic: str) -> list[str]:
-    """Return top 5 APIs for the system (OpenAI). Falls back to stub if no key or error."""
-    if not OPENAI_API_KEY:
-        return _stub_apis_1(topic)
-    client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+    """Return top 5 APIs for the system (llm_router, via the reference cache). Falls back to stub if no provider or error."""
+    if not llm_available():
+        return reference_cache.bundled("apis", topic) or _stub_apis_1(topic)
+    result = await reference_cache.get_or_compute("apis", topic, None, lambda: _generate_apis_1(topic))
+    return result if result is not None else _stub_apis_1(topic)
+
+
+async def _generate_apis_1(topic: str, secondary: bool = False) -> list[str] | None:
     try:
-        response = await client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": APIS_LLM_SYSTEM_PROMPT},
-                {"role": "user", "content": f"System design topic: {topic}"},
-            ],
-            response_format={"type": "json_object"},
-        )
-        content = response.choices[0].message.content
+        content = await _chat_json("apis", APIS_LLM_SYSTEM_PROMPT, f"System design topic: {topic}", secondary=secondary)
         if not content:
-            return _stub_apis_1(topic)
-        data = json.loads(content)
+            return None
+        data = parse_llm_json("apis", content)
         apis = data.get("apis") or []
         if not isinstance(apis, list):
             apis = []
         return [str(x).strip() for x in apis][:5]
     except Exception:
-        return _stub_apis_1(topic)
+        return None
 
 
 async def call_llm_apis_2(topic: str) -> list[str]:
-    """Return top 5 APIs for the system (stub; replace with second LLM)."""
-    return _stub_apis_2(topic)
+    """Return top 5 APIs for the system from the secondary provider (cached); stub with a single provider."""
+    if not llm_available(secondary=True):
+        return reference_cache.bundled("apis_2", topic) or _stub_apis_2(topic)
+    result = await reference_cache.get_or_compute("apis_2", topic, None, lambda: _generate_apis_1(topic, secondary=True))
+    return result if result is not None else _stub_apis_2(topic)
 
 
 # --- High-level diagram: key components from two LLMs ---
@@ -189,9 +322,9 @@ Mermaid syntax rules:
 - For databases you may use parentheses: db[(Database)]. Keep the diagram under 25 lines.
 
 Output format: Respond with valid JSON only, no other text. Use this exact shape:
-{{"elements": ["Component1", "Component2", ...], "suggested_diagram": "<mermaid code>"}}
+{{"elements": ["Component1", "Component2", ...], "mermaid_diagram": "<mermaid code>"}}
 - "elements": list of 5-10 key component names that appear in the diagram (e.g. "Post Service", "Feed Service", "Cache", "API Server").
-- "suggested_diagram": ONLY the raw Mermaid flowchart code (flowchart TB ...). No markdown code fences, no explanations. Valid Mermaid only."""
+- "mermaid_diagram": ONLY the raw Mermaid flowchart code (flowchart TB ...). No markdown code fences, no explanations. Valid Mermaid only."""
 
 
 DIAGRAM_LLM_SYSTEM_PROMPT = """You are a system design expert. For a given system design topic:
@@ -202,15 +335,17 @@ Respond only with valid JSON in this exact shape, no other text:
 {"elements": ["Component 1", "Component 2", ...], "mermaid_diagram": "flowchart TB\\n  A[Client] --> B[Load Balancer]\\n  B --> C[API Server]\\n  ..."}"""
 
 
-def _strip_mermaid_fences(raw: str) -> str:
-    """Remove markdown code fences and extra whitespace from Mermaid block."""
-    s = (raw or "").strip()
-    for prefix in ("```mermaid", "```"):
-        if s.startswith(prefix):
-            s = s[len(prefix) :].lstrip("\n")
-        if s.endswith("```"):
-            s = s[: s.rfind("```")].rstrip()
-    return s.strip()
+# Keys models use for the Mermaid source, whatever the prompt asked for ("mermaid_diagram" in the
+# diagram schema, "suggested_diagram" in the detailed-diagram prompt).
+_DIAGRAM_KEYS = ("mermaid_diagram", "suggested_diagram", "suggestedDiagram", "mermaid", "diagram")
+
+
+def _diagram_source(data: dict) -> str:
+    for key in _DIAGRAM_KEYS:
+        value = data.get(key)
+        if isinstance(value, str) and value.strip():
+            return value
+    return ""
 
 
 def _stub_diagram_1(_topic: str, _api_spec: str | None = None) -> DiagramLLM1Result:
@@ -237,55 +372,53 @@ def _stub_diagram_2(_topic: str) -> list[str]:
 
 
 async def call_llm_diagram_1(topic: str, api_spec: str | None = None) -> DiagramLLM1Result:
-    """Return key diagram elements and a suggested Mermaid diagram (OpenAI).
+    """Return key diagram elements and a suggested Mermaid diagram (llm_router).
     If api_spec is provided, the diagram is generated from the API spec with service-mapping rules.
-    Falls back to stub if no key or error."""
-    if not OPENAI_API_KEY:
-        return _stub_diagram_1(topic, api_spec)
-    client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+    Falls back to stub if no provider or error. Cached per (topic, api_spec)."""
+    spec = (api_spec or "").strip()
+    if not llm_available():
+        return reference_cache.bundled("diagram", topic, spec) or _stub_diagram_1(topic, api_spec)
+    result = await reference_cache.get_or_compute("diagram", topic, spec, lambda: _generate_diagram_1(topic, api_spec))
+    return result if result is not None else _stub_diagram_1(topic, api_spec)
+
+
+async def _generate_diagram_1(
+    topic: str, api_spec: str | None, secondary: bool = False
+) -> DiagramLLM1Result | None:
     use_api_prompt = bool((api_spec or "").strip())
     if use_api_prompt:
         user_content = build_api_to_diagram_prompt(api_spec.strip())
-        system_content = "You generate a high-level architecture Mermaid diagram from an API spec. Follow the mapping rules exactly. Output only valid JSON with elements and suggested_diagram."
+        system_content = "You generate a high-level architecture Mermaid diagram from an API spec. Follow the mapping rules exactly. Output only valid JSON with elements and mermaid_diagram."
     else:
         system_content = DIAGRAM_LLM_SYSTEM_PROMPT
         user_content = f"System design topic: {topic}"
     try:
-        response = await client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_content},
-                {"role": "user", "content": user_content},
-            ],
-            response_format={"type": "json_object"},
-        )
-        content = response.choices[0].message.content
+        content = await _chat_json("diagram", system_content, user_content, secondary=secondary)
         if not content:
-            return _stub_diagram_1(topic, api_spec)
-        data = json.loads(content)
+            return None
+        data = parse_llm_json("diagram", content)
         elements = data.get("elements") or []
         if not isinstance(elements, list):
             elements = []
         elements = [str(x).strip() for x in elements][:10]
-        mermaid = (
-            data.get("mermaid_diagram")
-            or data.get("suggested_diagram")
-            or ""
-        ).strip()
-        mermaid = _strip_mermaid_fences(mermaid)
+        mermaid = clean_mermaid("diagram", _diagram_source(data))
         if not mermaid:
             mermaid = _stub_diagram_1(topic, api_spec)["suggested_diagram"]
-        if not mermaid.startswith("flowchart"):
-            mermaid = "flowchart TB\n  " + mermaid
         print("Diagram elements:", elements)
         return {"elements": elements, "suggested_diagram": mermaid}
     except Exception:
-        return _stub_diagram_1(topic, api_spec)
+        return None
 
 
 async def call_llm_diagram_2(topic: str) -> list[str]:
-    """Return key diagram elements (stub; replace with second LLM)."""
-    return _stub_diagram_2(topic)
+    """Return key diagram elements from the secondary provider (cached); stub with a single provider."""
+    if not llm_available(secondary=True):
+        bundled = reference_cache.bundled("diagram_2", topic)
+        return bundled["elements"] if bundled else _stub_diagram_2(topic)
+    result = await reference_cache.get_or_compute(
+        "diagram_2", topic, None, lambda: _generate_diagram_1(topic, None, secondary=True)
+    )
+    return result["elements"] if result is not None else _stub_diagram_2(topic)
 
 
 # --- End-to-end flow validation ---
@@ -308,45 +441,74 @@ Respond with valid JSON only, in this exact shape (no other text):
 - "improvements": Specific, actionable suggestions. Leave empty if the flow is good."""
 
 
+_FLOW_STUB = {
+    "correct": True,
+    "feedback": "Flow summary was not validated (no API key or empty input).",
+    "improvements": "",
+}
+
+
+def _flow_user_content(topic: str, flow_summary: str, diagram_labels: list[str] | None) -> str:
+    prompt = PromptBuilder("flow", header=f"System design topic: {topic}", query=topic)
+    prompt.section("User's end-to-end flow summary", flow_summary.strip(), priority=1)
+    if diagram_labels:
+        prompt.section(
+            "Component labels from the user's high-level diagram (for reference)", ", ".join(diagram_labels), priority=2
+        )
+    return prompt.build()
+
+
+def _flow_result(data: dict) -> dict:
+    return {
+        "correct": bool(data.get("correct", False)),
+        "feedback": str(data.get("feedback") or "").strip() or "No feedback.",
+        "improvements": str(data.get("improvements") or "").strip(),
+    }
+
+
 async def call_llm_validate_flow(
     topic: str, flow_summary: str, diagram_labels: list[str] | None = None
 ) -> dict:
     """Validate user's end-to-end flow summary against the system design and optional diagram. Returns {correct, feedback, improvements}."""
-    stub_result = {
-        "correct": True,
-        "feedback": "Flow summary was not validated (no API key or empty input).",
-        "improvements": "",
-    }
+    stub_result = dict(_FLOW_STUB)
     if not (flow_summary or "").strip():
         return {**stub_result, "feedback": "No flow summary provided.", "correct": False}
-    if not OPENAI_API_KEY:
+    if not llm_available():
         return stub_result
-    client = AsyncOpenAI(api_key=OPENAI_API_KEY)
-    user_content = f"System design topic: {topic}\n\nUser's end-to-end flow summary:\n{flow_summary.strip()}"
-    if diagram_labels:
-        user_content += f"\n\nComponent labels from the user's high-level diagram (for reference):\n" + ", ".join(diagram_labels)
+    user_content = _flow_user_content(topic, flow_summary, diagram_labels)
     try:
-        response = await client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": FLOW_VALIDATION_PROMPT},
-                {"role": "user", "content": user_content},
-            ],
-            response_format={"type": "json_object"},
-        )
-        content = response.choices[0].message.content
+        content = await _chat_json("flow", FLOW_VALIDATION_PROMPT, user_content)
         if not content:
             return stub_result
-        data = json.loads(content)
-        return {
-            "correct": bool(data.get("correct", False)),
-            "feedback": str(data.get("feedback") or "").strip() or "No feedback.",
-            "improvements": str(data.get("improvements") or "").strip(),
-        }
+        return _flow_result(parse_llm_json("flow", content))
     except Exception:
         return stub_result
 
 
+async def stream_llm_validate_flow(
+    topic: str, flow_summary: str, diagram_labels: list[str] | None = None
+) -> AsyncIterator[tuple[str, Any]]:
+    """Streaming call_llm_validate_flow: yields ("correct" | "feedback" | "improvements", value) as each
+    field completes, then ("done", full result). Falls back to the stub result like the blocking call."""
+    if not (flow_summary or "").strip() or not llm_available():
+        yield "done", await call_llm_validate_flow(topic, flow_summary, diagram_labels)
+        return
+    result = dict(_FLOW_STUB)
+    try:
+        async for path, value in _stream_json_fields(
+            "flow", FLOW_VALIDATION_PROMPT, _flow_user_content(topic, flow_summary, diagram_labels)
+        ):
+            if path == ():
+                result = _flow_result(value)
+            elif path == ("correct",):
+                yield "correct", bool(value)
+            elif path in (("feedback",), ("improvements",)):
+                yield path[0], str(value or "").strip()
+    except Exception:
+        result = dict(_FLOW_STUB)
+    yield "done", result
+
+
 # --- Deep dives: suggested summary per topic ---
 
 DEEP_DIVES_PROMPT = """You are a system design expert. You are given:
@@ -373,7 +535,7 @@ async def call_llm_deep_dives(
     ]
     if not deep_dives:
         return {"items": [], "suggestedMissingTopics": []}
-    if not OPENAI_API_KEY:
+    if not llm_available():
         return {
             "items": [
                 {"topic": d.get("topic", ""), "suggestedSummary": "(No API key.)", "feedback": ""}
@@ -381,53 +543,201 @@ async def call_llm_deep_dives(
             ],
             "suggestedMissingTopics": [],
         }
-    client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+    user_content = _deep_dives_user_content(system_topic, deep_dives)
+    if user_content is None:
+        return {"items": [], "suggestedMissingTopics": []}
+    if DEEP_DIVES_FANOUT:
+        result: dict = {}
+        async for event, data in _deep_dives_fanout(system_topic, deep_dives):
+            if event == "done":
+                result = data
+        return result
+    try:
+        content = await _chat_json("deep_dives", DEEP_DIVES_PROMPT, user_content)
+        if not content:
+            return {"items": empty_items, "suggestedMissingTopics": []}
+        return _deep_dives_result(deep_dives, parse_llm_json("deep_dives", content))
+    except Exception:
+        return {"items": empty_items, "suggestedMissingTopics": []}
+
+
+def _deep_dives_user_content(system_topic: str, deep_dives: list[dict]) -> str | None:
+    """Prompt body listing each sub-topic with its user summary (compacted to the deep_dives token
+    budget); None if no named topics."""
     lines = []
     for d in deep_dives:
         topic_name = (d.get("topic") or "").strip()
-        user_sum = (d.get("userSummary") or "").strip()
+        user_sum = " ".join((d.get("userSummary") or "").split())
         if not topic_name:
             continue
-        line = f"- {topic_name}"
-        if user_sum:
-            line += f"\n  User's summary: {user_sum[:500]}"
-        lines.append(line)
+        lines.append(f"- {topic_name}" + (f" — User's summary: {user_sum}" if user_sum else ""))
     if not lines:
-        return {"items": [], "suggestedMissingTopics": []}
-    user_content = f"System design topic: {system_topic}\n\nDeep dive topics (with optional user summary):\n" + "\n".join(lines)
+        return None
+    prompt = PromptBuilder("deep_dives", header=f"System design topic: {system_topic}", query=system_topic)
+    prompt.section("Deep dive topics (with optional user summary)", lines, priority=1)
+    return prompt.build()
+
+
+def _deep_dive_item(item: Any) -> dict:
+    item = item if isinstance(item, dict) else {}
+    return {
+        "topic": str(item.get("topic", "")).strip(),
+        "suggestedSummary": str(item.get("suggestedSummary") or "").strip(),
+        "feedback": str(item.get("feedback") or "").strip(),
+    }
+
+
+def _suggested_missing_topics(raw_missing: Any) -> list[str]:
+    if not isinstance(raw_missing, list):
+        return []
+    return [str(x).strip() for x in raw_missing if str(x).strip()][:3]
+
+
+def _deep_dives_result(deep_dives: list[dict], data: dict) -> dict:
+    """Items in the user's topic order (matched by exact topic name) plus up to 3 missing topics."""
+    empty_items = [{"topic": d.get("topic", ""), "suggestedSummary": "", "feedback": ""} for d in deep_dives]
+    raw = data.get("items") or []
+    if not isinstance(raw, list):
+        return {"items": empty_items, "suggestedMissingTopics": []}
+    topic_map = {str(x.get("topic", "")).strip(): x for x in raw if isinstance(x, dict)}
+    result = []
+    for d in deep_dives:
+        t = (d.get("topic") or "").strip()
+        item = _deep_dive_item(topic_map.get(t))
+        result.append({**item, "topic": t})
+    raw_missing = data.get("suggestedMissingTopics") or data.get("suggested_missing_topics") or []
+    return {"items": result, "suggestedMissingTopics": _suggested_missing_topics(raw_missing)}
+
+
+async def stream_llm_deep_dives(system_topic: str, deep_dives: list[dict]) -> AsyncIterator[tuple[str, Any]]:
+    """Streaming call_llm_deep_dives: yields ("item", {topic, suggestedSummary, feedback}) per finished
+    item and ("suggestedMissingTopics", [...]), then ("done", full result)."""
+    user_content = _deep_dives_user_content(system_topic, deep_dives) if deep_dives else None
+    if user_content is None or not llm_available():
+        yield "done", await call_llm_deep_dives(system_topic, deep_dives)
+        return
+    if DEEP_DIVES_FANOUT:
+        async for event in _deep_dives_fanout(system_topic, deep_dives):
+            yield event
+        return
+    result = {
+        "items": [{"topic": d.get("topic", ""), "suggestedSummary": "", "feedback": ""} for d in deep_dives],
+        "suggestedMissingTopics": [],
+    }
     try:
-        response = await client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": DEEP_DIVES_PROMPT},
-                {"role": "user", "content": user_content},
-            ],
-            response_format={"type": "json_object"},
-        )
-        content = response.choices[0].message.content
+        async for path, value in _stream_json_fields("deep_dives", DEEP_DIVES_PROMPT, user_content):
+            if path == ():
+                result = _deep_dives_result(deep_dives, value)
+            elif len(path) == 2 and path[0] == "items":
+                item = _deep_dive_item(value)
+                if item["topic"]:
+                    yield "item", item
+            elif path in (("suggestedMissingTopics",), ("suggested_missing_topics",)):
+                yield "suggestedMissingTopics", _suggested_missing_topics(value)
+    except Exception:
+        pass
+    yield "done", result
+
+
+# --- Deep dives, fan-out mode: one call per sub-topic + one for missing topics, each cached ---
+
+DEEP_DIVE_ITEM_PROMPT = """You are a system design expert. You are given a system design topic and ONE "deep dive" sub-topic the user wants to elaborate on (e.g. "Caching strategy", "Database sharding"), optionally with the user's own summary.
+
+Your task: produce a concise "suggestedSummary" (2-5 sentences) that would be a strong interview answer for that aspect of the system. If the user provided their own summary, also give brief "feedback" on it (what's good, what to add or correct); otherwise use an empty string.
+
+Respond with valid JSON only, in this exact shape (no other text):
+{"suggestedSummary": "2-5 sentences", "feedback": "brief feedback if user wrote something, else empty string"}"""
+
+DEEP_DIVES_MISSING_PROMPT = """You are a system design expert. You are given a system design topic and the "deep dive" sub-topics the user already plans to cover.
+
+Suggest exactly 3 additional important deep dive topics that the user did NOT cover but are relevant and valuable for this system design. These should be topics an interviewer might ask about (e.g. "Fault tolerance and replication", "Consistency model", "Monitoring and observability"). Do not repeat or semantically overlap with the user's topics.
+
+Respond with valid JSON only, in this exact shape (no other text):
+{"suggestedMissingTopics": ["Missing topic 1", "Missing topic 2", "Missing topic 3"]}"""
+
+
+async def _fanout_deep_dive_item(system_topic: str, topic_name: str, user_summary: str, limit: asyncio.Semaphore) -> dict:
+    """Suggested summary + feedback for one sub-topic, cached per (system topic, sub-topic, user summary).
+    Failures only blank this item."""
+    empty = {"topic": topic_name, "suggestedSummary": "", "feedback": ""}
+    if not topic_name:
+        return empty
+    prompt = PromptBuilder(
+        "deep_dive_item",
+        header=f"System design topic: {system_topic}\n\nDeep dive sub-topic: {topic_name}",
+        query=f"{system_topic} {topic_name}",
+    )
+    if user_summary:
+        prompt.section("User's summary", user_summary, priority=1)
+    user_content = prompt.build()
+
+    async def generate() -> dict | None:
+        async with limit:
+            content = await _chat_json("deep_dive_item", DEEP_DIVE_ITEM_PROMPT, user_content)
         if not content:
-            return {"items": empty_items, "suggestedMissingTopics": []}
-        data = json.loads(content)
-        raw = data.get("items") or []
-        if not isinstance(raw, list):
-            return {"items": empty_items, "suggestedMissingTopics": []}
-        topic_map = {str(x.get("topic", "")).strip(): x for x in raw}
-        result = []
-        for d in deep_dives:
-            t = (d.get("topic") or "").strip()
-            item = topic_map.get(t) or {}
-            result.append({
-                "topic": t,
-                "suggestedSummary": str(item.get("suggestedSummary") or "").strip(),
-                "feedback": str(item.get("feedback") or "").strip(),
-            })
-        raw_missing = data.get("suggestedMissingTopics") or data.get("suggested_missing_topics") or []
-        if not isinstance(raw_missing, list):
-            raw_missing = []
-        suggested_missing = [str(x).strip() for x in raw_missing if str(x).strip()][:3]
-        return {"items": result, "suggestedMissingTopics": suggested_missing}
+            return None
+        data = parse_llm_json("deep_dive_item", content)
+        summary = str(data.get("suggestedSummary") or "").strip()
+        if not summary:
+            return None
+        return {"suggestedSummary": summary, "feedback": str(data.get("feedback") or "").strip()}
+
+    inputs = {"subTopic": " ".join(topic_name.lower().split()), "userSummary": user_summary}
+    try:
+        cached = await reference_cache.get_or_compute("deep_dive_item", system_topic, inputs, generate)
     except Exception:
-        return {"items": empty_items, "suggestedMissingTopics": []}
+        cached = None
+    return {**empty, **cached} if cached else empty
+
+
+async def _fanout_deep_dives_missing(system_topic: str, topic_names: list[str], limit: asyncio.Semaphore) -> list[str]:
+    """3 suggested missing deep dives, cached per (system topic, set of user sub-topics)."""
+    user_content = f"System design topic: {system_topic}\n\nUser's deep dive topics:\n" + "\n".join(
+        f"- {t}" for t in topic_names
+    )
+
+    async def generate() -> list[str] | None:
+        async with limit:
+            content = await _chat_json("deep_dives_missing", DEEP_DIVES_MISSING_PROMPT, user_content)
+        if not content:
+            return None
+        data = parse_llm_json("deep_dives_missing", content)
+        missing = _suggested_missing_topics(data.get("suggestedMissingTopics") or data.get("suggested_missing_topics"))
+        return missing or None
+
+    inputs = sorted({" ".join(t.lower().split()) for t in topic_names})
+    try:
+        return await reference_cache.get_or_compute("deep_dives_missing", system_topic, inputs, generate) or []
+    except Exception:
+        return []
+
+
+async def _deep_dives_fanout(system_topic: str, deep_dives: list[dict]) -> AsyncIterator[tuple[str, Any]]:
+    """
+    Run one call per sub-topic plus the missing-topics call concurrently (at most DEEP_DIVES_CONCURRENCY
+    at a time). Yields ("item", ...) / ("suggestedMissingTopics", [...]) in completion order, then
+    ("done", result) with items in the user's order, same shape as call_llm_deep_dives.
+    """
+    limit = asyncio.Semaphore(max(1, DEEP_DIVES_CONCURRENCY))
+    named = [
+        ((d.get("topic") or "").strip(), (d.get("userSummary") or "").strip()) for d in deep_dives
+    ]
+    item_tasks = [asyncio.ensure_future(_fanout_deep_dive_item(system_topic, t, u, limit)) for t, u in named]
+    missing_task = asyncio.ensure_future(_fanout_deep_dives_missing(system_topic, [t for t, _ in named if t], limit))
+    try:
+        for finished in asyncio.as_completed([*item_tasks, missing_task]):
+            value = await finished
+            if isinstance(value, list):
+                yield "suggestedMissingTopics", value
+            elif value["topic"]:
+                yield "item", value
+    finally:
+        for task in (*item_tasks, missing_task):
+            task.cancel()
+    yield "done", {
+        "items": [task.result() for task in item_tasks],
+        "suggestedMissingTopics": missing_task.result(),
+    }
 
 
 # --- Detailed design diagram: validate against all discussed points, return feedback + suggested diagram ---
@@ -458,6 +768,27 @@ Respond with valid JSON only, in this exact shape (no other text):
 - Use the key "suggested_diagram" for the raw Mermaid source. Escape newlines as \\n in the JSON value."""
 
 
+_DETAILED_DIAGRAM_STUB = {
+    "feedback": "Validation skipped (no API key or missing context).",
+    "improvements": "",
+    "suggested_diagram": (
+        "flowchart TB\n"
+        "  subgraph client[Client tier]\n"
+        "    C[Client]\n"
+        "  end\n"
+        "  subgraph app[Application]\n"
+        "    LB[Load Balancer] --> API[API Server]\n"
+        "    API --> CACHE[Cache]\n"
+        "  end\n"
+        "  subgraph data[Data]\n"
+        "    DB[(Database)]\n"
+        "  end\n"
+        "  C --> LB\n"
+        "  API --> DB"
+    ),
+}
+
+
 async def call_llm_validate_detailed_diagram(
     topic: str,
     requirements_summary: str,
@@ -469,29 +800,40 @@ async def call_llm_validate_detailed_diagram(
     diagram_labels: list[str],
 ) -> dict:
     """Validate user's detailed diagram against all discussed points; return feedback, improvements, and a suggested Mermaid diagram."""
-    stub = {
-        "feedback": "Validation skipped (no API key or missing context).",
-        "improvements": "",
-        "suggested_diagram": (
-            "flowchart TB\n"
-            "  subgraph client[Client tier]\n"
-            "    C[Client]\n"
-            "  end\n"
-            "  subgraph app[Application]\n"
-            "    LB[Load Balancer] --> API[API Server]\n"
-            "    API --> CACHE[Cache]\n"
-            "  end\n"
-            "  subgraph data[Data]\n"
-            "    DB[(Database)]\n"
-            "  end\n"
-            "  C --> LB\n"
-            "  API --> DB"
-        ),
-    }
-    if not OPENAI_API_KEY:
+    stub = dict(_DETAILED_DIAGRAM_STUB)
+    if not llm_available():
+        return stub
+    user_content = _detailed_diagram_user_content(
+        topic,
+        requirements_summary,
+        api_design_summary,
+        data_model_summary,
+        high_level_labels,
+        end_to_end_flow,
+        deep_dives,
+        diagram_labels,
+    )
+    try:
+        content = await _chat_json("detailed_diagram", DETAILED_DIAGRAM_VALIDATION_PROMPT, user_content)
+        if not content:
+            return stub
+        return _detailed_diagram_result(parse_llm_json("detailed_diagram", content))
+    except Exception:
         return stub
-    client = AsyncOpenAI(api_key=OPENAI_API_KEY)
-    flow_text = (end_to_end_flow or "").strip()
+
+
+def _detailed_diagram_user_content(
+    topic: str,
+    requirements_summary: str,
+    api_design_summary: str,
+    data_model_summary: str,
+    high_level_labels: list[str],
+    end_to_end_flow: str,
+    deep_dives: list[dict],
+    diagram_labels: list[str],
+) -> str:
+    """Prompt body with everything discussed so far, within the detailed_diagram token budget.
+    The user's detailed-diagram labels are never shrunk; deep dives, schema and APIs are compacted first."""
     deep_lines = []
     for d in deep_dives or []:
         t = (d.get("topic") or "").strip()
@@ -499,67 +841,68 @@ async def call_llm_validate_detailed_diagram(
             continue
         user_s = (d.get("userSummary") or "").strip()
         sugg_s = (d.get("suggestedSummary") or "").strip()
-        summary = sugg_s if sugg_s else user_s
-        deep_lines.append(f"- {t}: {summary[:400]}" if summary else f"- {t}")
-    deep_block = "\n".join(deep_lines) if deep_lines else "(No deep dives provided.)"
-    high_level_text = ", ".join(high_level_labels) if high_level_labels else "(None provided.)"
-    labels_text = ", ".join(diagram_labels) if diagram_labels else "(No diagram labels extracted.)"
-    user_content = f"""System design topic: {topic}
-
-Requirements (functional and non-functional):
-{requirements_summary or "(None provided.)"}
-
-API design:
-{api_design_summary or "(None provided.)"}
+        summary = " ".join((sugg_s or user_s).split())
+        deep_lines.append(f"- {t}: {summary}" if summary else f"- {t}")
+    prompt = PromptBuilder(
+        "detailed_diagram",
+        header=f"System design topic: {topic}",
+        footer=(
+            'Produce JSON with "feedback", "improvements", and "suggested_diagram" (Mermaid flowchart source) '
+            "as described in the system prompt."
+        ),
+        query=topic,
+    )
+    prompt.section("Requirements (functional and non-functional)", requirements_summary, priority=1)
+    prompt.section("API design", api_design_summary, priority=3)
+    prompt.section("Database schema / data model", data_model_summary, priority=3)
+    prompt.section("High-level diagram component labels", ", ".join(high_level_labels), priority=2)
+    flow_text = " ".join((end_to_end_flow or "").split())
+    prompt.section("End-to-end flow (user's summary)", flow_text, priority=2, empty="(No flow provided.)")
+    prompt.section("Deep dives (topic and summary)", deep_lines, priority=4, empty="(No deep dives provided.)")
+    prompt.section(
+        "Labels from the user's DETAILED diagram (components they drew)",
+        ", ".join(diagram_labels),
+        priority=0,
+        empty="(No diagram labels extracted.)",
+    )
+    return prompt.build()
 
-Database schema / data model:
-{data_model_summary or "(None provided.)"}
 
-High-level diagram component labels:
-{high_level_text}
+def _detailed_diagram_mermaid(raw: Any, *, count: bool = True) -> str:
+    """The model's Mermaid source, validated and repaired (see app.mermaid_repair); the stub diagram
+    when it is empty. count=False for a field that is counted again in the final result."""
+    suggested = clean_mermaid("detailed_diagram" if count else None, str(raw or ""))
+    return suggested or _DETAILED_DIAGRAM_STUB["suggested_diagram"]
 
-End-to-end flow (user's summary):
-{flow_text or "(No flow provided.)"}
 
-Deep dives (topic and summary):
-{deep_block}
+def _detailed_diagram_result(data: dict) -> dict:
+    return {
+        "feedback": str(data.get("feedback") or "").strip() or _DETAILED_DIAGRAM_STUB["feedback"],
+        "improvements": str(data.get("improvements") or "").strip(),
+        "suggested_diagram": _detailed_diagram_mermaid(_diagram_source(data)),
+    }
 
-Labels from the user's DETAILED diagram (components they drew):
-{labels_text}
 
-Produce JSON with "feedback", "improvements", and "suggested_diagram" (Mermaid flowchart source) as described in the system prompt."""
+async def stream_llm_validate_detailed_diagram(**kwargs: Any) -> AsyncIterator[tuple[str, Any]]:
+    """Streaming call_llm_validate_detailed_diagram (same keyword arguments): yields ("feedback" |
+    "improvements", text) and ("suggestedDiagram", mermaid) as each field completes, then ("done", full result)."""
+    if not llm_available():
+        yield "done", await call_llm_validate_detailed_diagram(**kwargs)
+        return
+    result = dict(_DETAILED_DIAGRAM_STUB)
     try:
-        response = await client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": DETAILED_DIAGRAM_VALIDATION_PROMPT},
-                {"role": "user", "content": user_content},
-            ],
-            response_format={"type": "json_object"},
-        )
-        content = response.choices[0].message.content
-        if not content:
-            return stub
-        data = json.loads(content)
-        feedback = str(data.get("feedback") or "").strip() or stub["feedback"]
-        improvements = str(data.get("improvements") or "").strip()
-        suggested = (
-            (data.get("suggested_diagram") or data.get("suggestedDiagram") or "").strip()
-            .replace("\\n", "\n")
-        )
-        suggested = _strip_mermaid_fences(suggested)
-        if not suggested:
-            suggested = stub["suggested_diagram"]
-        s0 = suggested.lstrip().lower()
-        if not (s0.startswith("flowchart") or s0.startswith("graph")):
-            suggested = "flowchart TB\n  " + suggested
-        return {
-            "feedback": feedback,
-            "improvements": improvements,
-            "suggested_diagram": suggested,
-        }
+        async for path, value in _stream_json_fields(
+            "detailed_diagram", DETAILED_DIAGRAM_VALIDATION_PROMPT, _detailed_diagram_user_content(**kwargs)
+        ):
+            if path == ():
+                result = _detailed_diagram_result(value)
+            elif path in (("feedback",), ("improvements",)):
+                yield path[0], str(value or "").strip()
+            elif len(path) == 1 and path[0] in _DIAGRAM_KEYS:
+                yield "suggestedDiagram", _detailed_diagram_mermaid(value, count=False)
     except Exception:
-        return stub
+        pass
+    yield "done", result
 
 
 # --- Back-of-the-envelope estimation: key estimation items from two LLMs ---
@@ -589,34 +932,37 @@ def _stub_estimation_2(_topic: str) -> list[str]:
 
 
 async def call_llm_estimation_1(topic: str) -> list[str]:
-    """Return key estimation items (OpenAI). Falls back to stub if no key or error."""
-    if not OPENAI_API_KEY:
-        return _stub_estimation_1(topic)
-    client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+    """Return key estimation items (llm_router, via the reference cache). Falls back to stub if no provider or error."""
+    if not llm_available():
+        return reference_cache.bundled("estimation", topic) or _stub_estimation_1(topic)
+    result = await reference_cache.get_or_compute("estimation", topic, None, lambda: _generate_estimation_1(topic))
+    return result if result is not None else _stub_estimation_1(topic)
+
+
+async def _generate_estimation_1(topic: str, secondary: bool = False) -> list[str] | None:
     try:
-        response = await client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": ESTIMATION_LLM_SYSTEM_PROMPT},
-                {"role": "user", "content": f"System design topic: {topic}"},
-            ],
-            response_format={"type": "json_object"},
+        content = await _chat_json(
+            "estimation", ESTIMATION_LLM_SYSTEM_PROMPT, f"System design topic: {topic}", secondary=secondary
         )
-        content = response.choices[0].message.content
         if not content:
-            return _stub_estimation_1(topic)
-        data = json.loads(content)
+            return None
+        data = parse_llm_json("estimation", content)
         elements = data.get("elements") or []
         if not isinstance(elements, list):
             elements = []
         return [str(x).strip() for x in elements][:7]
     except Exception:
-        return _stub_estimation_1(topic)
+        return None
 
 
 async def call_llm_estimation_2(topic: str) -> list[str]:
-    """Return key estimation items (stub; replace with second LLM)."""
-    return _stub_estimation_2(topic)
+    """Return key estimation items from the secondary provider (cached); stub with a single provider."""
+    if not llm_available(secondary=True):
+        return reference_cache.bundled("estimation_2", topic) or _stub_estimation_2(topic)
+    result = await reference_cache.get_or_compute(
+        "estimation_2", topic, None, lambda: _generate_estimation_1(topic, secondary=True)
+    )
+    return result if result is not None else _stub_estimation_2(topic)
 
 
 # --- Back-of-the-envelope: strict reference estimates + comparison ---
@@ -733,9 +1079,10 @@ def _stub_estimation_evaluation(
     topic: str, user_estimations: list[str]
 ) -> EstimationEvaluationResult:
     placeholder = (
-        "Set OPENAI_API_KEY for topic-specific reference estimates with full derivations."
+        "Configure an LLM provider for topic-specific reference estimates with full derivations."
     )
-    expected: list[dict[str, str]] = [
+    bundled = reference_cache.bundled("estimation_expected", topic)
+    expected: list[dict[str, str]] = bundled or [
         {
             "item": "User scale (DAU / MAU)",
             "expected_value": placeholder,
@@ -770,7 +1117,7 @@ def _stub_estimation_evaluation(
             "feedback": "Stub mode: enable API key for independent reference values and strict comparison.",
         })
     overall = (
-        "Stub evaluation: configure OpenAI for step-by-step reference estimates, "
+        "Stub evaluation: configure an LLM provider for step-by-step reference estimates, "
         "per-category status (correct/close/incorrect/missing), and missing-items detection."
     )
     missing_default = ["MAU", "Peak QPS", "Storage", "Bandwidth"]
@@ -787,27 +1134,15 @@ async def call_llm_estimation_evaluation(
     topic: str, user_estimations: list[str]
 ) -> EstimationEvaluationResult:
     """Derive reference estimates, compare to user lines, return structured evaluation."""
-    if not OPENAI_API_KEY:
+    if not llm_available():
         return _stub_estimation_evaluation(topic, user_estimations)
-    client = AsyncOpenAI(api_key=OPENAI_API_KEY)
     lines = "\n".join(user_estimations) if user_estimations else "(none — user submitted no lines)"
     user_block = f"User's estimation lines (one per line):\n{lines}"
     try:
-        response = await client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": ESTIMATION_EVALUATION_PROMPT},
-                {
-                    "role": "user",
-                    "content": f"System design topic: {topic}\n\n{user_block}",
-                },
-            ],
-            response_format={"type": "json_object"},
-        )
-        content = response.choices[0].message.content
+        content = await _chat_json("estimation_evaluation", ESTIMATION_EVALUATION_PROMPT, f"System design topic: {topic}\n\n{user_block}")
         if not content:
             return _stub_estimation_evaluation(topic, user_estimations)
-        data = json.loads(content)
+        data = parse_llm_json("estimation_evaluation", content)
         if not isinstance(data, dict):
             return _stub_estimation_evaluation(topic, user_estimations)
         out = _coerce_estimation_evaluation(data)
@@ -823,6 +1158,22 @@ async def call_llm_estimation_evaluation(
         return _stub_estimation_evaluation(topic, user_estimations)
 
 
+async def _generate_expected_estimations(topic: str) -> list[dict[str, str]] | None:
+    """Reference estimates for a topic on their own (no user lines), for the precomputed bundle."""
+    try:
+        content = await _chat_json(
+            "estimation_evaluation",
+            ESTIMATION_EVALUATION_PROMPT,
+            f"System design topic: {topic}\n\nUser's estimation lines (one per line):\n(none — user submitted no lines)",
+        )
+        if not content:
+            return None
+        expected = _coerce_estimation_evaluation(parse_llm_json("estimation_evaluation", content))["expected_estimations"]
+        return expected or None
+    except Exception:
+        return None
+
+
 # --- Data model: key tables + fields from two LLMs + feedback ---
 
 DATA_MODEL_LLM_SYSTEM_PROMPT = """You are a system design expert. List 5-7 key database schema elements (tables and indexes) that the user should have. If the user's API design is provided, derive required tables from those APIs (e.g. GET /users → Users table, POST /messages → Messages table, GET /chats → Chats or conversation table). Format each item exactly as follows:
@@ -853,38 +1204,44 @@ def _stub_data_model_2(_topic: str) -> list[str]:
 
 
 async def call_llm_data_model_1(topic: str, api_design: list[str] | None = None) -> list[str]:
-    """Return key data model elements (OpenAI). If api_design provided, suggest tables that support those APIs."""
-    if not OPENAI_API_KEY:
-        return _stub_data_model_1(topic)
-    client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+    """Return key data model elements (llm_router). If api_design provided, suggest tables that support those APIs.
+    Cached per (topic, api_design)."""
+    if not llm_available():
+        return reference_cache.bundled("data_model", topic, api_design or None) or _stub_data_model_1(topic)
+    result = await reference_cache.get_or_compute(
+        "data_model", topic, api_design or None, lambda: _generate_data_model_1(topic, api_design)
+    )
+    return result if result is not None else _stub_data_model_1(topic)
+
+
+async def _generate_data_model_1(
+    topic: str, api_design: list[str] | None, secondary: bool = False
+) -> list[str] | None:
     user_content = f"System design topic: {topic}"
     if api_design:
         apis_str = "\n".join(f"- {a}" for a in api_design)
         user_content += f"\n\nAPI design (from interview summary) — suggest tables that support these APIs:\n{apis_str}"
     try:
-        response = await client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": DATA_MODEL_LLM_SYSTEM_PROMPT},
-                {"role": "user", "content": user_content},
-            ],
-            response_format={"type": "json_object"},
-        )
-        content = response.choices[0].message.content
+        content = await _chat_json("data_model", DATA_MODEL_LLM_SYSTEM_PROMPT, user_content, secondary=secondary)
         if not content:
-            return _stub_data_model_1(topic)
-        data = json.loads(content)
+            return None
+        data = parse_llm_json("data_model", content)
         elements = data.get("elements") or []
         if not isinstance(elements, list):
             elements = []
         return [str(x).strip() for x in elements][:7]
     except Exception:
-        return _stub_data_model_1(topic)
+        return None
 
 
 async def call_llm_data_model_2(topic: str, api_design: list[str] | None = None) -> list[str]:
-    """Return key data model elements (stub; replace with second LLM)."""
-    return _stub_data_model_2(topic)
+    """Return key data model elements from the secondary provider (cached per api_design); stub with a single provider."""
+    if not llm_available(secondary=True):
+        return reference_cache.bundled("data_model_2", topic, api_design or None) or _stub_data_model_2(topic)
+    result = await reference_cache.get_or_compute(
+        "data_model_2", topic, api_design or None, lambda: _generate_data_model_1(topic, api_design, secondary=True)
+    )
+    return result if result is not None else _stub_data_model_2(topic)
 
 
 class DataModelFeedbackItem(TypedDict):
@@ -909,7 +1266,7 @@ Return valid JSON only. Use the EXACT user line text in "userLine":
 
 def _stub_data_model_feedback(user_lines: list[str]) -> list[DataModelFeedbackItem]:
     return [
-        {"userLine": line, "reasonable": True, "comment": "Stub: enable OpenAI API key for data model review."}
+        {"userLine": line, "reasonable": True, "comment": "Stub: configure an LLM provider for data model review."}
         for line in user_lines
     ]
 
@@ -930,27 +1287,18 @@ async def call_llm_data_model_feedback(
     if not user_lines:
         return empty_result
     stub_feedback = _stub_data_model_feedback(user_lines)
-    if not OPENAI_API_KEY:
+    if not llm_available():
         return {"feedback": stub_feedback, "suggested_missing_tables": []}
-    client = AsyncOpenAI(api_key=OPENAI_API_KEY)
     user_str = "\n".join(user_lines)
     user_content = f"System design topic: {topic}\n\nUser's data model (one per line):\n{user_str}"
     if api_design:
         apis_str = "\n".join(f"- {a}" for a in api_design)
         user_content += f"\n\nAPI design (validate schema against these):\n{apis_str}"
     try:
-        response = await client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": DATA_MODEL_FEEDBACK_PROMPT},
-                {"role": "user", "content": user_content},
-            ],
-            response_format={"type": "json_object"},
-        )
-        content = response.choices[0].message.content
+        content = await _chat_json("data_model_feedback", DATA_MODEL_FEEDBACK_PROMPT, user_content)
         if not content:
             return {"feedback": stub_feedback, "suggested_missing_tables": []}
-        data = json.loads(content)
+        data = parse_llm_json("data_model_feedback", content)
         raw = data.get("feedback") or []
         if not isinstance(raw, list):
             return {"feedback": stub_feedback, "suggested_missing_tables": []}
@@ -1083,6 +1431,198 @@ Use EXACT reference strings only. Return valid JSON only:
 Every reference item must appear in either "matched" or "missed". No other text."""
 
 
+COVERAGE_EVIDENCE_INSTRUCTION = """Also include "evidence": an object mapping each reference item you put in "matched" (exact reference text) to the one user answer (exact user text) that covers it. Example: {"matched": ["Ref A"], "missed": ["Ref B"], "evidence": {"Ref A": "user answer"}}"""
+
+
+def _coverage_evidence(data: dict, raw_matched: list) -> dict[str, str]:
+    """Map matched reference -> covering user answer, from API-style objects or an "evidence" object."""
+    evidence: dict[str, str] = {}
+    for item in raw_matched:
+        if isinstance(item, dict) and item.get("expected") and item.get("user"):
+            evidence[str(item["expected"]).strip()] = str(item["user"]).strip()
+    raw_evidence = data.get("evidence")
+    if isinstance(raw_evidence, dict):
+        for ref, answer in raw_evidence.items():
+            if isinstance(answer, str):
+                evidence[str(ref).strip()] = answer.strip()
+    return evidence
+
+
+def _coverage_in_reference_order(reference: list[str], matched: set[str]) -> CoverageResult:
+    return {
+        "matched": [r for r in reference if r in matched],
+        "missed": [r for r in reference if r not in matched],
+    }
+
+
+COVERAGE_CONFIDENCE_INSTRUCTION = """Also include "confidence": an object mapping EVERY reference item (exact text) to how sure you are of its verdict, from 0.0 (guess) to 1.0 (certain). Example: {"matched": ["Ref A"], "missed": ["Ref B"], "evidence": {"Ref A": "user answer"}, "confidence": {"Ref A": 0.95, "Ref B": 0.4}}"""
+
+COVERAGE_TIERS = ("memo", "deterministic", "fast", "strong")
+
+
+def _count_tier(tier: str, items: int) -> None:
+    if items:
+        metrics.incr(f"coverage.tier.{tier}", items)
+
+
+def coverage_tier_shares() -> dict[str, float]:
+    """Share of coverage items resolved at each cascade tier so far (for /metrics)."""
+    counters = metrics.snapshot()["counters"]
+    counts = {tier: counters.get(f"coverage.tier.{tier}", 0) for tier in COVERAGE_TIERS}
+    total = sum(counts.values())
+    return {tier: round(n / total, 3) if total else 0.0 for tier, n in counts.items()}
+
+
+def _coverage_matched_refs(raw_matched: list, items: list[str]) -> list[str]:
+    """Reference items (exact text, restricted to items) from "matched" strings or {"expected": ...} objects."""
+    refs = [str(x.get("expected", "") if isinstance(x, dict) else x).strip() for x in raw_matched]
+    return [r for r in refs if r in items]
+
+
+def _coverage_confidence(data: dict, items: list[str]) -> dict[str, float]:
+    """Per-item confidence reported by the model, clamped to [0, 1]; missing items count as 0."""
+    raw = data.get("confidence")
+    reported: dict[str, float] = {}
+    if isinstance(raw, dict):
+        for ref, value in raw.items():
+            try:
+                reported[str(ref).strip()] = min(1.0, max(0.0, float(value)))
+            except (TypeError, ValueError):
+                continue
+    return {r: reported.get(r, 0.0) for r in items}
+
+
+COVERAGE_BATCH_INSTRUCTION = """You will receive several INDEPENDENT jobs, each introduced by a line "### Job <id>" and followed by its own reference list and user list. Judge every job on its own, using only that job's lists, exactly as the rules above describe. Return one JSON object: {"results": {"<id>": <the JSON object the rules above ask for, for that job>, ...}} with an entry for every job id. No other text."""
+
+
+async def _run_coverage_batch(key: tuple[str, str], jobs: list[str]) -> list[str | None | BaseException]:
+    """One call for several coverage prompts of the same kind and system prompt (job IDs j1..jN).
+    A job whose sub-result is missing or malformed is retried on its own; only a failed batch call
+    fails every job."""
+    kind, system_prompt = key
+    if len(jobs) == 1:
+        return [await _chat_json(kind, system_prompt, jobs[0])]
+    ids = [f"j{i}" for i in range(1, len(jobs) + 1)]
+    user_content = "\n\n".join(f"### Job {job_id}\n{job}" for job_id, job in zip(ids, jobs))
+    content = await _chat_json(f"{kind}_batch", system_prompt + "\n\n" + COVERAGE_BATCH_INSTRUCTION, user_content)
+    try:
+        results = parse_llm_json(f"{kind}_batch", content).get("results")
+    except UnparseableJSON:
+        results = None
+    if not isinstance(results, dict):
+        results = {}
+    out: list[str | None | BaseException] = []
+    retry: list[int] = []
+    for i, job_id in enumerate(ids):
+        sub = results.get(job_id)
+        if isinstance(sub, dict) and isinstance(sub.get("matched"), list):
+            out.append(json.dumps(sub))
+        else:
+            out.append(None)
+            retry.append(i)
+    metrics.incr("coverage_batch.jobs", len(jobs))
+    if retry:
+        metrics.incr("coverage_batch.job_fallbacks", len(retry))
+        solo = await asyncio.gather(
+            *(_chat_json(kind, system_prompt, jobs[i]) for i in retry), return_exceptions=True
+        )
+        for i, result in zip(retry, solo):
+            out[i] = result
+    return out
+
+
+coverage_batcher: MicroBatcher[str, str | None] = MicroBatcher(
+    "coverage_batch",
+    _run_coverage_batch,
+    max_jobs=COVERAGE_BATCH_MAX_JOBS,
+    window_seconds=COVERAGE_BATCH_WINDOW_MS / 1000.0,
+)
+
+
+async def _batched_coverage_json(kind: str, system_prompt: str, user_content: str) -> str | None:
+    """Like _chat_json, but shares the call with concurrent coverage jobs of the same kind."""
+    try:
+        return await run_within_budget(coverage_batcher.submit((kind, system_prompt), user_content))
+    except CircuitOpenError:
+        mark_degraded()
+        raise
+
+
+async def _coverage_call(
+    kind: str, system_prompt: str, user_content: str, items: list[str], *, strong: bool = False
+) -> tuple[list[str], dict[str, str], dict] | None:
+    """One coverage completion: (matched items, evidence, raw JSON), or None when there is no usable answer.
+    Fast-tier calls go through the micro-batcher when COVERAGE_BATCHING is on."""
+    if COVERAGE_BATCHING and not strong:
+        content = await _batched_coverage_json(kind, system_prompt, user_content)
+    else:
+        content = await _chat_json(kind, system_prompt, user_content, strong=strong)
+    if not content:
+        return None
+    data = parse_llm_json(kind, content)
+    raw_matched = data.get("matched") or []
+    if not isinstance(raw_matched, list):
+        raw_matched = []
+    return _coverage_matched_refs(raw_matched, items), _coverage_evidence(data, raw_matched), data
+
+
+async def _classify_with_cascade(
+    kind: str,
+    system_prompt: str,
+    user_content_for: Callable[[list[str]], str],
+    items: list[str],
+) -> tuple[list[str], dict[str, str]] | None:
+    """Classify items that the memo and local matching could not settle.
+    The fast model judges every item; with COVERAGE_CASCADE on it also reports per-item confidence,
+    and only items below COVERAGE_ESCALATE_BELOW are re-judged by the strong model (whose verdicts
+    win). Returns (matched items, evidence), or None when the fast call gave no usable answer."""
+    fast_prompt = system_prompt + ("\n\n" + COVERAGE_CONFIDENCE_INSTRUCTION if COVERAGE_CASCADE else "")
+    fast = await _coverage_call(kind, fast_prompt, user_content_for(items), items)
+    if fast is None:
+        return None
+    matched, evidence, data = fast
+    if kind in ("coverage_diagram", "coverage_schema", "coverage_requirements"):
+        print(f"[{kind.removeprefix('coverage_')}] LLM raw matched:", data.get("matched"), "| LLM raw missed:", data.get("missed"))
+    if not COVERAGE_CASCADE:
+        _count_tier("fast", len(items))
+        return matched, evidence
+    confidence = _coverage_confidence(data, items)
+    unsure = [r for r in items if confidence[r] < COVERAGE_ESCALATE_BELOW]
+    _count_tier("fast", len(items) - len(unsure))
+    if not unsure:
+        return matched, evidence
+    try:
+        strong = await _coverage_call(kind, system_prompt, user_content_for(unsure), unsure, strong=True)
+    except Exception:
+        strong = None
+    if strong is None:
+        _count_tier("fast", len(unsure))  # escalation failed: keep the fast verdicts
+        return matched, evidence
+    strong_matched, strong_evidence, _ = strong
+    _count_tier("strong", len(unsure))
+    changed = sum((r in matched) != (r in strong_matched) for r in unsure)
+    metrics.incr("coverage.cascade.escalated", len(unsure))
+    metrics.incr("coverage.cascade.changed", changed)
+    matched = [r for r in matched if r not in unsure] + strong_matched
+    evidence = {r: e for r, e in evidence.items() if r not in unsure} | strong_evidence
+    return matched, evidence
+
+
+def coverage_kind(
+    *, for_apis: bool = False, for_diagram: bool = False, for_schema: bool = False, for_requirements: bool = False
+) -> str:
+    """Prompt kind (and coverage_memo kind) of a coverage classification."""
+    if for_apis:
+        return "coverage_apis"
+    if for_schema:
+        return "coverage_schema"
+    if for_diagram:
+        return "coverage_diagram"
+    if for_requirements:
+        return "coverage_requirements"
+    return "coverage"
+
+
 async def classify_requirements_coverage(
     reference: list[str],
     user_answers: list[str],
@@ -1092,6 +1632,7 @@ async def classify_requirements_coverage(
     for_requirements: bool = False,
     for_apis: bool = False,
     api_design: list[str] | None = None,
+    known: dict[str, bool] | None = None,
 ) -> CoverageResult:
     """
     Uses the LLM to decide which reference requirements are semantically covered
@@ -1099,131 +1640,329 @@ async def classify_requirements_coverage(
     each as subsets of the reference list (exact strings).
     When for_apis=True, a deterministic normalization layer runs first; only
     borderline/unmatched reference items are sent to the LLM.
+    Reference items whose verdict is already known for the current answers (coverage_memo)
+    are resolved locally; only unresolved items are sent to the LLM, and its verdicts are memoized.
+    On the other paths a local similarity pre-pass (app.similarity) also settles clear matches and
+    clear non-matches, so only the borderline band reaches the LLM.
+    known: verdicts already decided (e.g. by a fused call); only the remaining items are classified.
+    The LLM step itself is a cascade (fast model, then the strong model for low-confidence items);
+    the share of items settled per tier (memo / deterministic / fast / strong) is counted in metrics.
     """
     if not reference:
         return {"matched": [], "missed": []}
 
+    if known:
+        settled = {r: v for r, v in known.items() if r in reference}
+        pending = [r for r in reference if r not in settled]
+        rest = await classify_requirements_coverage(
+            pending,
+            user_answers,
+            for_diagram=for_diagram,
+            for_schema=for_schema,
+            for_requirements=for_requirements,
+            for_apis=for_apis,
+            api_design=api_design,
+        )
+        matched = {r for r, v in settled.items() if v} | set(rest["matched"])
+        return _coverage_in_reference_order(reference, matched)
+
     # API path: run deterministic normalization first; only send unmatched to LLM
     if for_apis:
         auto_pairs, unmatched_ref, _ = compute_api_auto_matches(reference, user_answers)
         auto_matched_refs = [p[0] for p in auto_pairs]
+        _count_tier("deterministic", len(reference) - len(unmatched_ref))
         if not unmatched_ref:
             return {"matched": list(reference), "missed": []}
-        if not OPENAI_API_KEY:
-            return {"matched": auto_matched_refs, "missed": unmatched_ref}
-        # LLM only for unmatched reference items; user list is full so LLM can still match
-        ref_str = "\n".join(f"- {r}" for r in unmatched_ref)
+        known_matched, _known_missed, unresolved = coverage_memo.resolve(
+            coverage_kind(for_apis=True), unmatched_ref, user_answers
+        )
+        _count_tier("memo", len(unmatched_ref) - len(unresolved))
+        resolved_matched = set(auto_matched_refs) | set(known_matched)
+        if not unresolved:
+            return _coverage_in_reference_order(reference, resolved_matched)
+        if not llm_available():
+            return _coverage_in_reference_order(reference, resolved_matched)
+        # LLM only for unresolved reference items; user list is full so LLM can still match
         user_str = "\n".join(f"- {a}" for a in user_answers) if user_answers else "(none)"
-        client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+
+        def api_user_content(items: list[str]) -> str:
+            ref_str = "\n".join(f"- {r}" for r in items)
+            return f"Reference list (expected APIs — use these EXACT strings in matched/missed):\n{ref_str}\n\nUser's APIs:\n{user_str}"
+
         try:
-            response = await client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": COVERAGE_APIS_PROMPT},
-                    {"role": "user", "content": f"Reference list (expected APIs — use these EXACT strings in matched/missed):\n{ref_str}\n\nUser's APIs:\n{user_str}"},
-                ],
-                response_format={"type": "json_object"},
+            classified = await _classify_with_cascade(
+                coverage_kind(for_apis=True), COVERAGE_APIS_PROMPT, api_user_content, unresolved
             )
-            content = response.choices[0].message.content
-            if not content:
-                return {"matched": auto_matched_refs, "missed": unmatched_ref}
-            data = json.loads(content)
-            raw_matched = data.get("matched") or []
-            raw_missed = data.get("missed") or []
-            if not isinstance(raw_matched, list):
-                raw_matched = []
-            if not isinstance(raw_missed, list):
-                raw_missed = []
-            llm_matched_refs = []
-            if raw_matched and isinstance(raw_matched[0], dict):
-                for item in raw_matched:
-                    expected_val = str(item.get("expected", "")).strip()
-                    if expected_val in unmatched_ref:
-                        llm_matched_refs.append(expected_val)
-            else:
-                llm_matched_refs = [str(x).strip() for x in raw_matched if str(x).strip() in unmatched_ref]
-            matched = list(dict.fromkeys(auto_matched_refs + llm_matched_refs))
-            missed = [r for r in reference if r not in matched]
-            return {"matched": matched, "missed": missed}
+            if classified is None:
+                return _coverage_in_reference_order(reference, resolved_matched)
+            llm_matched_refs, evidence = classified
+            coverage_memo.record(
+                coverage_kind(for_apis=True),
+                user_answers,
+                matched=llm_matched_refs,
+                missed=[r for r in unresolved if r not in llm_matched_refs],
+                evidence=evidence,
+            )
+            return _coverage_in_reference_order(reference, resolved_matched | set(llm_matched_refs))
         except Exception:
-            return {"matched": auto_matched_refs, "missed": unmatched_ref}
+            return _coverage_in_reference_order(reference, resolved_matched)
+
+    kind = coverage_kind(for_diagram=for_diagram, for_schema=for_schema, for_requirements=for_requirements)
+    known_matched, _known_missed, unresolved = coverage_memo.resolve(kind, reference, user_answers)
+    _count_tier("memo", len(reference) - len(unresolved))
+    local = settle_coverage(unresolved, user_answers)
+    known_matched += local["matched"]
+    _count_tier("deterministic", len(unresolved) - len(local["borderline"]))
+    unresolved = local["borderline"]
+    if not unresolved:
+        return _coverage_in_reference_order(reference, set(known_matched))
+    if not llm_available():
+        return _coverage_in_reference_order(reference, set(known_matched))
 
-    if not OPENAI_API_KEY:
-        return {"matched": [], "missed": list(reference)}
-
-    client = AsyncOpenAI(api_key=OPENAI_API_KEY)
-    ref_str = "\n".join(f"- {r}" for r in reference)
     user_str = "\n".join(f"- {a}" for a in user_answers) if user_answers else "(none)"
+
+    def user_content_for(items: list[str]) -> str:
+        ref_str = "\n".join(f"- {r}" for r in items)
+        if for_schema:
+            user_content = f"Reference list (expected tables/indexes — use these EXACT strings in matched/missed):\n{ref_str}\n\nUser's schema (what they wrote):\n{user_str}"
+            if api_design:
+                apis_str = "\n".join(f"- {a}" for a in api_design)
+                user_content += f"\n\nAPI design (for context):\n{apis_str}"
+            return user_content
+        if for_diagram:
+            return f"Reference list (copy these exact strings into your matched/missed lists):\n{ref_str}\n\nUser's list:\n{user_str}"
+        if for_requirements:
+            return f"Reference list (use these EXACT strings in matched/missed):\n{ref_str}\n\nUser's requirements:\n{user_str}"
+        return f"Reference requirements (use these exact strings in your answer):\n{ref_str}\n\nUser's answers:\n{user_str}"
+
     if for_schema:
         system_prompt = COVERAGE_SCHEMA_PROMPT
-        user_content = f"Reference list (expected tables/indexes — use these EXACT strings in matched/missed):\n{ref_str}\n\nUser's schema (what they wrote):\n{user_str}"
-        if api_design:
-            apis_str = "\n".join(f"- {a}" for a in api_design)
-            user_content += f"\n\nAPI design (for context):\n{apis_str}"
     elif for_diagram:
         system_prompt = COVERAGE_DIAGRAM_PROMPT
-        user_content = (
-            f"Reference list (copy these exact strings into your matched/missed lists):\n{ref_str}\n\nUser's list:\n{user_str}"
-        )
     elif for_requirements:
         system_prompt = COVERAGE_REQUIREMENTS_PROMPT
-        user_content = f"Reference list (use these EXACT strings in matched/missed):\n{ref_str}\n\nUser's requirements:\n{user_str}"
     else:
         system_prompt = COVERAGE_SYSTEM_PROMPT
-        user_content = f"Reference requirements (use these exact strings in your answer):\n{ref_str}\n\nUser's answers:\n{user_str}"
+    system_prompt += "\n\n" + COVERAGE_EVIDENCE_INSTRUCTION
     try:
-        response = await client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_content},
-            ],
-            response_format={"type": "json_object"},
+        classified = await _classify_with_cascade(kind, system_prompt, user_content_for, unresolved)
+        if classified is None:
+            return _coverage_in_reference_order(reference, set(known_matched))
+        llm_matched, evidence = classified
+        # Every unresolved item the LLM did not match counts as missed (same as the response).
+        coverage_memo.record(
+            kind,
+            user_answers,
+            matched=llm_matched,
+            missed=[r for r in unresolved if r not in llm_matched],
+            evidence=evidence,
         )
-        content = response.choices[0].message.content
+        return _coverage_in_reference_order(reference, set(known_matched) | set(llm_matched))
+    except Exception:
+        return _coverage_in_reference_order(reference, set(known_matched))
+
+
+# --- Fused mode: reference list + coverage verdicts in one structured-output call ---
+
+
+class FusedResult(TypedDict):
+    reference: dict[str, list[str]]  # list key -> generated reference items
+    verdicts: dict[str, dict[str, bool]]  # list key -> {reference item: covered by the user's answers}
+
+
+# Fused stage -> the classify_requirements_coverage flags its endpoint uses, so fused verdicts are
+# memoized under the kind the regular coverage path looks up.
+_STAGE_COVERAGE: dict[str, dict[str, bool]] = {
+    "requirements": {"for_requirements": True},
+    "apis": {"for_apis": True},
+    "estimation": {},
+    "data_model": {"for_schema": True},
+}
+
+
+class _FusedStage(TypedDict):
+    system_prompt: str
+    coverage_rules: str
+    lists: dict[str, int]  # list key -> max items kept
+
+
+_FUSED_STAGES: dict[str, _FusedStage] = {
+    "requirements": {
+        "system_prompt": LLM1_SYSTEM_PROMPT,
+        "coverage_rules": COVERAGE_REQUIREMENTS_PROMPT,
+        "lists": {"functional_requirements": 5, "non_functional_requirements": 5},
+    },
+    "apis": {"system_prompt": APIS_LLM_SYSTEM_PROMPT, "coverage_rules": COVERAGE_APIS_PROMPT, "lists": {"apis": 5}},
+    "estimation": {
+        "system_prompt": ESTIMATION_LLM_SYSTEM_PROMPT,
+        "coverage_rules": COVERAGE_SYSTEM_PROMPT,
+        "lists": {"elements": 7},
+    },
+    "data_model": {
+        "system_prompt": DATA_MODEL_LLM_SYSTEM_PROMPT,
+        "coverage_rules": COVERAGE_SCHEMA_PROMPT,
+        "lists": {"elements": 7},
+    },
+}
+
+FUSED_COVERAGE_INSTRUCTION = """You are ALSO given the user's own answers for each list. In the SAME JSON object add {matched_keys}: for each list, the items of that list (exact text, copied character-for-character) that the user's answers cover by meaning. Items you leave out count as missed. Judge coverage with the matching rules below, but ignore their output-format instructions; the only output is the single JSON object described above plus these "_matched" keys.
+
+Matching rules:
+"""
+
+
+def fused_verdicts(fused: FusedResult | None, list_key: str) -> dict[str, bool] | None:
+    """Verdicts for one list of a fused result (None when fused mode was not used or failed)."""
+    if fused is None:
+        return None
+    return fused["verdicts"].get(list_key)
+
+
+async def call_llm_fused(
+    stage: str,
+    topic: str,
+    answers: dict[str, list[str]],
+    api_design: list[str] | None = None,
+) -> FusedResult | None:
+    """
+    One round trip for a multi-wave endpoint: generate the stage's reference list(s) and judge the
+    user's answers against them. stage is one of "requirements", "apis", "estimation", "data_model";
+    answers maps each list key to the user's lines. The reference part is stored in the reference
+    cache under the same key as the regular generator.
+    Returns None when the regular path should be used instead: references already cached, no API
+    key, or the call/parse failed.
+    """
+    spec = _FUSED_STAGES[stage]
+    cache_inputs = (api_design or None) if stage == "data_model" else None
+    if not llm_available():
+        return None
+    if await reference_cache.get(stage, topic, cache_inputs) is not None:
+        return None
+    user_content = f"System design topic: {topic}"
+    if stage == "data_model" and api_design:
+        apis_str = "\n".join(f"- {a}" for a in api_design)
+        user_content += f"\n\nAPI design (from interview summary) — suggest tables that support these APIs:\n{apis_str}"
+    for key in spec["lists"]:
+        lines = [a for a in answers.get(key) or [] if a.strip()]
+        user_str = "\n".join(f"- {a}" for a in lines) if lines else "(none)"
+        user_content += f"\n\nUser's answers for {key}:\n{user_str}"
+    matched_keys = " and ".join(f'"{key}_matched"' for key in spec["lists"])
+    system_prompt = (
+        spec["system_prompt"]
+        + "\n\n"
+        + FUSED_COVERAGE_INSTRUCTION.format(matched_keys=matched_keys)
+        + spec["coverage_rules"]
+    )
+    try:
+        content = await _chat_json(f"fused_{stage}", system_prompt, user_content)
         if not content:
-            return {"matched": [], "missed": list(reference)}
-        data = json.loads(content)
-        raw_matched = data.get("matched") or []
-        raw_missed = data.get("missed") or []
-        if not isinstance(raw_matched, list):
-            raw_matched = []
-        if not isinstance(raw_missed, list):
-            raw_missed = []
-        # For API coverage we allow rich objects {user, expected, why}; convert to reference strings.
-        if for_apis:
-            if raw_matched and isinstance(raw_matched[0], dict):
-                matched = []
-                for item in raw_matched:
-                    expected_val = str(item.get("expected", "")).strip()
-                    if expected_val and expected_val in reference:
-                        matched.append(expected_val)
-            else:
-                matched = [str(x).strip() for x in raw_matched if str(x).strip() in reference]
-            if raw_missed and isinstance(raw_missed[0], dict):
-                missed = []
-                for item in raw_missed:
-                    expected_val = str(item.get("expected", "")).strip()
-                    if expected_val and expected_val in reference:
-                        missed.append(expected_val)
-            else:
-                missed = [str(x).strip() for x in raw_missed if str(x).strip() in reference]
-        else:
-            matched = [str(x).strip() for x in raw_matched if str(x).strip() in reference]
-            missed = [str(x).strip() for x in raw_missed if str(x).strip() in reference]
-        if for_diagram:
-            print("[diagram] LLM raw matched:", raw_matched, "| LLM raw missed:", raw_missed)
-        if for_schema:
-            print("[schema] LLM raw matched:", raw_matched, "| LLM raw missed:", raw_missed)
-        if for_requirements:
-            print("[requirements] LLM raw matched:", raw_matched, "| LLM raw missed:", raw_missed)
-        if for_apis:
-            print("[apis] LLM raw matched:", raw_matched, "| LLM raw missed:", raw_missed)
-        matched_set = set(matched)
-        missed = [m for m in missed if m not in matched_set]
-        for r in reference:
-            if r not in matched_set and r not in missed:
-                missed.append(r)
-        return {"matched": matched, "missed": missed}
+            return None
+        data = parse_llm_json(f"fused_{stage}", content)
+        reference: dict[str, list[str]] = {}
+        verdicts: dict[str, dict[str, bool]] = {}
+        for key, limit in spec["lists"].items():
+            items = data.get(key) or []
+            if not isinstance(items, list) or not items:
+                return None
+            items = [str(x).strip() for x in items if str(x).strip()][:limit]
+            raw_matched = data.get(f"{key}_matched") or []
+            if not isinstance(raw_matched, list):
+                raw_matched = []
+            matched = {
+                str(x.get("expected", "") if isinstance(x, dict) else x).strip() for x in raw_matched
+            }
+            reference[key] = items
+            verdicts[key] = {item: item in matched for item in items}
+            coverage_memo.record(
+                coverage_kind(**_STAGE_COVERAGE[stage]),
+                answers.get(key) or [],
+                matched=[i for i in items if verdicts[key][i]],
+                missed=[i for i in items if not verdicts[key][i]],
+                evidence={},
+            )
     except Exception:
-        return {"matched": [], "missed": list(reference)}
+        return None
+    cached_value = reference if len(reference) > 1 else next(iter(reference.values()))
+    await reference_cache.put(stage, topic, cache_inputs, cached_value)
+    return {"reference": reference, "verdicts": verdicts}
+
+
+# --- Providers ---
+
+
+def _fake_completion(kind: str, _system_prompt: str, _user_content: str) -> str | None:
+    """Deterministic answers for the fake provider (offline development, demos, load tests).
+    Reference kinds get the stub lists; kinds without a canned answer (coverage, feedback) return
+    None so callers take their usual local fallback."""
+    answers: dict[str, Any] = {
+        "requirements": _stub_llm1(""),
+        "apis": {"apis": _stub_apis_1("")},
+        "diagram": _stub_diagram_1(""),
+        "estimation": {"elements": _stub_estimation_1("")},
+        "data_model": {"elements": _stub_data_model_1("")},
+        "flow": {**_FLOW_STUB, "feedback": "Flow looks plausible (fake provider)."},
+        "detailed_diagram": {**_DETAILED_DIAGRAM_STUB, "feedback": "Diagram reviewed by the fake provider."},
+        "deep_dive_item": {"suggestedSummary": "Cover the data path, failure modes and scaling limits.", "feedback": ""},
+        "estimation_evaluation": {
+            **_stub_estimation_evaluation("", []),
+            "overall_feedback": "Estimates reviewed by the fake provider.",
+        },
+    }
+    answer = answers.get(kind)
+    return json.dumps(answer) if answer is not None else None
+
+
+def topic_artifacts() -> dict[str, tuple[Any, Callable[[str], Awaitable[Any]]]]:
+    """Per-topic reference artifacts worth precomputing (app.precompute): cache kind ->
+    (cache inputs, generator). Request-specific variants (a diagram from the user's API spec,
+    a data model from the user's APIs) are not included; secondary kinds only when a second
+    provider is configured."""
+    artifacts: dict[str, tuple[Any, Callable[[str], Awaitable[Any]]]] = {
+        "requirements": (None, _generate_llm1),
+        "apis": (None, _generate_apis_1),
+        "diagram": ("", lambda topic: _generate_diagram_1(topic, None)),
+        "estimation": (None, _generate_estimation_1),
+        "estimation_expected": (None, _generate_expected_estimations),
+        "data_model": (None, lambda topic: _generate_data_model_1(topic, None)),
+    }
+    if llm_available(secondary=True):
+        artifacts.update({
+            "requirements_2": (None, lambda topic: _generate_llm1(topic, secondary=True)),
+            "apis_2": (None, lambda topic: _generate_apis_1(topic, secondary=True)),
+            "diagram_2": (None, lambda topic: _generate_diagram_1(topic, None, secondary=True)),
+            "estimation_2": (None, lambda topic: _generate_estimation_1(topic, secondary=True)),
+            "data_model_2": (None, lambda topic: _generate_data_model_1(topic, None, secondary=True)),
+        })
+    return artifacts
+
+
+def _build_router() -> LLMRouter:
+    """Providers named in LLM_PROVIDERS, in order. Key and client lookups are late-bound."""
+    providers: list[LLMProvider] = []
+    for name in LLM_PROVIDERS:
+        if name == "openai":
+            providers.append(
+                OpenAIProvider(
+                    OPENAI_MODEL,
+                    client=lambda: get_llm_client(),
+                    api_key=lambda: OPENAI_API_KEY,
+                    strong_model=OPENAI_STRONG_MODEL,
+                )
+            )
+        elif name == "anthropic":
+            providers.append(
+                AnthropicProvider(
+                    ANTHROPIC_MODEL,
+                    client=lambda: get_anthropic_client(),
+                    api_key=lambda: ANTHROPIC_API_KEY,
+                    strong_model=ANTHROPIC_STRONG_MODEL,
+                )
+            )
+        elif name == "fake":
+            providers.append(FakeProvider(_fake_completion))
+        else:
+            print(f"Unknown LLM provider {name!r} in LLM_PROVIDERS (ignored)")
+    return LLMRouter(providers)
+
+
+llm_router = _build_router()
@@ -0,0 +1,99 @@
+"""Shared pooled LLM clients (OpenAI, and Anthropic when configured): opened once in the FastAPI
+lifespan hook and reused by every LLM call."""
+
+import asyncio
+import os
+
+import httpx
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+
+load_dotenv()
+
+# Connection pool tuning (env-configurable). HTTP/2 multiplexes many concurrent
+# completions over a few connections; it is used only when the `h2` package is installed.
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "1") == "1"
+LLM_PREWARM_CONNECTIONS = int(os.getenv("LLM_PREWARM_CONNECTIONS", "2"))
+
+_client: AsyncOpenAI | None = None
+_http_client: httpx.AsyncClient | None = None
+_anthropic_client = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _build_http_client() -> httpx.AsyncClient:
+    """httpx client with explicit pool limits; shared by all completions."""
+    limits = httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(
+        http2=LLM_HTTP2 and _http2_available(),
+        limits=limits,
+        timeout=httpx.Timeout(60.0, connect=10.0),
+    )
+
+
+def get_llm_client() -> AsyncOpenAI:
+    """Return the shared client. Created lazily when the lifespan hook did not run (scripts, tests)."""
+    global _client, _http_client
+    if _client is None:
+        _http_client = _build_http_client()
+        # Retries are owned by app.llm_scheduler (Retry-After aware, budget-bounded), not the SDK.
+        _client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=_http_client, max_retries=0)
+    return _client
+
+
+def get_anthropic_client():
+    """Return the shared AsyncAnthropic client (own connection pool), created on first use."""
+    global _anthropic_client
+    if _anthropic_client is None:
+        from anthropic import AsyncAnthropic
+
+        _anthropic_client = AsyncAnthropic(
+            api_key=os.getenv("ANTHROPIC_API_KEY"), http_client=_build_http_client(), max_retries=0
+        )
+    return _anthropic_client
+
+
+async def _prewarm(client: AsyncOpenAI) -> None:
+    """Open pooled connections (TCP + TLS) ahead of the first request; failures are ignored."""
+    if LLM_PREWARM_CONNECTIONS <= 0 or _http_client is None:
+        return
+    url = str(client.base_url)
+    await asyncio.gather(
+        *(_http_client.head(url) for _ in range(LLM_PREWARM_CONNECTIONS)),
+        return_exceptions=True,
+    )
+
+
+async def open_llm_client() -> AsyncOpenAI | None:
+    """Create the shared client at startup and pre-warm its pool. No-op without OPENAI_API_KEY."""
+    if not os.getenv("OPENAI_API_KEY"):
+        return None
+    client = get_llm_client()
+    await _prewarm(client)
+    return client
+
+
+async def close_llm_client() -> None:
+    """Close the shared clients (and their connection pools) on shutdown."""
+    global _client, _http_client, _anthropic_client
+    if _client is not None:
+        await _client.close()
+        _client = None
+        _http_client = None
+    if _anthropic_client is not None:
+        await _anthropic_client.close()
+        _anthropic_client = None
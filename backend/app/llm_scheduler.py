@@ -0,0 +1,289 @@
+"""Outbound LLM admission control; each provider in app.providers owns one scheduler.
+
+- At most LLM_MAX_IN_FLIGHT calls run at once; further calls wait in a priority queue
+  (interactive requests ahead of background work such as cache refreshes).
+- A tokens-per-minute bucket (LLM_TOKENS_PER_MINUTE, 0 = off) is charged with an estimate per
+  call and reconciled with the reported usage. A 429 pauses the bucket for Retry-After, so all
+  callers back off together instead of hammering the limit.
+- Retryable failures (429, 5xx, connection errors) are retried with full-jitter exponential
+  backoff, never shorter than Retry-After, and never past the request's latency budget.
+Queue wait is recorded per priority as llm_scheduler.queue_wait_seconds.<priority>.
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from enum import IntEnum
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, TypeVar
+
+import httpx
+import openai
+
+from app import metrics
+from app.deadline import current_budget
+
+T = TypeVar("T")
+
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "32"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "20"))
+# Output tokens assumed per call when charging the bucket up front (reconciled with usage afterwards).
+LLM_EXPECTED_OUTPUT_TOKENS = int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "600"))
+
+RETRYABLE_STATUS = frozenset({408, 409, 429, 500, 502, 503, 504})
+RETRYABLE_EXCEPTIONS: tuple[type[BaseException], ...] = (openai.APIConnectionError, httpx.TransportError)
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+_priority: ContextVar[Priority] = ContextVar("llm_priority", default=Priority.INTERACTIVE)
+
+
+@contextmanager
+def llm_priority(priority: Priority) -> Iterator[None]:
+    """Run LLM calls made inside the block (and tasks it spawns) at the given priority."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def estimate_tokens(*texts: str, output_tokens: int = LLM_EXPECTED_OUTPUT_TOKENS) -> int:
+    """Rough prompt size (~4 chars per token) plus the expected completion size."""
+    return sum(len(t) for t in texts) // 4 + output_tokens
+
+
+class TokenBucket:
+    """Tokens-per-minute bucket; per_minute <= 0 disables it."""
+
+    def __init__(self, per_minute: int) -> None:
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, n: int) -> bool:
+        if not self.enabled:
+            return True
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return False
+        self._refill(now)
+        n = min(n, self.capacity)
+        if self.tokens < n:
+            return False
+        self.tokens -= n
+        return True
+
+    def wait_time(self, n: int) -> float:
+        """Seconds until try_take(n) can succeed."""
+        now = time.monotonic()
+        self._refill(now)
+        deficit = min(n, self.capacity) - self.tokens
+        return max(self.blocked_until - now, deficit / self.rate if deficit > 0 else 0.0, 0.0)
+
+    def adjust(self, delta: float) -> None:
+        """Give back (delta > 0) or charge extra (delta < 0) tokens after the real usage is known."""
+        if self.enabled:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, self.tokens + delta)
+
+    def block_for(self, seconds: float) -> None:
+        """Stop handing out tokens for `seconds` (provider said we are over the limit)."""
+        if self.enabled:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+def _retry_after_seconds(exc: BaseException) -> float | None:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Transient provider-side failure (rate limit, 5xx, timeout, connection error)."""
+    return getattr(exc, "status_code", None) in RETRYABLE_STATUS or isinstance(exc, RETRYABLE_EXCEPTIONS)
+
+
+def _usage_tokens(result: Any) -> int | None:
+    usage = getattr(result, "usage", None)
+    total = getattr(usage, "total_tokens", None)
+    return total if isinstance(total, int) else None
+
+
+class _Waiter:
+    __slots__ = ("tokens", "future")
+
+    def __init__(self, tokens: int, future: asyncio.Future) -> None:
+        self.tokens = tokens
+        self.future = future
+
+
+class LLMScheduler:
+    """Priority admission (concurrency + TPM) and retry policy for outbound LLM calls."""
+
+    def __init__(
+        self,
+        *,
+        max_in_flight: int = LLM_MAX_IN_FLIGHT,
+        tokens_per_minute: int = LLM_TOKENS_PER_MINUTE,
+        max_retries: int = LLM_MAX_RETRIES,
+        retry_base: float = LLM_RETRY_BASE_SECONDS,
+        retry_max: float = LLM_RETRY_MAX_SECONDS,
+    ) -> None:
+        self.max_in_flight = max(1, max_in_flight)
+        self.bucket = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.in_flight = 0
+        self._queue: list[tuple[int, int, _Waiter]] = []
+        self._seq = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+
+    # --- admission ---
+
+    def _dispatch(self) -> None:
+        """Admit queued waiters in priority order while slots and tokens allow (strict head of line)."""
+        while self._queue:
+            waiter = self._queue[0][2]
+            if waiter.future.done():
+                heapq.heappop(self._queue)
+                continue
+            if self.in_flight >= self.max_in_flight:
+                return
+            if not self.bucket.try_take(waiter.tokens):
+                self._wake_later(self.bucket.wait_time(waiter.tokens))
+                return
+            heapq.heappop(self._queue)
+            self.in_flight += 1
+            waiter.future.set_result(None)
+
+    def _wake_later(self, delay: float) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(max(delay, 0.001), self._dispatch)
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def admit(self, tokens: int, priority: Priority | None = None) -> AsyncIterator[None]:
+        """Hold one in-flight slot (and `tokens` from the bucket) for the duration of the block."""
+        priority = _priority.get() if priority is None else priority
+        started = time.monotonic()
+        if not self._queue and self.in_flight < self.max_in_flight and self.bucket.try_take(tokens):
+            self.in_flight += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._queue, (int(priority), next(self._seq), _Waiter(tokens, future)))
+            self._dispatch()
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self._release()  # admitted in the same tick we were cancelled
+                else:
+                    future.cancel()
+                    self._dispatch()
+                raise
+        metrics.observe(f"llm_scheduler.queue_wait_seconds.{priority.name.lower()}", time.monotonic() - started)
+        try:
+            yield
+        finally:
+            self._release()
+
+    # --- retries ---
+
+    def retry_delay(self, exc: BaseException, attempt: int) -> float | None:
+        """Seconds to wait before retrying after `exc` on the given (0-based) attempt, or None to give up."""
+        status = getattr(exc, "status_code", None)
+        if attempt >= self.max_retries or not is_retryable(exc):
+            return None
+        retry_after = _retry_after_seconds(exc)
+        delay = random.uniform(0, min(self.retry_max, self.retry_base * (2**attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        if status == 429:
+            metrics.incr("llm_scheduler.rate_limited")
+            self.bucket.block_for(retry_after if retry_after is not None else delay)
+        budget = current_budget()
+        if budget is not None and delay >= budget.remaining():
+            metrics.incr("llm_scheduler.gave_up")
+            return None
+        return delay
+
+    async def run(
+        self,
+        fn: Callable[[], Awaitable[T]],
+        *,
+        tokens: int,
+        priority: Priority | None = None,
+    ) -> T:
+        """Admit, call fn(), retry retryable failures. The bucket is reconciled with result.usage when present,
+        and the reservation is refunded when the call is cancelled."""
+        attempt = 0
+        while True:
+            async with self.admit(tokens, priority):
+                try:
+                    result = await fn()
+                except asyncio.CancelledError:
+                    # Abandoned mid-call (the losing copy of a hedged request, or the caller's
+                    # deadline): no usage will ever be reported, so give the reservation back.
+                    self.bucket.adjust(min(tokens, self.bucket.capacity))
+                    metrics.incr("llm_scheduler.cancelled")
+                    raise
+                except Exception as exc:
+                    delay = self.retry_delay(exc, attempt)
+                    if delay is None:
+                        raise
+                else:
+                    actual = _usage_tokens(result)
+                    if actual is not None:
+                        self.bucket.adjust(min(tokens, self.bucket.capacity) - actual)
+                    return result
+            attempt += 1
+            metrics.incr("llm_scheduler.retries")
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "in_flight": self.in_flight,
+            "queued": sum(1 for _, _, w in self._queue if not w.future.done()),
+        }
+
@@ -0,0 +1,103 @@
+"""JSON schemas for structured outputs, one per prompt kind.
+
+Fixed-shape replies use strict schemas (the provider guarantees the shape). Coverage replies map
+reference items to evidence / confidence, i.e. objects with arbitrary keys, which strict mode does
+not allow; their schemas are sent non-strict. Kinds without a schema (fused and batched prompts,
+whose keys depend on the request) use plain JSON mode. LLM_STRUCTURED_OUTPUTS=0 turns schemas off.
+"""
+
+import os
+from typing import Any
+
+LLM_STRUCTURED_OUTPUTS = os.getenv("LLM_STRUCTURED_OUTPUTS", "1") == "1"
+
+_STR: dict[str, Any] = {"type": "string"}
+_BOOL: dict[str, Any] = {"type": "boolean"}
+_STRS: dict[str, Any] = {"type": "array", "items": _STR}
+
+
+def _obj(**properties: dict[str, Any]) -> dict[str, Any]:
+    """Strict-mode object: every property required, nothing else allowed."""
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+
+def _array(items: dict[str, Any]) -> dict[str, Any]:
+    return {"type": "array", "items": items}
+
+
+_COVERAGE: dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "matched": _STRS,
+        "missed": _STRS,
+        "evidence": {"type": "object", "additionalProperties": _STR},
+        "confidence": {"type": "object", "additionalProperties": {"type": "number"}},
+    },
+    "required": ["matched", "missed"],
+}
+
+_COVERAGE_APIS: dict[str, Any] = {
+    **_COVERAGE,
+    "properties": {
+        **_COVERAGE["properties"],
+        "matched": _array({"type": "object", "properties": {"user": _STR, "expected": _STR, "why": _STR}}),
+        "missed": _array({"type": "object", "properties": {"expected": _STR, "why": _STR}}),
+    },
+}
+
+# kind -> (schema, strict)
+SCHEMAS: dict[str, tuple[dict[str, Any], bool]] = {
+    "requirements": (_obj(functional_requirements=_STRS, non_functional_requirements=_STRS), True),
+    "apis": (_obj(apis=_STRS), True),
+    "diagram": (_obj(elements=_STRS, mermaid_diagram=_STR), True),
+    "estimation": (_obj(elements=_STRS), True),
+    "data_model": (_obj(elements=_STRS), True),
+    "flow": (_obj(correct=_BOOL, feedback=_STR, improvements=_STR), True),
+    "deep_dives": (
+        _obj(items=_array(_obj(topic=_STR, suggestedSummary=_STR, feedback=_STR)), suggestedMissingTopics=_STRS),
+        True,
+    ),
+    "deep_dive_item": (_obj(suggestedSummary=_STR, feedback=_STR), True),
+    "deep_dives_missing": (_obj(suggestedMissingTopics=_STRS), True),
+    "detailed_diagram": (_obj(feedback=_STR, improvements=_STR, suggested_diagram=_STR), True),
+    "estimation_evaluation": (
+        _obj(
+            expected_estimations=_array(_obj(item=_STR, expected_value=_STR, derivation=_STR)),
+            comparison_feedback=_array(
+                _obj(
+                    item=_STR,
+                    user_value=_STR,
+                    expected_value=_STR,
+                    status={"type": "string", "enum": ["correct", "close", "incorrect", "missing"]},
+                    feedback=_STR,
+                )
+            ),
+            missing_items=_STRS,
+            overall_feedback=_STR,
+        ),
+        True,
+    ),
+    "data_model_feedback": (
+        _obj(feedback=_array(_obj(userLine=_STR, reasonable=_BOOL, comment=_STR)), suggestedMissingTables=_STRS),
+        True,
+    ),
+    "coverage": (_COVERAGE, False),
+    "coverage_requirements": (_COVERAGE, False),
+    "coverage_diagram": (_COVERAGE, False),
+    "coverage_schema": (_COVERAGE, False),
+    "coverage_apis": (_COVERAGE_APIS, False),
+}
+
+
+def response_format_for(kind: str) -> dict[str, Any]:
+    """OpenAI response_format for a prompt kind: its JSON schema, or plain JSON mode."""
+    entry = SCHEMAS.get(kind) if LLM_STRUCTURED_OUTPUTS else None
+    if entry is None:
+        return {"type": "json_object"}
+    schema, strict = entry
+    return {"type": "json_schema", "json_schema": {"name": kind, "schema": schema, "strict": strict}}
@@ -2,15 +2,24 @@
 
 import asyncio
 import base64
+import json
+import os
+import secrets
 from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
 
-import httpx
 from dotenv import load_dotenv
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 
+from app import metrics
+from app.circuit_breaker import circuits_snapshot
+from app.deadline import request_budget, with_deadline
 from app.diagram import extract_text_from_drawio_xml
+from app.json_repair import parse_stats
 from app.llm import (
+    LLM_FUSED_MODE,
     call_llm1,
     call_llm2,
     call_llm_apis_1,
@@ -26,9 +35,35 @@ from app.llm import (
     call_llm_validate_flow,
     call_llm_validate_detailed_diagram,
     call_llm_deep_dives,
+    call_llm_fused,
     classify_requirements_coverage,
+    coverage_tier_shares,
+    fused_verdicts,
+    llm_router,
+    stream_llm_deep_dives,
+    stream_llm_validate_detailed_diagram,
+    stream_llm_validate_flow,
+)
+from app.kroki import KROKI_FALLBACK, kroki_renderer
+from app.llm_client import close_llm_client, open_llm_client
+from app.mermaid_repair import is_valid_mermaid, mermaid_parse_stats
+from app.mermaid_svg import is_supported as native_mermaid_supported
+from app.mermaid_svg import native_mermaid
+from app.prefetch import PREFETCH_ON_VALIDATE, topic_prefetcher
+from app.reference_cache import TOPIC_BUNDLE_PATH, reference_cache
+from app.render_jobs import RENDER_JOB_MAX_WAIT_SECONDS, RenderJob, RenderJobQueue
+from app.render_store import (
+    RENDER_FORMATS,
+    RENDER_INLINE_DATA_URL,
+    RENDER_PUBLIC_URL,
+    is_render_id,
+    render_store,
 )
 from app.schemas import (
+    InvalidateReferenceCacheResponse,
+    PrefetchResponse,
+    RenderJobResponse,
+    TopicAliases,
     EstimationComparisonItem,
     ExpectedEstimationItem,
     DataModelFeedbackItem,
@@ -50,6 +85,8 @@ from app.schemas import (
     ValidateRequest,
     ValidateResponse,
 )
+from app.topic_bundle import BundleFormatError, TopicBundle
+from app.topic_index import current_topic_resolution, topic_index, with_topic_resolution
 from app.validation import combine_top_requirements, find_common_requirements
 
 load_dotenv()
@@ -57,8 +94,27 @@ load_dotenv()
 
 @asynccontextmanager
 async def lifespan(_app: FastAPI):
-    """Load env and other startup; nothing to do on shutdown."""
-    yield
+    """Open the shared pooled LLM client (pre-warming its connections), the pooled Kroki client and
+    the precomputed topic bundle if one was built (python -m app.precompute); close them (and the
+    render job workers and native render pool) on shutdown."""
+    if os.path.exists(TOPIC_BUNDLE_PATH):
+        try:
+            reference_cache.bundle = TopicBundle(TOPIC_BUNDLE_PATH)
+            print(f"Loaded topic bundle {TOPIC_BUNDLE_PATH} ({len(reference_cache.bundle)} entries)")
+            topic_index.add_topics(reference_cache.bundle.meta.get("topics", []))
+        except (OSError, BundleFormatError) as e:
+            print(f"Ignoring topic bundle {TOPIC_BUNDLE_PATH}: {e}")
+    await open_llm_client()
+    await kroki_renderer.open()
+    try:
+        yield
+    finally:
+        await topic_prefetcher.close()
+        await render_jobs.close()
+        await kroki_renderer.close()
+        native_mermaid.close()
+        await close_llm_client()
+        reference_cache.close()
 
 
 app = FastAPI(
@@ -72,19 +128,48 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"],
     allow_credentials=True,
-    allow_methods=["POST", "OPTIONS"],
-    allow_headers=["Content-Type"],
+    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    allow_headers=["Content-Type", "X-Admin-Token"],
 )
 
 
+async def _reference_1(stage: str, topic: str, answers: dict[str, list[str]], generate, api_design=None):
+    """
+    First reference pass for a stage: with LLM_FUSED_MODE on, one fused call that also returns
+    coverage verdicts; otherwise (or when the fused call is not used) the regular generator.
+    Returns (reference in the generator's shape, fused result or None).
+    """
+    fused = await call_llm_fused(stage, topic, answers, api_design=api_design) if LLM_FUSED_MODE else None
+    if fused is None:
+        return await generate(), None
+    reference = fused["reference"]
+    return (reference if len(reference) > 1 else next(iter(reference.values()))), fused
+
+
 @app.post("/validate", response_model=ValidateResponse)
+@with_deadline("validate")
+@with_topic_resolution
 async def validate(req: ValidateRequest) -> ValidateResponse:
     """
     Call two LLMs for the given topic, then:
     - Use common requirements (≥2 shared words) if any; else combine top 3 from LLM1 + top 2 from LLM2.
     - Return top 5 functional and top 5 non-functional requirements.
+    With PREFETCH_ON_VALIDATE on, the later stages' references for the topic start warming in
+    the background first.
     """
-    llm1, llm2 = await asyncio.gather(call_llm1(req.topic), call_llm2(req.topic))
+    if PREFETCH_ON_VALIDATE:
+        topic_prefetcher.schedule(req.topic)
+    user_func = req.functionalReqs or []
+    user_non_func = req.nonFunctionalReqs or []
+    (llm1, fused), llm2 = await asyncio.gather(
+        _reference_1(
+            "requirements",
+            req.topic,
+            {"functional_requirements": user_func, "non_functional_requirements": user_non_func},
+            lambda: call_llm1(req.topic),
+        ),
+        call_llm2(req.topic),
+    )
 
     common_func = find_common_requirements(
         llm1["functional_requirements"],
@@ -113,11 +198,19 @@ async def validate(req: ValidateRequest) -> ValidateResponse:
     )
 
     # Semantic comparison: which of the top 5 did the user cover (by meaning)?
-    user_func = req.functionalReqs or []
-    user_non_func = req.nonFunctionalReqs or []
     coverage_func, coverage_non_func = await asyncio.gather(
-        classify_requirements_coverage(final_func, user_func, for_requirements=True),
-        classify_requirements_coverage(final_non_func, user_non_func, for_requirements=True),
+        classify_requirements_coverage(
+            final_func,
+            user_func,
+            for_requirements=True,
+            known=fused_verdicts(fused, "functional_requirements"),
+        ),
+        classify_requirements_coverage(
+            final_non_func,
+            user_non_func,
+            for_requirements=True,
+            known=fused_verdicts(fused, "non_functional_requirements"),
+        ),
     )
 
     return ValidateResponse(
@@ -131,13 +224,16 @@ async def validate(req: ValidateRequest) -> ValidateResponse:
 
 
 @app.post("/validate-apis", response_model=ValidateApisResponse)
+@with_deadline("validate-apis")
+@with_topic_resolution
 async def validate_apis(req: ValidateApisRequest) -> ValidateApisResponse:
     """
     Call two LLMs for top 5 APIs for the topic, merge (common or combine top),
     then compare user's APIs against the result by meaning; return matched and missed.
     """
-    apis1, apis2 = await asyncio.gather(
-        call_llm_apis_1(req.topic),
+    user_apis = req.apis or []
+    (apis1, fused), apis2 = await asyncio.gather(
+        _reference_1("apis", req.topic, {"apis": user_apis}, lambda: call_llm_apis_1(req.topic)),
         call_llm_apis_2(req.topic),
     )
     common = find_common_requirements(apis1, apis2)
@@ -145,7 +241,7 @@ async def validate_apis(req: ValidateApisRequest) -> ValidateApisResponse:
         common if common else combine_top_requirements(apis1, apis2)
     )
     coverage = await classify_requirements_coverage(
-        final_apis, req.apis or [], for_apis=True
+        final_apis, user_apis, for_apis=True, known=fused_verdicts(fused, "apis")
     )
     return ValidateApisResponse(
         apis=final_apis,
@@ -179,11 +275,15 @@ def _diagram_api_spec(api_design: list) -> str:
 
 
 @app.post("/validate-diagram", response_model=ValidateDiagramResponse)
+@with_deadline("validate-diagram")
+@with_topic_resolution
 async def validate_diagram(req: ValidateDiagramRequest) -> ValidateDiagramResponse:
     """
     Call two LLMs for key components that should appear in a high-level diagram,
     merge lists, extract text from the user's draw.io XML, then compare by meaning.
-    When apiDesign is provided, the suggested diagram is generated from the API spec.
+    When apiDesign is provided, the suggested diagram is generated from the API spec. The
+    suggestion is rendered to SVG in-process when it is in the supported Mermaid subset (never
+    through Kroki, so this endpoint makes no render network calls).
     """
     api_spec = _diagram_api_spec(req.apiDesign or [])
     result1, elem2 = await asyncio.gather(
@@ -201,15 +301,19 @@ async def validate_diagram(req: ValidateDiagramRequest) -> ValidateDiagramRespon
     coverage = await classify_requirements_coverage(
         final_elements, user_labels, for_diagram=True
     )
+    suggested_diagram_svg = await _render_suggested_image(suggested_diagram, kroki=False)
     return ValidateDiagramResponse(
         elements=final_elements,
         matched=coverage["matched"],
         missed=coverage["missed"],
         suggestedDiagram=suggested_diagram,
+        suggestedDiagramSvg=suggested_diagram_svg,
     )
 
 
 @app.post("/validate-flow", response_model=ValidateFlowResponse)
+@with_deadline("validate-flow")
+@with_topic_resolution
 async def validate_flow(req: ValidateFlowRequest) -> ValidateFlowResponse:
     """
     Validate the user's end-to-end flow summary against the system design.
@@ -230,7 +334,79 @@ async def validate_flow(req: ValidateFlowRequest) -> ValidateFlowResponse:
     )
 
 
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _event_stream(endpoint: str, events: AsyncIterator[tuple[str, Any]]) -> StreamingResponse:
+    """
+    SSE response for a streaming endpoint. events runs in its own task under the endpoint's
+    latency budget (same budget as the blocking endpoint); each (event, data) pair is sent as it
+    is produced. The "done" event carries the full response and `degraded` when the budget ran out.
+    If the client disconnects, the producer task (and the upstream LLM stream) is cancelled.
+    """
+    queue: asyncio.Queue[str | None] = asyncio.Queue()
+
+    async def produce() -> None:
+        with request_budget(endpoint) as budget:
+            try:
+                async for event, data in events:
+                    if event == "done" and budget.degraded:
+                        data = {**data, "degraded": True}
+                    queue.put_nowait(_sse(event, data))
+            except Exception as exc:
+                queue.put_nowait(_sse("error", {"detail": str(exc) or type(exc).__name__}))
+            finally:
+                queue.put_nowait(None)
+
+    async def body() -> AsyncIterator[str]:
+        task = asyncio.create_task(produce())
+        try:
+            while (item := await queue.get()) is not None:
+                yield item
+        finally:
+            task.cancel()
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/validate-flow/stream")
+@with_topic_resolution
+async def validate_flow_stream(req: ValidateFlowRequest) -> StreamingResponse:
+    """
+    SSE variant of /validate-flow: events "correct", "feedback", "improvements" as each field
+    completes, then "done" with the ValidateFlowResponse body.
+    """
+    diagram_labels = (
+        extract_text_from_drawio_xml(req.diagramXml) if (req.diagramXml or "").strip() else []
+    )
+    resolution = current_topic_resolution()
+
+    async def events() -> AsyncIterator[tuple[str, Any]]:
+        async for event, data in stream_llm_validate_flow(
+            topic=req.topic,
+            flow_summary=req.flowSummary or "",
+            diagram_labels=diagram_labels or None,
+        ):
+            if event == "done":
+                data = ValidateFlowResponse(
+                    correct=data["correct"],
+                    feedback=data["feedback"],
+                    improvements=data.get("improvements", ""),
+                    topicResolution=resolution,
+                ).model_dump()
+            yield event, data
+
+    return _event_stream("validate-flow", events())
+
+
 @app.post("/validate-deep-dives", response_model=ValidateDeepDivesResponse)
+@with_deadline("validate-deep-dives")
+@with_topic_resolution
 async def validate_deep_dives(req: ValidateDeepDivesRequest) -> ValidateDeepDivesResponse:
     """
     For each deep dive topic, generate a suggested summary and optional feedback; also return 3 suggested missing topics.
@@ -238,6 +414,10 @@ async def validate_deep_dives(req: ValidateDeepDivesRequest) -> ValidateDeepDive
     raw = req.deepDives or []
     payload = [{"topic": getattr(d, "topic", ""), "userSummary": getattr(d, "userSummary", "") or ""} for d in raw]
     result = await call_llm_deep_dives(req.topic, payload)
+    return _deep_dives_response(result)
+
+
+def _deep_dives_response(result: dict) -> ValidateDeepDivesResponse:
     items_data = result.get("items") or []
     missing = result.get("suggestedMissingTopics") or []
     return ValidateDeepDivesResponse(
@@ -246,45 +426,26 @@ async def validate_deep_dives(req: ValidateDeepDivesRequest) -> ValidateDeepDive
     )
 
 
-KROKI_URL = "https://kroki.io"
-
-
-async def mermaid_to_png_data_url(mermaid: str) -> str:
-    """Convert Mermaid diagram source to PNG via Kroki; return data URL or empty string."""
-    if not (mermaid or "").strip():
-        return ""
-    try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            r = await client.post(
-                f"{KROKI_URL}/mermaid/png",
-                content=mermaid.strip().encode("utf-8"),
-                headers={"Content-Type": "text/plain"},
-            )
-            if r.status_code != 200 or not r.content:
-                return ""
-            b64 = base64.standard_b64encode(r.content).decode("ascii")
-            return f"data:image/png;base64,{b64}"
-    except Exception:
-        return ""
+@app.post("/validate-deep-dives/stream")
+@with_topic_resolution
+async def validate_deep_dives_stream(req: ValidateDeepDivesRequest) -> StreamingResponse:
+    """
+    SSE variant of /validate-deep-dives: one "item" event per finished deep dive, then
+    "suggestedMissingTopics", then "done" with the ValidateDeepDivesResponse body.
+    """
+    raw = req.deepDives or []
+    payload = [{"topic": getattr(d, "topic", ""), "userSummary": getattr(d, "userSummary", "") or ""} for d in raw]
+    resolution = current_topic_resolution()
 
+    async def events() -> AsyncIterator[tuple[str, Any]]:
+        async for event, data in stream_llm_deep_dives(req.topic, payload):
+            if event == "done":
+                response = _deep_dives_response(data)
+                response.topicResolution = resolution
+                data = response.model_dump()
+            yield event, data
 
-async def d2_to_png_data_url(d2_source: str) -> str:
-    """Convert D2 diagram source to PNG via Kroki; return data URL or empty string."""
-    if not (d2_source or "").strip():
-        return ""
-    try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            r = await client.post(
-                f"{KROKI_URL}/d2/png",
-                content=d2_source.strip().encode("utf-8"),
-                headers={"Content-Type": "text/plain"},
-            )
-            if r.status_code != 200 or not r.content:
-                return ""
-            b64 = base64.standard_b64encode(r.content).decode("ascii")
-            return f"data:image/png;base64,{b64}"
-    except Exception:
-        return ""
+    return _event_stream("validate-deep-dives", events())
 
 
 def _requirements_summary(req_in: ValidateDetailedDiagramRequest) -> str:
@@ -295,17 +456,18 @@ def _requirements_summary(req_in: ValidateDetailedDiagramRequest) -> str:
     non_func = getattr(r, "nonFunctional", None) or []
     lines = []
     if func:
-        lines.append("Functional: " + "; ".join(str(x) for x in func[:10]))
+        lines.append("Functional: " + "; ".join(str(x) for x in func))
     if non_func:
-        lines.append("Non-functional: " + "; ".join(str(x) for x in non_func[:10]))
+        lines.append("Non-functional: " + "; ".join(str(x) for x in non_func))
     return "\n".join(lines)
 
 
 def _api_design_summary(api_design: list) -> str:
+    """One line per API; the detailed-diagram prompt builder compacts long lines to its token budget."""
     if not api_design:
         return ""
     lines = []
-    for row in api_design[:15]:
+    for row in api_design:
         if isinstance(row, dict):
             api, req, res = str(row.get("api", "") or ""), str(row.get("request", "") or ""), str(row.get("response", "") or "")
         else:
@@ -313,78 +475,225 @@ def _api_design_summary(api_design: list) -> str:
             req = str(getattr(row, "request", "") or "")
             res = str(getattr(row, "response", "") or "")
         if api:
-            req_part = f" (request: {req[:80]}...)" if len(req) > 80 else (f" (request: {req})" if req else "")
-            res_part = f" (response: {res[:80]}...)" if len(res) > 80 else (f" (response: {res})" if res else "")
+            req_part = f" (request: {' '.join(req.split())})" if req else ""
+            res_part = f" (response: {' '.join(res.split())})" if res else ""
             lines.append(f"- {api}{req_part}{res_part}")
     return "\n".join(lines) if lines else ""
 
 
 @app.post("/validate-detailed-diagram", response_model=ValidateDetailedDiagramResponse)
+@with_deadline("validate-detailed-diagram")
+@with_topic_resolution
 async def validate_detailed_diagram(req: ValidateDetailedDiagramRequest) -> ValidateDetailedDiagramResponse:
     """
     Validate the user's detailed design diagram against all discussed points: requirements,
     API design, database schema, high-level diagram, end-to-end flow, and deep dives.
-    Returns text feedback, improvements, and a suggested Mermaid diagram (same style as high-level),
-    plus an optional server-rendered PNG when rendering succeeds.
-    """
-    diagram_labels = extract_text_from_drawio_xml(req.diagramXml or "")
-    high_level_labels = extract_text_from_drawio_xml(req.highLevelDiagramXml or "")
-    requirements_summary = _requirements_summary(req)
-    api_list = req.apiDesign or []
-    api_design_summary = _api_design_summary(api_list)
-    data_model_summary = "\n".join(str(x) for x in (req.dataModel or [])[:30])
-    raw_dives = req.deepDives or []
-    deep_dives_payload = [
-        {
-            "topic": getattr(d, "topic", "") or "",
-            "userSummary": getattr(d, "userSummary", "") or "",
-            "suggestedSummary": getattr(d, "suggestedSummary", "") or "",
-        }
-        for d in raw_dives
-    ]
-    result = await call_llm_validate_detailed_diagram(
-        topic=req.topic,
-        requirements_summary=requirements_summary,
-        api_design_summary=api_design_summary,
-        data_model_summary=data_model_summary,
-        high_level_labels=high_level_labels,
-        end_to_end_flow=req.endToEndFlow or "",
-        deep_dives=deep_dives_payload,
-        diagram_labels=diagram_labels,
-    )
+    Returns text feedback, improvements, and a suggested Mermaid diagram (same style as high-level)
+    as soon as the LLM is done. The diagram is rendered by a background job (renderJobId, collected
+    through GET /renders/jobs/{id}); suggestedDiagramPng is only set here when that diagram had
+    already been rendered.
+    """
+    result = await call_llm_validate_detailed_diagram(**_detailed_diagram_inputs(req))
     suggested_diagram = result.get("suggested_diagram", "") or ""
-    suggested_diagram_png = ""
-    if suggested_diagram.strip():
-        suggested_diagram_png = await mermaid_to_png_data_url(suggested_diagram)
-        if not suggested_diagram_png:
-            suggested_diagram_png = await d2_to_png_data_url(suggested_diagram)
+    job = _submit_render(suggested_diagram)
     return ValidateDetailedDiagramResponse(
         feedback=result.get("feedback", ""),
         improvements=result.get("improvements", ""),
         suggestedDiagram=suggested_diagram,
-        suggestedDiagramPng=suggested_diagram_png,
+        suggestedDiagramPng=job.url if job is not None else "",
+        renderJobId=job.id if job is not None else "",
     )
 
 
+def _detailed_diagram_inputs(req: ValidateDetailedDiagramRequest) -> dict:
+    """Keyword arguments for call_llm_validate_detailed_diagram / stream_llm_validate_detailed_diagram."""
+    raw_dives = req.deepDives or []
+    return {
+        "topic": req.topic,
+        "requirements_summary": _requirements_summary(req),
+        "api_design_summary": _api_design_summary(req.apiDesign or []),
+        "data_model_summary": "\n".join(str(x) for x in (req.dataModel or [])),
+        "high_level_labels": extract_text_from_drawio_xml(req.highLevelDiagramXml or ""),
+        "end_to_end_flow": req.endToEndFlow or "",
+        "deep_dives": [
+            {
+                "topic": getattr(d, "topic", "") or "",
+                "userSummary": getattr(d, "userSummary", "") or "",
+                "suggestedSummary": getattr(d, "suggestedSummary", "") or "",
+            }
+            for d in raw_dives
+        ],
+        "diagram_labels": extract_text_from_drawio_xml(req.diagramXml or ""),
+    }
+
+
+async def _render_diagram(engine: str, fmt: str, source: str) -> bytes | None:
+    """Render store renderer: Mermaid SVG in the supported subset natively, anything else through
+    Kroki unless KROKI_FALLBACK=0."""
+    if engine == "mermaid" and fmt == "svg" and native_mermaid_supported(source):
+        svg = await native_mermaid.render(engine, fmt, source)
+        if svg is not None:
+            return svg
+    if not KROKI_FALLBACK:
+        return None
+    return await kroki_renderer.render(engine, fmt, source)
+
+
+async def _render_url(rid: str, fmt: str) -> str:
+    if RENDER_INLINE_DATA_URL:
+        data = await render_store.fetch(rid, fmt, _render_diagram)
+        if not data:
+            return ""
+        return f"data:{RENDER_FORMATS[fmt]};base64,{base64.standard_b64encode(data).decode('ascii')}"
+    return f"{RENDER_PUBLIC_URL}/renders/{rid}.{fmt}"
+
+
+async def _render_suggested_image(suggested_diagram: str, *, kroki: bool = True) -> str:
+    """
+    URL of the rendered suggested diagram: GET /renders/{id}.svg when it is in the Mermaid subset
+    rendered in-process, otherwise (with kroki and KROKI_FALLBACK) GET /renders/{id}.png rendered
+    by Kroki. A data URL with RENDER_INLINE_DATA_URL=1; empty string on failure. Nothing is
+    rendered for a source that does not parse as a Mermaid flowchart (app.mermaid_repair). Repeat
+    diagrams are served from the render store without rendering again.
+    """
+    if not suggested_diagram.strip():
+        return ""
+    if not is_valid_mermaid(suggested_diagram):
+        metrics.incr("render.skipped_invalid")
+        return ""
+    if native_mermaid_supported(suggested_diagram):
+        rid = await render_store.render("mermaid", "svg", suggested_diagram, _render_diagram)
+        if rid is not None:
+            return await _render_url(rid, "svg")
+    if not (kroki and KROKI_FALLBACK):
+        return ""
+    rid = await render_store.render("mermaid", "png", suggested_diagram, kroki_renderer.render)
+    if rid is None:
+        return ""
+    return await _render_url(rid, "png")
+
+
+render_jobs = RenderJobQueue(lambda source: _render_suggested_image(source))
+
+
+def _submit_render(suggested_diagram: str) -> RenderJob | None:
+    """Background render job for a suggested diagram; None when it is empty, does not parse (it
+    would never render) or the render queue is full."""
+    if not is_valid_mermaid(suggested_diagram):
+        return None
+    return render_jobs.submit(suggested_diagram)
+
+
+async def _stored_render_job(job_id: str) -> RenderJobResponse | None:
+    """A finished job rebuilt from the render store (the job id is the render id of its source)."""
+    if not is_render_id(job_id):
+        return None
+    for fmt in ("svg", "png"):
+        if await asyncio.to_thread(render_store.get, job_id, fmt) is not None:
+            return RenderJobResponse(id=job_id, status="done", url=await _render_url(job_id, fmt))
+    return None
+
+
+@app.get("/renders/jobs/{job_id}", response_model=RenderJobResponse)
+async def get_render_job(
+    job_id: str, wait: float = Query(default=RENDER_JOB_MAX_WAIT_SECONDS, ge=0, le=RENDER_JOB_MAX_WAIT_SECONDS)
+) -> Response:
+    """
+    State of a background render job (renderJobId). Long-poll: waits up to `wait` seconds for the
+    job to finish before answering, so one request usually returns the image URL. Jobs live in the
+    worker that queued them; a job this worker does not know (another worker, or a restart) is
+    reported done when its render is already in the shared render store.
+    """
+    job = await render_jobs.wait(job_id, wait)
+    if job is None:
+        body = await _stored_render_job(job_id)
+        if body is None:
+            raise HTTPException(status_code=404, detail="Unknown render job")
+    else:
+        body = RenderJobResponse(id=job.id, status=job.status, url=job.url)
+    return Response(content=body.model_dump_json(), media_type="application/json", headers={"Cache-Control": "no-store"})
+
+
+@app.get("/renders/{name}")
+async def get_render(name: str, if_none_match: str | None = Header(default=None)) -> Response:
+    """
+    Rendered diagram by content address ("{id}.png" or "{id}.svg"). Artifacts never change, so
+    they are sent with a strong ETag and an immutable Cache-Control; another format of a known
+    diagram is rendered on first request.
+    """
+    rid, _, fmt = name.partition(".")
+    if fmt not in RENDER_FORMATS or not is_render_id(rid):
+        raise HTTPException(status_code=404, detail="Unknown render")
+    data = await render_store.fetch(rid, fmt, _render_diagram)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Unknown render")
+    headers = {"ETag": f'"{rid}.{fmt}"', "Cache-Control": "public, max-age=31536000, immutable"}
+    if if_none_match and headers["ETag"] in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=data, media_type=RENDER_FORMATS[fmt], headers=headers)
+
+
+@app.post("/validate-detailed-diagram/stream")
+@with_topic_resolution
+async def validate_detailed_diagram_stream(req: ValidateDetailedDiagramRequest) -> StreamingResponse:
+    """
+    SSE variant of /validate-detailed-diagram: "feedback", "improvements" and "suggestedDiagram"
+    (Mermaid source) as each field completes, then "renderJob" ({"id": renderJobId}) and
+    "suggestedDiagramPng" (the rendered image URL) once the background render finished, then
+    "done" with the ValidateDetailedDiagramResponse body.
+    """
+    inputs = _detailed_diagram_inputs(req)
+    resolution = current_topic_resolution()
+
+    async def events() -> AsyncIterator[tuple[str, Any]]:
+        result: dict = {}
+        async for event, data in stream_llm_validate_detailed_diagram(**inputs):
+            if event == "done":
+                result = data
+            else:
+                yield event, data
+        suggested_diagram = result.get("suggested_diagram", "") or ""
+        job = _submit_render(suggested_diagram)
+        suggested_diagram_png = ""
+        if job is not None:
+            yield "renderJob", {"id": job.id}
+            job = await render_jobs.wait(job.id, RENDER_JOB_MAX_WAIT_SECONDS)
+            suggested_diagram_png = job.url if job is not None else ""
+        yield "suggestedDiagramPng", suggested_diagram_png
+        yield "done", ValidateDetailedDiagramResponse(
+            feedback=result.get("feedback", ""),
+            improvements=result.get("improvements", ""),
+            suggestedDiagram=suggested_diagram,
+            suggestedDiagramPng=suggested_diagram_png,
+            renderJobId=job.id if job is not None else "",
+            topicResolution=resolution,
+        ).model_dump()
+
+    return _event_stream("validate-detailed-diagram", events())
+
+
 @app.post("/validate-estimation", response_model=ValidateEstimationResponse)
+@with_deadline("validate-estimation")
+@with_topic_resolution
 async def validate_estimation(req: ValidateEstimationRequest) -> ValidateEstimationResponse:
     """
     Merge key estimation categories from two LLM passes, classify user coverage,
     and run a strict evaluation pass: reference derivations, per-category comparison,
     and missing important categories.
     """
-    est1, est2 = await asyncio.gather(
-        call_llm_estimation_1(req.topic),
+    user_est = req.estimations or []
+    # The strict evaluation does not depend on the merged reference: run it in the first wave.
+    (est1, fused), est2, evaluation = await asyncio.gather(
+        _reference_1("estimation", req.topic, {"elements": user_est}, lambda: call_llm_estimation_1(req.topic)),
         call_llm_estimation_2(req.topic),
+        call_llm_estimation_evaluation(req.topic, user_est),
     )
     common = find_common_requirements(est1, est2)
     final_elements = (
         common if common else combine_top_requirements(est1, est2)
     )
-    user_est = req.estimations or []
-    coverage, evaluation = await asyncio.gather(
-        classify_requirements_coverage(final_elements, user_est),
-        call_llm_estimation_evaluation(req.topic, user_est),
+    coverage = await classify_requirements_coverage(
+        final_elements, user_est, known=fused_verdicts(fused, "elements")
     )
     expected_models = [
         ExpectedEstimationItem(
@@ -416,6 +725,8 @@ async def validate_estimation(req: ValidateEstimationRequest) -> ValidateEstimat
 
 
 @app.post("/validate-data-model", response_model=ValidateDataModelResponse)
+@with_deadline("validate-data-model")
+@with_topic_resolution
 async def validate_data_model(req: ValidateDataModelRequest) -> ValidateDataModelResponse:
     """
     Database schema validation uses multiple LLM calls:
@@ -424,20 +735,29 @@ async def validate_data_model(req: ValidateDataModelRequest) -> ValidateDataMode
     3) One LLM for per-line feedback (keys, missing fields, API alignment).
     """
     api_design = req.apiDesign or []
-    dm1, dm2 = await asyncio.gather(
-        call_llm_data_model_1(req.topic, api_design=api_design),
+    user_lines = req.dataModel or []
+    # Per-line feedback does not depend on the merged reference: run it in the first wave.
+    (dm1, fused), dm2, feedback_result = await asyncio.gather(
+        _reference_1(
+            "data_model",
+            req.topic,
+            {"elements": user_lines},
+            lambda: call_llm_data_model_1(req.topic, api_design=api_design),
+            api_design=api_design,
+        ),
         call_llm_data_model_2(req.topic, api_design=api_design),
+        call_llm_data_model_feedback(req.topic, user_lines, api_design=api_design),
     )
     common = find_common_requirements(dm1, dm2)
     final_elements = (
         common if common else combine_top_requirements(dm1, dm2)
     )
-    user_lines = req.dataModel or []
-    coverage, feedback_result = await asyncio.gather(
-        classify_requirements_coverage(
-            final_elements, user_lines, for_schema=True, api_design=api_design
-        ),
-        call_llm_data_model_feedback(req.topic, user_lines, api_design=api_design),
+    coverage = await classify_requirements_coverage(
+        final_elements,
+        user_lines,
+        for_schema=True,
+        api_design=api_design,
+        known=fused_verdicts(fused, "elements"),
     )
     feedback_list = feedback_result["feedback"]
     suggested_missing = feedback_result.get("suggested_missing_tables") or []
@@ -455,6 +775,86 @@ async def validate_data_model(req: ValidateDataModelRequest) -> ValidateDataMode
 
 
 @app.get("/health")
-async def health() -> dict[str, str]:
-    """Simple health check for deployment."""
-    return {"status": "ok"}
+async def health() -> dict[str, Any]:
+    """
+    Health check for deployment. The process is healthy while it serves requests ("ok");
+    "circuits" reports each LLM provider circuit (closed / open / half_open), so an open
+    circuit is visible here while endpoints return degraded stub results. "topic_bundle" summarizes
+    the precomputed reference bundle in use (path, build time, topic count, size; None when there
+    is none).
+    """
+    bundle = reference_cache.bundle.info() if reference_cache.bundle is not None else None
+    return {"status": "ok", "circuits": circuits_snapshot(), "topic_bundle": bundle}
+
+
+@app.get("/metrics")
+async def get_metrics() -> dict[str, dict]:
+    """Per-worker counters (e.g. reference cache hits/misses), timing summaries, per-provider routing
+    state, the share of coverage items settled at each cascade tier, the LLM reply parse success rate
+    and the Mermaid diagram parse error rate."""
+    return {
+        **metrics.snapshot(),
+        "llm_providers": llm_router.snapshot(),
+        "coverage_tiers": coverage_tier_shares(),
+        "llm_parse": parse_stats(),
+        "mermaid_parse": mermaid_parse_stats(),
+    }
+
+
+@app.post("/topics/{topic}/prefetch", response_model=PrefetchResponse, status_code=202)
+async def prefetch_topic(topic: str) -> PrefetchResponse:
+    """
+    Start generating the topic-only references of the later stages (APIs, diagram, estimation,
+    data model) in the background so their submits only pay for coverage. Returns immediately.
+    """
+    resolution = topic_index.resolve(topic)
+    scheduled = topic_prefetcher.schedule(resolution.canonical)
+    return PrefetchResponse(
+        topic=resolution.canonical,
+        scheduled=scheduled,
+        stages=list(topic_prefetcher.stages),
+        topicResolution=resolution,
+    )
+
+
+def _require_admin(token: str | None) -> None:
+    expected = os.getenv("ADMIN_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN not set)")
+    if not token or not secrets.compare_digest(token, expected):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+@app.delete("/admin/reference-cache", response_model=InvalidateReferenceCacheResponse)
+async def invalidate_reference_cache(
+    topic: str | None = None,
+    kind: str | None = None,
+    x_admin_token: str | None = Header(default=None),
+) -> InvalidateReferenceCacheResponse:
+    """
+    Drop cached reference artifacts for a topic and/or kind (requirements, apis, diagram,
+    estimation, data_model); everything when neither is given. Requires X-Admin-Token.
+    """
+    _require_admin(x_admin_token)
+    removed = await reference_cache.invalidate(topic=topic, kind=kind)
+    return InvalidateReferenceCacheResponse(removed=removed)
+
+
+@app.get("/admin/topics", response_model=dict[str, TopicAliases])
+async def list_topics(x_admin_token: str | None = Header(default=None)) -> dict[str, TopicAliases]:
+    """Canonical topics (by topic id) with their aliases. Requires X-Admin-Token."""
+    _require_admin(x_admin_token)
+    return {topic_id: TopicAliases(**entry) for topic_id, entry in topic_index.table().items()}
+
+
+@app.put("/admin/topics/{topic_id}", response_model=TopicAliases)
+async def put_topic(
+    topic_id: str, body: TopicAliases, x_admin_token: str | None = Header(default=None)
+) -> TopicAliases:
+    """
+    Add or replace a canonical topic and its aliases (saved to TOPIC_ALIASES_PATH). Topics that
+    resolve to it share reference caches from then on. Requires X-Admin-Token.
+    """
+    _require_admin(x_admin_token)
+    topic_index.set_topic(topic_id, body.name, body.aliases)
+    return TopicAliases(**topic_index.table()[topic_id])
@@ -0,0 +1,294 @@
+"""Local validation and repair of LLM Mermaid flowcharts, before any render attempt.
+
+check_mermaid(source) parses the flowchart syntax our prompts ask for, line by line: a
+flowchart/graph header, node ids and shapes (brackets must match, labels with brackets or
+parentheses must be quoted), arrows (with optional |text| or -- text --> labels), `&` groups,
+subgraph/end balance and the styling statements (classDef, class, style, linkStyle, click), and
+raises InvalidMermaid naming the first bad line. Other diagram types are rejected: we never prompt
+for them, and they are not worth a render round trip.
+
+repair_mermaid(source) fixes what models commonly get wrong: markdown fences around (or around
+part of) the block, literal "\\n" escapes, a missing header, spaces in node ids
+(`API Server --> DB` -> `API_Server --> DB`), unquoted labels containing brackets or parentheses
+(`C[Cache (Redis)]` -> `C["Cache (Redis)"]`), and unbalanced subgraph/end. clean_mermaid(kind, raw)
+returns the repaired source and counts the outcome per prompt kind (ok / repaired / failed);
+the parse error rate is reported on /metrics. Renderers are only called for sources that parse.
+"""
+
+import re
+import threading
+from collections import defaultdict
+
+from app import metrics
+
+_FENCED = re.compile(r"```[ \t]*(?:mermaid)?[ \t]*\n?(.*?)(?:```|$)", re.DOTALL | re.IGNORECASE)
+_HEADER = re.compile(r"^(?:flowchart|graph)(?:\s+(?:TB|TD|BT|LR|RL))?$", re.IGNORECASE)
+_OTHER_DIAGRAM = re.compile(
+    r"^(?:sequenceDiagram|classDiagram|stateDiagram(?:-v2)?|erDiagram|gantt|journey|pie|mindmap|gitGraph|timeline)\b"
+)
+_ID = re.compile(r"[A-Za-z0-9_]+")
+_SPACED_ID = re.compile(r"[ \t]+([A-Za-z0-9_]+)")
+_CLASS_SUFFIX = re.compile(r":::[A-Za-z0-9_-]+")
+_ARROW = re.compile(
+    r"(?:--[ \t]+[^-|>\s][^|>]*?[ \t]+-->"  # A -- text --> B
+    r"|==[ \t]+[^=|>\s][^|>]*?[ \t]+==>"
+    r"|-\.[ \t]+[^.|>\s][^|>]*?[ \t]+\.->"
+    r"|<?(?:-{2,}[>xo]?|={2,}[>xo]?|-\.+-[>xo]?))"
+    r"(?:[ \t]*\|[^|\n]*\|)?"
+)
+# Node shapes, longest opener first: (opener, closer).
+_SHAPES = (
+    ("[(", ")]"),
+    ("([", "])"),
+    ("[[", "]]"),
+    ("((", "))"),
+    ("{{", "}}"),
+    ("[/", "/]"),
+    ("[\\", "\\]"),
+    ("[", "]"),
+    ("(", ")"),
+    ("{", "}"),
+    (">", "]"),
+)
+_LABEL_SPECIALS = set('[](){}"')
+_STYLE_STATEMENT = re.compile(r"^(?:classDef|class|style|linkStyle|click)\s+\S")
+_SUBGRAPH = re.compile(r"^subgraph\s+(.+)$")
+_DIRECTION = re.compile(r"^direction\s+(?:TB|TD|BT|LR|RL)$", re.IGNORECASE)
+
+_lock = threading.Lock()
+_outcomes: dict[str, dict[str, int]] = defaultdict(lambda: {"ok": 0, "repaired": 0, "failed": 0})
+
+
+class InvalidMermaid(ValueError):
+    """The source is not a flowchart in the syntax we prompt for."""
+
+
+def strip_fences(raw: str) -> str:
+    """Content of the first markdown fence if there is one, else the text; literal \\n unescaped."""
+    s = (raw or "").strip()
+    if "\n" not in s and "\\n" in s:
+        s = s.replace("\\n", "\n")
+    if "```" in s:
+        m = _FENCED.search(s)
+        if m:
+            s = m.group(1)
+    return s.strip()
+
+
+def _label(text: str, i: int, closer: str, repair: bool) -> tuple[str, int]:
+    """Parse a label starting at i up to closer; returns (label as written back, index after closer)."""
+    if text.startswith('"', i):
+        end = text.find('"', i + 1)
+        if end < 0:
+            raise InvalidMermaid("unterminated quoted label")
+        if not text.startswith(closer, end + 1):
+            raise InvalidMermaid(f"expected {closer!r} after quoted label")
+        return text[i : end + 1], end + 1 + len(closer)
+    # Unquoted: the label runs to the last closer before the next arrow, '&' or the end, so
+    # `C[Cache (Redis)]` is read as one label rather than stopping at the first ')'.
+    boundary = len(text)
+    for m in _ARROW.finditer(text, i):
+        before = text[: m.start()].rstrip()
+        if before.endswith(closer):
+            boundary = m.start()
+            break
+    amp = text.find("&", i)
+    if 0 <= amp < boundary and text[:amp].rstrip().endswith(closer):
+        boundary = amp
+    end = text.rfind(closer, i, boundary)
+    if end < 0:
+        raise InvalidMermaid(f"missing {closer!r}")
+    label = text[i:end]
+    if _LABEL_SPECIALS & set(label):
+        if not repair:
+            raise InvalidMermaid(f"label {label!r} needs quotes (it contains brackets or quotes)")
+        label = '"' + label.replace('"', "#quot;") + '"'
+    return label, end + len(closer)
+
+
+def _node(text: str, i: int, repair: bool) -> tuple[str, int]:
+    """Parse a node reference at i; returns (normalized text, index after it)."""
+    m = _ID.match(text, i)
+    if not m:
+        raise InvalidMermaid(f"expected a node id at {text[i:i + 20]!r}")
+    node_id, i = m.group(0), m.end()
+    # Spaces inside an id: another word follows instead of a shape, arrow, '&' or the end.
+    while (spaced := _SPACED_ID.match(text, i)) and not _ARROW.match(text, spaced.start(1)):
+        if not repair:
+            raise InvalidMermaid(f"node id {node_id + spaced.group(0)!r} contains spaces")
+        node_id, i = f"{node_id}_{spaced.group(1)}", spaced.end()
+    if node_id == "end":
+        raise InvalidMermaid("'end' cannot be used as a node id")
+    out = node_id
+    for opener, closer in _SHAPES:
+        if text.startswith(opener, i):
+            label, i = _label(text, i + len(opener), closer, repair)
+            out += f"{opener}{label}{closer}"
+            break
+    suffix = _CLASS_SUFFIX.match(text, i)
+    if suffix:
+        out += suffix.group(0)
+        i = suffix.end()
+    return out, i
+
+
+def _skip_space(text: str, i: int) -> int:
+    while i < len(text) and text[i] in " \t":
+        i += 1
+    return i
+
+
+def _chain(statement: str, repair: bool) -> str:
+    """Validate (and with repair, normalize) `A[x] --> B & C -->|y| D`."""
+    out: list[str] = []
+    i = _skip_space(statement, 0)
+    while True:
+        node, i = _node(statement, i, repair)
+        out.append(node)
+        i = _skip_space(statement, i)
+        if i >= len(statement):
+            return "".join(out)
+        if statement[i] == "&":
+            out.append(" & ")
+            i = _skip_space(statement, i + 1)
+            continue
+        arrow = _ARROW.match(statement, i)
+        if not arrow:
+            raise InvalidMermaid(f"expected an arrow at {statement[i:i + 20]!r}")
+        out.append(f" {arrow.group(0)} ")
+        i = _skip_space(statement, arrow.end())
+        if i >= len(statement):
+            raise InvalidMermaid("arrow without a target node")
+
+
+def _subgraph_title(title: str, repair: bool) -> str:
+    title = title.strip()
+    if title.startswith('"'):
+        if not (title.endswith('"') and len(title) > 1):
+            raise InvalidMermaid("unterminated quoted subgraph title")
+        return title
+    m = _ID.match(title)
+    if m and title[m.end() :].lstrip().startswith("["):
+        rest = title[m.end() :].lstrip()
+        if not rest.endswith("]"):
+            raise InvalidMermaid(f"missing ']' in subgraph title {title!r}")
+        label, _ = _label(rest, 1, "]", repair)
+        return f"{m.group(0)}[{label}]"
+    if _LABEL_SPECIALS & set(title):
+        if not repair:
+            raise InvalidMermaid(f"subgraph title {title!r} needs quotes")
+        return '"' + title.replace('"', "#quot;") + '"'
+    return title
+
+
+def _process(source: str, repair: bool) -> str:
+    lines = source.splitlines()
+    out: list[str] = []
+    depth = 0
+    header_seen = False
+    for number, line in enumerate(lines, 1):
+        indent = line[: len(line) - len(line.lstrip())]
+        statements = [s.strip() for s in line.split(";")] if '"' not in line else [line.strip()]
+        written: list[str] = []
+        try:
+            for statement in statements:
+                if not statement or statement.startswith("%%"):
+                    if statement:
+                        written.append(statement)
+                    continue
+                if not header_seen:
+                    if _OTHER_DIAGRAM.match(statement):
+                        raise InvalidMermaid(f"unsupported diagram type {statement.split()[0]!r}")
+                    if not _HEADER.match(statement):
+                        if not repair:
+                            raise InvalidMermaid("missing 'flowchart' header")
+                        out.append("flowchart TB")
+                        indent = indent or "  "
+                    else:
+                        header_seen = True
+                        written.append(statement)
+                        continue
+                    header_seen = True
+                if statement == "end":
+                    if depth == 0:
+                        if not repair:
+                            raise InvalidMermaid("'end' without a subgraph")
+                        continue
+                    depth -= 1
+                    written.append(statement)
+                elif _DIRECTION.match(statement) or _STYLE_STATEMENT.match(statement):
+                    written.append(statement)
+                elif m := _SUBGRAPH.match(statement):
+                    written.append(f"subgraph {_subgraph_title(m.group(1), repair)}")
+                    depth += 1
+                else:
+                    written.append(_chain(statement, repair))
+        except InvalidMermaid as e:
+            raise InvalidMermaid(f"line {number}: {e}") from None
+        if written or not line.strip():
+            out.append(indent + "; ".join(written) if written else "")
+    if not header_seen:
+        raise InvalidMermaid("empty diagram")
+    if depth:
+        if not repair:
+            raise InvalidMermaid(f"{depth} subgraph(s) without 'end'")
+        out.extend(["end"] * depth)
+    return "\n".join(out).strip()
+
+
+def check_mermaid(source: str) -> None:
+    """Raise InvalidMermaid (naming the line) unless source is a valid flowchart."""
+    _process(source or "", repair=False)
+
+
+def is_valid_mermaid(source: str) -> bool:
+    try:
+        check_mermaid(source)
+    except InvalidMermaid:
+        return False
+    return True
+
+
+def repair_mermaid(source: str) -> str:
+    """Source with the common LLM mistakes fixed; raises InvalidMermaid if it still does not parse."""
+    repaired = _process(strip_fences(source), repair=True)
+    check_mermaid(repaired)
+    return repaired
+
+
+def _count(kind: str | None, outcome: str) -> None:
+    if kind is None:
+        return
+    with _lock:
+        _outcomes[kind][outcome] += 1
+    metrics.incr(f"mermaid.parse.{outcome}.{kind}")
+
+
+def clean_mermaid(kind: str | None, raw: str) -> str:
+    """Repaired Mermaid for an LLM reply field ("" when empty). A source that cannot be repaired is
+    returned fenceless but otherwise as is (still shown to the user, never rendered). The outcome
+    is counted under kind (not at all for None)."""
+    source = strip_fences(raw)
+    if not source:
+        return ""
+    if is_valid_mermaid(source):
+        _count(kind, "ok")
+        return source
+    try:
+        repaired = repair_mermaid(source)
+    except InvalidMermaid as e:
+        _count(kind, "failed")
+        print(f"[mermaid] {kind}: unrepairable diagram ({e})")
+        return source
+    _count(kind, "repaired")
+    return repaired
+
+
+def mermaid_parse_stats() -> dict[str, dict[str, float]]:
+    """Per prompt kind: ok / repaired / failed counts and the parse error rate (failed share)."""
+    with _lock:
+        return {
+            kind: {**counts, "error_rate": round(counts["failed"] / total, 3)}
+            for kind, counts in _outcomes.items()
+            if (total := sum(counts.values()))
+        }
@@ -0,0 +1,491 @@
+"""In-process renderer for the Mermaid flowchart subset our prompts ask for, to SVG.
+
+Supported: a `flowchart`/`graph` header with direction TB, TD, BT, LR or RL; nodes `id`, `id[Label]`,
+`id["Label"]`, `id(Label)` and `id[(Database)]`; `-->` edges, chained (`A --> B --> C`) and
+declaring nodes inline; `subgraph id[Title]` / `subgraph id` / `subgraph "Title"` ... `end` (nested);
+`direction` lines inside subgraphs (ignored); `%%` comments, `;` separators and `<br>` in labels.
+Anything else (edge labels, other shapes or arrows, styling) raises UnsupportedMermaid, and the
+caller falls back to Kroki.
+
+Layout is a layered (Sugiyama-style) drawing: cycles are broken by reversing DFS back edges, nodes
+are ranked by longest path, edges spanning several ranks get dummy points, each rank is ordered by
+barycenter sweeps (members of a top-level subgraph kept together) and nodes are then pulled
+towards their neighbours without overlapping. Subgraphs are drawn as boxes around their members.
+
+NativeMermaidRenderer runs renders in a process pool (NATIVE_RENDER_WORKERS; 0 = a thread), so a
+large diagram never blocks the event loop.
+"""
+
+import asyncio
+import os
+import re
+from concurrent.futures import Executor, ProcessPoolExecutor
+from html import escape
+
+from app import metrics
+
+NATIVE_RENDER_WORKERS = int(os.getenv("NATIVE_RENDER_WORKERS", "2"))
+
+FONT_SIZE = 14
+CHAR_WIDTH = 7.6  # average glyph width at FONT_SIZE for a sans-serif font
+LINE_HEIGHT = 18
+NODE_PAD_X = 16
+NODE_PAD_Y = 12
+NODE_GAP = 36  # between neighbours in a rank
+RANK_GAP = 64  # between ranks
+CLUSTER_PAD = 14
+CLUSTER_TITLE = 22
+MARGIN = 16
+SWEEPS = 4
+
+_HEADER = re.compile(r"^(flowchart|graph)(?:\s+(TB|TD|BT|LR|RL))?$", re.IGNORECASE)
+_SUBGRAPH = re.compile(r'^subgraph\s+(?:"([^"]*)"|([A-Za-z0-9_]+)\s*(?:\[\s*"?(.*?)"?\s*\])?)$')
+_DIRECTION = re.compile(r"^direction\s+(TB|TD|BT|LR|RL)$", re.IGNORECASE)
+_NODE = re.compile(
+    r'^([A-Za-z0-9_]+)\s*(?:\[\(\s*"?(?P<db>.*?)"?\s*\)\]|\[\s*"?(?P<rect>.*?)"?\s*\]|\(\s*"?(?P<round>.*?)"?\s*\))?$'
+)
+_LABELS = re.compile(r'"[^"]*"|\[[^\]]*\]|\([^)]*\)')
+_BR = re.compile(r"<br\s*/?>", re.IGNORECASE)
+
+
+class UnsupportedMermaid(ValueError):
+    """The source uses Mermaid syntax outside the supported flowchart subset."""
+
+
+class _Node:
+    __slots__ = ("id", "label", "shape", "cluster", "dummy", "width", "height", "rank", "pos", "x", "y")
+
+    def __init__(self, node_id: str, label: str = "", shape: str = "rect", dummy: bool = False) -> None:
+        self.id = node_id
+        self.label = label or node_id
+        self.shape = shape
+        self.cluster: str | None = None
+        self.dummy = dummy
+        self.width = 0.0
+        self.height = 0.0
+        self.rank = 0
+        self.pos = 0.0
+        self.x = 0.0
+        self.y = 0.0
+
+
+class _Cluster:
+    __slots__ = ("id", "title", "parent", "nodes")
+
+    def __init__(self, cluster_id: str, title: str, parent: str | None) -> None:
+        self.id = cluster_id
+        self.title = title
+        self.parent = parent
+        self.nodes: list[str] = []
+
+
+class Flowchart:
+    """Parsed diagram: direction, nodes (in declaration order), edges and subgraphs."""
+
+    def __init__(self) -> None:
+        self.direction = "TB"
+        self.nodes: dict[str, _Node] = {}
+        self.edges: list[tuple[str, str]] = []
+        self.clusters: dict[str, _Cluster] = {}
+
+    def node(self, ref: str, cluster: str | None) -> str:
+        m = _NODE.match(ref.strip())
+        if not m:
+            raise UnsupportedMermaid(f"unsupported node syntax: {ref.strip()!r}")
+        node_id = m.group(1)
+        if node_id == "end" or node_id in self.clusters:
+            raise UnsupportedMermaid(f"{node_id!r} cannot be used as a node id")
+        if m.group("db") is not None:
+            label, shape = m.group("db"), "db"
+        elif m.group("rect") is not None:
+            label, shape = m.group("rect"), "rect"
+        elif m.group("round") is not None:
+            label, shape = m.group("round"), "round"
+        else:
+            label, shape = None, None
+        node = self.nodes.get(node_id)
+        if node is None:
+            node = self.nodes[node_id] = _Node(node_id, label or "", shape or "rect")
+        elif label is not None:
+            node.label, node.shape = label or node_id, shape
+        if node.cluster is None and cluster is not None:
+            node.cluster = cluster
+            self.clusters[cluster].nodes.append(node_id)
+        return node_id
+
+
+def parse(source: str) -> Flowchart:
+    """Parse the supported subset; raises UnsupportedMermaid for anything else."""
+    chart = Flowchart()
+    statements = [s.strip() for line in (source or "").splitlines() for s in line.split(";")]
+    statements = [s for s in statements if s and not s.startswith("%%")]
+    if not statements:
+        raise UnsupportedMermaid("empty diagram")
+    header = _HEADER.match(statements[0])
+    if not header:
+        raise UnsupportedMermaid(f"unsupported diagram type: {statements[0]!r}")
+    chart.direction = (header.group(2) or "TB").upper().replace("TD", "TB")
+    stack: list[str] = []
+    for statement in statements[1:]:
+        if statement == "end":
+            if not stack:
+                raise UnsupportedMermaid("'end' without subgraph")
+            stack.pop()
+            continue
+        if _DIRECTION.match(statement):
+            continue
+        if statement.startswith("subgraph "):
+            m = _SUBGRAPH.match(statement)
+            if not m:
+                raise UnsupportedMermaid(f"unsupported subgraph syntax: {statement!r}")
+            cluster_id = m.group(2) or f"_subgraph{len(chart.clusters)}"
+            if cluster_id in chart.nodes or cluster_id in chart.clusters:
+                raise UnsupportedMermaid(f"duplicate subgraph id {cluster_id!r}")
+            title = m.group(1) if m.group(1) is not None else (m.group(3) or cluster_id)
+            chart.clusters[cluster_id] = _Cluster(cluster_id, title, stack[-1] if stack else None)
+            stack.append(cluster_id)
+            continue
+        cluster = stack[-1] if stack else None
+        parts = statement.split("-->")
+        skeleton = _LABELS.sub("", statement)
+        if any(token in skeleton for token in ("---", "-.", "==", "--x", "--o", "|", "&", ":::")):
+            raise UnsupportedMermaid(f"unsupported edge syntax: {statement!r}")
+        ids = [chart.node(part, cluster) for part in parts]
+        chart.edges.extend(zip(ids, ids[1:]))
+    if stack:
+        raise UnsupportedMermaid("subgraph without 'end'")
+    if not chart.nodes:
+        raise UnsupportedMermaid("diagram has no nodes")
+    return chart
+
+
+def is_supported(source: str) -> bool:
+    try:
+        parse(source)
+    except UnsupportedMermaid:
+        return False
+    return True
+
+
+def _label_lines(label: str) -> list[str]:
+    return [line.strip() for line in _BR.split(label)] or [""]
+
+
+def _top_cluster(chart: Flowchart, cluster: str | None) -> str | None:
+    while cluster is not None and chart.clusters[cluster].parent is not None:
+        cluster = chart.clusters[cluster].parent
+    return cluster
+
+
+def _acyclic(chart: Flowchart) -> list[tuple[str, str, bool]]:
+    """(tail, head, reversed) per edge, with DFS back edges reversed (self-loops dropped)."""
+    succ: dict[str, list[str]] = {n: [] for n in chart.nodes}
+    for a, b in chart.edges:
+        if a != b:
+            succ[a].append(b)
+    state: dict[str, int] = {}
+    back: set[tuple[str, str]] = set()
+    for root in chart.nodes:
+        if root in state:
+            continue
+        state[root] = 1
+        stack = [(root, iter(succ[root]))]
+        while stack:
+            node, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                state[node] = 2
+                stack.pop()
+            elif state.get(child) == 1:
+                back.add((node, child))
+            elif child not in state:
+                state[child] = 1
+                stack.append((child, iter(succ[child])))
+    return [(b, a, True) if (a, b) in back else (a, b, False) for a, b in chart.edges if a != b]
+
+
+def _layout(chart: Flowchart) -> tuple[dict[str, _Node], list[list[str]], float, float]:
+    """Positions (node centers, in TB orientation) plus each original edge's point chain."""
+    horizontal = chart.direction in ("LR", "RL")
+    nodes = dict(chart.nodes)
+    for node in nodes.values():
+        lines = _label_lines(node.label)
+        w = max(len(line) for line in lines) * CHAR_WIDTH + 2 * NODE_PAD_X
+        h = len(lines) * LINE_HEIGHT + 2 * NODE_PAD_Y + (10 if node.shape == "db" else 0)
+        # Layout runs top-to-bottom; for LR the extents along and across ranks swap.
+        node.width, node.height = (h, w) if horizontal else (w, h)
+
+    edges = _acyclic(chart)
+    preds: dict[str, list[str]] = {n: [] for n in nodes}
+    for a, b, _ in edges:
+        preds[b].append(a)
+    ranked: dict[str, int] = {}
+
+    def rank_of(n: str) -> int:
+        stack = [n]
+        while stack:
+            cur = stack[-1]
+            pending = [p for p in preds[cur] if p not in ranked]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            ranked[cur] = max((ranked[p] + 1 for p in preds[cur]), default=0)
+        return ranked[n]
+
+    for n in nodes:
+        nodes[n].rank = rank_of(n)
+
+    # Split long edges with dummy nodes so every segment joins adjacent ranks.
+    chains: list[list[str]] = []
+    segments: list[tuple[str, str]] = []
+    for index, (a, b, reverse) in enumerate(edges):
+        chain = [a]
+        for r in range(nodes[a].rank + 1, nodes[b].rank):
+            dummy = _Node(f"_d{index}_{r}", dummy=True)
+            dummy.rank, dummy.width, dummy.height = r, 8.0, 8.0
+            nodes[dummy.id] = dummy
+            chain.append(dummy.id)
+        chain.append(b)
+        segments.extend(zip(chain, chain[1:]))
+        chains.append(chain[::-1] if reverse else chain)
+
+    ranks: list[list[str]] = [[] for _ in range(max(n.rank for n in nodes.values()) + 1)]
+    for n in nodes:  # declaration order is the initial order
+        ranks[nodes[n].rank].append(n)
+    up: dict[str, list[str]] = {n: [] for n in nodes}
+    down: dict[str, list[str]] = {n: [] for n in nodes}
+    for a, b in segments:
+        down[a].append(b)
+        up[b].append(a)
+
+    def reorder(layer: list[str], neighbours: dict[str, list[str]]) -> list[str]:
+        index = {n: i for i, n in enumerate(layer)}
+        bary = {}
+        for n in layer:
+            ns = neighbours[n]
+            bary[n] = sum(nodes[m].pos for m in ns) / len(ns) if ns else float(index[n])
+        group_of = {n: _top_cluster(chart, nodes[n].cluster) or f"_solo_{n}" for n in layer}
+        members: dict[str, list[str]] = {}
+        for n in layer:
+            members.setdefault(group_of[n], []).append(n)
+        group_bary = {g: sum(bary[m] for m in ms) / len(ms) for g, ms in members.items()}
+        return sorted(layer, key=lambda n: (group_bary[group_of[n]], bary[n], index[n]))
+
+    def number(layer: list[str]) -> None:
+        for i, n in enumerate(layer):
+            nodes[n].pos = float(i)
+
+    for layer in ranks:
+        number(layer)
+    for sweep in range(SWEEPS):
+        if sweep % 2 == 0:
+            for r in range(1, len(ranks)):
+                ranks[r] = reorder(ranks[r], up)
+                number(ranks[r])
+        else:
+            for r in range(len(ranks) - 2, -1, -1):
+                ranks[r] = reorder(ranks[r], down)
+                number(ranks[r])
+
+    # Coordinates: pack each rank, then pull nodes towards their neighbours' mean without overlap.
+    y = 0.0
+    for layer in ranks:
+        x = 0.0
+        height = max(nodes[n].height for n in layer)
+        for n in layer:
+            nodes[n].x = x + nodes[n].width / 2
+            nodes[n].y = y + height / 2
+            x += nodes[n].width + NODE_GAP
+        y += height + RANK_GAP
+    widest = max(sum(nodes[n].width for n in layer) + NODE_GAP * (len(layer) - 1) for layer in ranks)
+    for layer in ranks:
+        used = sum(nodes[n].width for n in layer) + NODE_GAP * (len(layer) - 1)
+        for n in layer:
+            nodes[n].x += (widest - used) / 2
+    for sweep in range(SWEEPS):
+        order = range(1, len(ranks)) if sweep % 2 == 0 else range(len(ranks) - 2, -1, -1)
+        neighbours = up if sweep % 2 == 0 else down
+        for r in order:
+            layer = ranks[r]
+            for n in layer:
+                ns = neighbours[n]
+                if ns:
+                    nodes[n].x = sum(nodes[m].x for m in ns) / len(ns)
+            for left, right in zip(layer, layer[1:]):  # resolve overlaps left to right
+                gap = (nodes[left].width + nodes[right].width) / 2 + NODE_GAP
+                if nodes[right].x - nodes[left].x < gap:
+                    nodes[right].x = nodes[left].x + gap
+    min_x = min(n.x - n.width / 2 for n in nodes.values())
+    for n in nodes.values():
+        n.x -= min_x
+    width = max(n.x + n.width / 2 for n in nodes.values())
+    height = max(n.y + n.height / 2 for n in nodes.values())
+    return nodes, chains, width, height
+
+
+def _orient(chart: Flowchart, nodes: dict[str, _Node], width: float, height: float) -> tuple[float, float]:
+    """Map TB layout coordinates to the chart's direction; returns the drawing size."""
+    direction = chart.direction
+    for n in nodes.values():
+        x, y = n.x, n.y
+        if direction == "BT":
+            y = height - y
+        elif direction in ("LR", "RL"):
+            x, y = (y if direction == "LR" else height - y), x
+            n.width, n.height = n.height, n.width
+        n.x, n.y = x, y
+    return (height, width) if direction in ("LR", "RL") else (width, height)
+
+
+def _cluster_boxes(chart: Flowchart, nodes: dict[str, _Node]) -> list[tuple[_Cluster, float, float, float, float, int]]:
+    """(cluster, x0, y0, x1, y1, depth) for every non-empty subgraph, outermost first."""
+    children: dict[str | None, list[str]] = {}
+    for cid, cluster in chart.clusters.items():
+        children.setdefault(cluster.parent, []).append(cid)
+    boxes: list[tuple[_Cluster, float, float, float, float, int]] = []
+
+    def box(cid: str, depth: int) -> tuple[float, float, float, float] | None:
+        cluster = chart.clusters[cid]
+        extents = [
+            (nodes[n].x - nodes[n].width / 2, nodes[n].y - nodes[n].height / 2,
+             nodes[n].x + nodes[n].width / 2, nodes[n].y + nodes[n].height / 2)
+            for n in cluster.nodes
+        ]
+        slot = len(boxes)
+        boxes.append((cluster, 0.0, 0.0, 0.0, 0.0, depth))
+        for child in children.get(cid, []):
+            inner = box(child, depth + 1)
+            if inner is not None:
+                extents.append(inner)
+        if not extents:
+            boxes.pop(slot)
+            return None
+        x0 = min(e[0] for e in extents) - CLUSTER_PAD
+        y0 = min(e[1] for e in extents) - CLUSTER_PAD - CLUSTER_TITLE
+        x1 = max(e[2] for e in extents) + CLUSTER_PAD
+        y1 = max(e[3] for e in extents) + CLUSTER_PAD
+        boxes[slot] = (cluster, x0, y0, x1, y1, depth)
+        return x0, y0, x1, y1
+
+    for cid in children.get(None, []):
+        box(cid, 0)
+    return boxes
+
+
+def _text(x: float, y: float, lines: list[str], weight: str = "normal") -> str:
+    top = y - (len(lines) - 1) * LINE_HEIGHT / 2
+    spans = "".join(
+        f'<tspan x="{x:.1f}" y="{top + i * LINE_HEIGHT:.1f}">{escape(line)}</tspan>' for i, line in enumerate(lines)
+    )
+    return f'<text text-anchor="middle" dominant-baseline="central" font-weight="{weight}">{spans}</text>'
+
+
+def _boundary(node: _Node, toward: _Node) -> tuple[float, float]:
+    """Point where the segment from node's center toward another point leaves node's box."""
+    dx, dy = toward.x - node.x, toward.y - node.y
+    if node.dummy or (dx == 0 and dy == 0):
+        return node.x, node.y
+    sx = (node.width / 2) / abs(dx) if dx else float("inf")
+    sy = (node.height / 2) / abs(dy) if dy else float("inf")
+    s = min(sx, sy)
+    return node.x + dx * s, node.y + dy * s
+
+
+def render_svg(source: str) -> str:
+    """SVG document for a diagram in the supported subset; raises UnsupportedMermaid otherwise."""
+    chart = parse(source)
+    nodes, chains, width, height = _layout(chart)
+    width, height = _orient(chart, nodes, width, height)
+    boxes = _cluster_boxes(chart, nodes)
+    min_x = min([0.0] + [b[1] for b in boxes])
+    min_y = min([0.0] + [b[2] for b in boxes])
+    max_x = max([width] + [b[3] for b in boxes])
+    max_y = max([height] + [b[4] for b in boxes])
+    view = (min_x - MARGIN, min_y - MARGIN, max_x - min_x + 2 * MARGIN, max_y - min_y + 2 * MARGIN)
+
+    out = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="{view[0]:.1f} {view[1]:.1f} {view[2]:.1f} {view[3]:.1f}" '
+        f'width="{view[2]:.0f}" height="{view[3]:.0f}" font-family="Helvetica, Arial, sans-serif" '
+        f'font-size="{FONT_SIZE}">',
+        '<defs><marker id="arrow" viewBox="0 0 10 10" refX="9" refY="5" markerWidth="8" markerHeight="8" '
+        'orient="auto-start-reverse"><path d="M0,0 L10,5 L0,10 z" fill="#333"/></marker></defs>',
+        f'<rect x="{view[0]:.1f}" y="{view[1]:.1f}" width="{view[2]:.1f}" height="{view[3]:.1f}" fill="#fff"/>',
+    ]
+    for cluster, x0, y0, x1, y1, depth in boxes:
+        fill = "#f4f6fb" if depth % 2 == 0 else "#e9edf7"
+        out.append(
+            f'<g class="cluster"><rect x="{x0:.1f}" y="{y0:.1f}" width="{x1 - x0:.1f}" height="{y1 - y0:.1f}" '
+            f'rx="6" fill="{fill}" stroke="#9aa5c4"/>'
+            f'{_text((x0 + x1) / 2, y0 + CLUSTER_TITLE / 2 + 4, _label_lines(cluster.title), "bold")}</g>'
+        )
+    for chain in chains:
+        points = [nodes[n] for n in chain]
+        start = _boundary(points[0], points[1])
+        end = _boundary(points[-1], points[-2])
+        coords = [start] + [(p.x, p.y) for p in points[1:-1]] + [end]
+        path = " ".join(f"{'M' if i == 0 else 'L'}{x:.1f},{y:.1f}" for i, (x, y) in enumerate(coords))
+        out.append(f'<path class="edge" d="{path}" fill="none" stroke="#333" stroke-width="1.5" marker-end="url(#arrow)"/>')
+    for node in chart.nodes.values():
+        x0, y0 = node.x - node.width / 2, node.y - node.height / 2
+        if node.shape == "db":
+            ry = 6
+            out.append(
+                f'<g class="node db"><path d="M{x0:.1f},{y0 + ry:.1f} '
+                f"a{node.width / 2:.1f},{ry} 0 0,0 {node.width:.1f},0 "
+                f"a{node.width / 2:.1f},{ry} 0 0,0 {-node.width:.1f},0 "
+                f"v{node.height - 2 * ry:.1f} "
+                f"a{node.width / 2:.1f},{ry} 0 0,0 {node.width:.1f},0 "
+                f'v{-(node.height - 2 * ry):.1f}" fill="#fff7e6" stroke="#c48a1a"/>'
+                f"{_text(node.x, node.y + ry / 2, _label_lines(node.label))}</g>"
+            )
+        else:
+            radius = node.height / 2 if node.shape == "round" else 4
+            out.append(
+                f'<g class="node"><rect x="{x0:.1f}" y="{y0:.1f}" width="{node.width:.1f}" height="{node.height:.1f}" '
+                f'rx="{radius:.1f}" fill="#eef4ff" stroke="#4a6fb5"/>{_text(node.x, node.y, _label_lines(node.label))}</g>'
+            )
+    out.append("</svg>")
+    return "".join(out)
+
+
+def _render_bytes(source: str) -> bytes | None:
+    """Worker entry point: SVG bytes, or None for unsupported syntax."""
+    try:
+        return render_svg(source).encode("utf-8")
+    except UnsupportedMermaid:
+        return None
+
+
+class NativeMermaidRenderer:
+    """Renderer (engine, format, source) -> bytes for mermaid/svg, run off the event loop."""
+
+    def __init__(self, workers: int = NATIVE_RENDER_WORKERS) -> None:
+        self.workers = workers
+        self._pool: Executor | None = None
+
+    def _executor(self) -> Executor | None:
+        if self.workers <= 0:
+            return None
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    async def render(self, engine: str, fmt: str, source: str) -> bytes | None:
+        if engine != "mermaid" or fmt != "svg" or not is_supported(source):
+            return None
+        executor = self._executor()
+        if executor is None:
+            svg = await asyncio.to_thread(_render_bytes, source)
+        else:
+            svg = await asyncio.get_running_loop().run_in_executor(executor, _render_bytes, source)
+        metrics.incr("native_render.ok" if svg else "native_render.unsupported")
+        return svg
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+native_mermaid = NativeMermaidRenderer()
@@ -0,0 +1,40 @@
+"""In-process counters and timing summaries (per worker), exposed on GET /metrics."""
+
+import threading
+from collections import defaultdict
+
+_lock = threading.Lock()
+_counters: dict[str, int] = defaultdict(int)
+_timings: dict[str, dict[str, float]] = {}
+
+
+def incr(name: str, value: int = 1) -> None:
+    """Add value to the named counter."""
+    with _lock:
+        _counters[name] += value
+
+
+def observe(name: str, value: float) -> None:
+    """Record one sample (e.g. seconds waited) for the named timing summary."""
+    with _lock:
+        summary = _timings.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+        summary["count"] += 1
+        summary["total"] += value
+        summary["max"] = max(summary["max"], value)
+
+
+def snapshot() -> dict[str, dict]:
+    """Copy of all counters and timing summaries (with mean) for reporting."""
+    with _lock:
+        timings = {
+            name: {**s, "mean": (s["total"] / s["count"]) if s["count"] else 0.0}
+            for name, s in _timings.items()
+        }
+        return {"counters": dict(_counters), "timings": timings}
+
+
+def reset() -> None:
+    """Clear everything (tests)."""
+    with _lock:
+        _counters.clear()
+        _timings.clear()
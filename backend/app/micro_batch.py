@@ -0,0 +1,90 @@
+"""Cross-request micro-batching: concurrent small jobs with the same key share one call.
+
+Jobs are collected per key for up to window_seconds or until max_jobs are queued, then run_batch
+receives the whole list and returns one result (or exception) per job, in order. Each result or
+exception goes only to its own job's waiter, so one bad sub-result does not affect the others.
+The batch runs in a fresh context (no caller's request budget or priority); each caller bounds
+its own wait, and a waiter that gives up simply stops listening for its result.
+"""
+
+import asyncio
+import contextvars
+from typing import Awaitable, Callable, Generic, Hashable, TypeVar
+
+from app import metrics
+
+J = TypeVar("J")
+R = TypeVar("R")
+
+
+class _Pending(Generic[J]):
+    __slots__ = ("jobs", "futures", "timer")
+
+    def __init__(self) -> None:
+        self.jobs: list[J] = []
+        self.futures: list[asyncio.Future] = []
+        self.timer: asyncio.TimerHandle | None = None
+
+
+class MicroBatcher(Generic[J, R]):
+    """Keyed job collector; name is used as the metrics prefix."""
+
+    def __init__(
+        self,
+        name: str,
+        run_batch: Callable[[Hashable, list[J]], Awaitable[list[R | BaseException]]],
+        *,
+        max_jobs: int,
+        window_seconds: float,
+    ) -> None:
+        self.name = name
+        self.run_batch = run_batch
+        self.max_jobs = max(1, max_jobs)
+        self.window_seconds = window_seconds
+        self._pending: dict[Hashable, _Pending[J]] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    async def submit(self, key: Hashable, job: J) -> R:
+        """Queue job under key and wait for its own result (or exception)."""
+        loop = asyncio.get_running_loop()
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = _Pending()
+            pending.timer = loop.call_later(self.window_seconds, self._flush, key)
+        future = loop.create_future()
+        pending.jobs.append(job)
+        pending.futures.append(future)
+        if len(pending.jobs) >= self.max_jobs:
+            self._flush(key)
+        return await future
+
+    def _flush(self, key: Hashable) -> None:
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        if pending.timer is not None:
+            pending.timer.cancel()
+        metrics.observe(f"{self.name}.jobs_per_batch", len(pending.jobs))
+        task = asyncio.get_running_loop().create_task(
+            self._run(key, pending), context=contextvars.Context()
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, key: Hashable, pending: _Pending[J]) -> None:
+        if all(f.done() for f in pending.futures):
+            return  # every waiter already gave up
+        try:
+            results = await self.run_batch(key, pending.jobs)
+        except Exception as exc:
+            results = [exc] * len(pending.jobs)
+        for future, result in zip(pending.futures, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def queued(self) -> int:
+        return sum(len(p.jobs) for p in self._pending.values())
@@ -0,0 +1,161 @@
+"""Offline precompute of reference artifacts for a topic catalog.
+
+    python -m app.precompute topics.txt -o reference_bundle.bin [--concurrency 4] [--fake]
+
+Reads one design topic per line (blank lines and # comments are skipped; topics are mapped to
+their canonical names by app.topic_index), generates every per-topic reference artifact
+(app.llm.topic_artifacts) through the configured LLM providers and writes them, keyed like the
+reference cache, into a memory-mapped topic bundle (app.topic_bundle).
+The server loads the bundle at startup from TOPIC_BUNDLE_PATH and serves catalog topics from it
+without any LLM call.
+
+Progress is appended to <out>.partial.jsonl as artifacts complete, so an interrupted run resumes
+where it stopped; entries already in an existing bundle at <out> are reused too (--no-resume
+rebuilds everything). Failed artifacts are reported and left out; the exit code is then 1.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any
+
+from app import llm
+from app.reference_cache import TOPIC_BUNDLE_PATH, ReferenceCache, normalize_topic
+from app.topic_bundle import BundleFormatError, TopicBundle, write_bundle
+from app.topic_index import topic_index
+
+DEFAULT_CONCURRENCY = 4
+
+
+def read_topics(path: str) -> list[str]:
+    """Canonical topics (app.topic_index) from a catalog file, in order, without blanks, comments
+    or duplicates, so the bundle is keyed like the topics the server resolves requests to."""
+    topics: list[str] = []
+    seen: set[str] = set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            topic = topic_index.resolve(line).canonical
+            key = normalize_topic(topic)
+            if key not in seen:
+                seen.add(key)
+                topics.append(topic)
+    return topics
+
+
+def _load_existing(out: str) -> dict[str, Any]:
+    """Entries from a previous bundle at out and from the partial-progress sidecar."""
+    entries: dict[str, Any] = {}
+    if os.path.exists(out):
+        try:
+            bundle = TopicBundle(out)
+        except (OSError, BundleFormatError) as e:
+            print(f"Not reusing {out}: {e}")
+        else:
+            entries.update((key, bundle.get(key)) for key in bundle.keys())
+            bundle.close()
+    partial = f"{out}.partial.jsonl"
+    if os.path.exists(partial):
+        with open(partial, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # torn last line of an interrupted run
+                entries[record["key"]] = record["value"]
+    return entries
+
+
+async def run(
+    topics: list[str], out: str, *, concurrency: int = DEFAULT_CONCURRENCY, resume: bool = True, version: str = ""
+) -> dict[str, Any]:
+    """Build the bundle at out for topics. Returns a summary: computed / reused / failed counts
+    and the failed (kind, topic) pairs."""
+    artifacts = llm.topic_artifacts()
+    entries = _load_existing(out) if resume else {}
+    partial_path = f"{out}.partial.jsonl"
+    if not resume and os.path.exists(partial_path):
+        os.remove(partial_path)
+    wanted: dict[str, tuple[str, str]] = {}
+    for topic in topics:
+        for kind, (inputs, _) in artifacts.items():
+            wanted[ReferenceCache.make_key(kind, topic, inputs)] = (kind, topic)
+    pending = [(key, kind, topic) for key, (kind, topic) in wanted.items() if key not in entries]
+    reused = len(wanted) - len(pending)
+    failed: list[tuple[str, str]] = []
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    started = time.monotonic()
+
+    with open(partial_path, "a", encoding="utf-8") as partial:
+
+        async def compute(key: str, kind: str, topic: str) -> None:
+            async with semaphore:
+                try:
+                    value = await artifacts[kind][1](topic)
+                except Exception as e:
+                    print(f"precompute {kind} for {topic!r} failed: {e}")
+                    value = None
+            if value is None:
+                failed.append((kind, topic))
+                return
+            entries[key] = value
+            partial.write(json.dumps({"key": key, "value": value}, ensure_ascii=False) + "\n")
+            partial.flush()
+
+        await asyncio.gather(*(compute(key, kind, topic) for key, kind, topic in pending))
+
+    meta = {
+        "version": version,
+        "providers": [p.name for p in llm.llm_router.configured()],
+        "topics": topics,
+        "kinds": sorted(artifacts),
+    }
+    write_bundle(out, {key: entries[key] for key in wanted if key in entries}, meta)
+    if not failed:
+        os.remove(partial_path)
+    summary = {
+        "computed": len(pending) - len(failed),
+        "reused": reused,
+        "failed": len(failed),
+        "failures": failed,
+        "seconds": round(time.monotonic() - started, 2),
+    }
+    print(
+        f"Wrote {out}: {len(topics)} topics, {summary['computed']} computed, {reused} reused, "
+        f"{len(failed)} failed in {summary['seconds']}s"
+    )
+    return summary
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.precompute", description=__doc__.split("\n\n")[0])
+    parser.add_argument("topics", help="catalog file, one design topic per line")
+    parser.add_argument("-o", "--out", default=TOPIC_BUNDLE_PATH, help="bundle file to write")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="artifacts generated at once")
+    parser.add_argument("--version", default="", help="label stored in the bundle metadata (e.g. a git sha)")
+    parser.add_argument("--fake", action="store_true", help="use the deterministic fake provider (no API keys)")
+    parser.add_argument("--no-resume", action="store_true", help="ignore previous progress and rebuild")
+    args = parser.parse_args(argv)
+
+    if args.fake:
+        llm.llm_router = llm.LLMRouter([llm.FakeProvider(llm._fake_completion)])
+    if not llm.llm_available():
+        print("No LLM provider configured (set OPENAI_API_KEY and/or ANTHROPIC_API_KEY, or pass --fake)")
+        return 2
+    topics = read_topics(args.topics)
+    if not topics:
+        print(f"No topics in {args.topics}")
+        return 2
+    summary = asyncio.run(
+        run(topics, args.out, concurrency=args.concurrency, resume=not args.no_resume, version=args.version)
+    )
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
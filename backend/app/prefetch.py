@@ -0,0 +1,120 @@
+"""Background warm-up of later-stage references for a topic.
+
+A user works through requirements, API design, diagram, estimation and data model for the same
+topic, so once a topic session starts (POST /validate, or POST /topics/{topic}/prefetch) the
+topic-only references of those later stages are generated in the background and land in the
+reference cache. The stage submits then find them cached (or join the in-flight generation
+through the cache's single-flight) and only pay for coverage.
+
+Prefetch runs at Priority.BACKGROUND in a fresh context (no request budget), at most
+PREFETCH_CONCURRENCY stage generations at a time, for at most PREFETCH_MAX_TOPICS topics at
+once; further topics are dropped rather than queued. Only references the stage endpoints look up
+by topic alone are prefetched: the suggested diagram and both data-model references are keyed by
+the user's API design (which the diagram and data-model pages always send), so warming them per
+topic would only spend LLM calls. Prefetch on POST /validate is opt-in (PREFETCH_ON_VALIDATE=1).
+"""
+
+import asyncio
+import contextvars
+import os
+import time
+from typing import Any, Awaitable, Callable
+
+from app import metrics
+from app.llm import (
+    call_llm_apis_1,
+    call_llm_apis_2,
+    call_llm_diagram_2,
+    call_llm_estimation_1,
+    call_llm_estimation_2,
+    llm_available,
+)
+from app.llm_scheduler import Priority, llm_priority
+from app.reference_cache import normalize_topic
+
+PREFETCH_ON_VALIDATE = os.getenv("PREFETCH_ON_VALIDATE", "0") == "1"
+PREFETCH_MAX_TOPICS = int(os.getenv("PREFETCH_MAX_TOPICS", "8"))
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "2"))
+
+# Stage name -> reference call keyed by topic alone, as the stage endpoints make it (each goes
+# through the reference cache).
+STAGES: dict[str, Callable[[str], Awaitable[Any]]] = {
+    "apis": call_llm_apis_1,
+    "apis_2": call_llm_apis_2,
+    "diagram_2": call_llm_diagram_2,
+    "estimation": call_llm_estimation_1,
+    "estimation_2": call_llm_estimation_2,
+}
+
+
+class TopicPrefetcher:
+    """Bounded set of per-topic background warm-ups, deduplicated by normalized topic."""
+
+    def __init__(
+        self,
+        stages: dict[str, Callable[[str], Awaitable[Any]]],
+        *,
+        max_topics: int = PREFETCH_MAX_TOPICS,
+        concurrency: int = PREFETCH_CONCURRENCY,
+    ) -> None:
+        self.stages = stages
+        self.max_topics = max_topics
+        self.concurrency = concurrency
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._semaphore: asyncio.Semaphore | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def in_flight(self) -> list[str]:
+        return list(self._tasks)
+
+    def schedule(self, topic: str) -> bool:
+        """Start warming topic's later stages; False when no provider is configured, the topic is
+        already being prefetched or too many topics are in flight."""
+        key = normalize_topic(topic)
+        if not llm_available():
+            return False
+        if key in self._tasks:
+            metrics.incr("prefetch.skipped.in_flight")
+            return False
+        if len(self._tasks) >= self.max_topics:
+            metrics.incr("prefetch.dropped")
+            return False
+        metrics.incr("prefetch.scheduled")
+        # Fresh context: the warm-up must not inherit (or be cancelled by) the request's budget.
+        task = asyncio.create_task(self._run(key, topic), context=contextvars.Context())
+        self._tasks[key] = task
+        return True
+
+    async def _run(self, key: str, topic: str) -> None:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore, self._loop = asyncio.Semaphore(max(1, self.concurrency)), loop
+        semaphore = self._semaphore
+        started = time.monotonic()
+
+        async def stage(name: str, call: Callable[[str], Awaitable[Any]]) -> None:
+            async with semaphore:
+                try:
+                    await call(topic)
+                    metrics.incr(f"prefetch.stage.{name}")
+                except Exception as e:
+                    metrics.incr("prefetch.stage_failed")
+                    print(f"prefetch {name} for {topic!r} failed: {e}")
+
+        try:
+            with llm_priority(Priority.BACKGROUND):
+                await asyncio.gather(*(stage(name, call) for name, call in self.stages.items()))
+            metrics.observe("prefetch.seconds", time.monotonic() - started)
+        finally:
+            self._tasks.pop(key, None)
+
+    async def close(self) -> None:
+        """Cancel warm-ups still running (shutdown)."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+
+topic_prefetcher = TopicPrefetcher(STAGES)
@@ -0,0 +1,202 @@
+"""Token-budgeted prompt assembly.
+
+count_tokens uses tiktoken (o200k_base, the gpt-4o family encoding) when it is installed and a
+word/punctuation approximation otherwise. PromptBuilder collects titled sections, each with a
+priority (0 = most important). When the assembled prompt exceeds the kind's budget, sections are
+shrunk least important first: near-duplicate lines are removed, long lines are compacted
+extractively (their most informative sentences are kept, in order) and, if that is not enough,
+trailing lines are dropped with a "(N more)" marker. Priority-0 sections are never shrunk.
+
+Budgets are in tokens per prompt kind (PROMPT_BUDGET_<KIND>, e.g. PROMPT_BUDGET_DETAILED_DIAGRAM).
+The final size of every built prompt is recorded as prompt.tokens.<kind>.
+"""
+
+import math
+import os
+import re
+from collections import Counter
+from typing import Any
+
+from app import metrics
+from app.similarity import tokenize
+
+DEFAULT_PROMPT_BUDGET = int(os.getenv("PROMPT_BUDGET_DEFAULT", "4000"))
+_DEFAULT_BUDGETS = {"detailed_diagram": 3000, "deep_dives": 2500, "deep_dive_item": 800, "flow": 1500}
+# Lines whose content words overlap at least this much (Jaccard) with an earlier line are dropped.
+DUPLICATE_JACCARD = 0.8
+# Compaction never shrinks a line below this many tokens.
+MIN_LINE_TOKENS = 24
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?;])\s+|\n+")
+_WORD_OR_PUNCT = re.compile(r"\w+|[^\w\s]")
+
+_encoding: Any = None
+_encoding_loaded = False
+
+
+def prompt_budget(kind: str) -> int:
+    """Token budget for a prompt kind."""
+    default = _DEFAULT_BUDGETS.get(kind, DEFAULT_PROMPT_BUDGET)
+    return int(os.getenv(f"PROMPT_BUDGET_{kind.upper()}", str(default)))
+
+
+def _get_encoding() -> Any:
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:  # not installed, or the encoding file cannot be fetched
+            _encoding = None
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Tokens in text (tiktoken if available, else ~1 token per 4 characters of each word)."""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return sum(max(1, math.ceil(len(w) / 4)) for w in _WORD_OR_PUNCT.findall(text))
+
+
+def _truncate_words(text: str, max_tokens: int) -> str:
+    """Longest word prefix of text within max_tokens, with an ellipsis."""
+    words = text.split()
+    lo, hi = 0, len(words)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(" ".join(words[:mid]) + " …") <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return " ".join(words[:lo]) + " …" if lo else ""
+
+
+def compact_text(text: str, max_tokens: int, query: str = "") -> str:
+    """Extractive compaction: keep the most informative sentences of text (in their original
+    order) within max_tokens. Sentences score by how many of the text's recurring content words
+    they contain, plus words shared with query (e.g. the topic); the first sentence gets a bonus.
+    Repeated sentences and sentences unrelated to everything else are left out."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    sentences = [s.strip() for s in _SENTENCE_SPLIT.split(text) if s.strip()]
+    if len(sentences) <= 1:
+        return _truncate_words(text, max_tokens)
+    words = [set(tokenize(s)) for s in sentences]
+    frequency = Counter(w for ws in words for w in ws)
+    query_words = set(tokenize(query))
+
+    def score(i: int) -> float:
+        ws = words[i]
+        centrality = sum(frequency[w] - 1 for w in ws) / (len(ws) + 1)
+        return centrality + 2.0 * len(ws & query_words) + (1.0 if i == 0 else 0.0)
+
+    chosen: set[int] = set()
+    used = 0
+    for i in sorted(range(len(sentences)), key=score, reverse=True):
+        if chosen and score(i) <= 0:
+            break  # nothing in common with the rest of the text or the query
+        if _near_duplicate(words[i], [words[j] for j in chosen]):
+            continue
+        cost = count_tokens(sentences[i]) + 1
+        if used + cost <= max_tokens:
+            chosen.add(i)
+            used += cost
+    if not chosen:
+        return _truncate_words(sentences[0], max_tokens)
+    return " ".join(sentences[i] for i in sorted(chosen))
+
+
+def _near_duplicate(words: set[str], seen: list[set[str]]) -> bool:
+    return bool(words) and any(len(words & s) / len(words | s) >= DUPLICATE_JACCARD for s in seen)
+
+
+class _Section:
+    __slots__ = ("title", "lines", "priority", "empty")
+
+    def __init__(self, title: str, lines: list[str], priority: int, empty: str) -> None:
+        self.title = title
+        self.lines = lines
+        self.priority = priority
+        self.empty = empty
+
+    def render(self) -> str:
+        body = "\n".join(self.lines) if self.lines else self.empty
+        return f"{self.title}:\n{body}"
+
+
+class PromptBuilder:
+    """Assemble a user prompt from prioritized sections within the kind's token budget.
+    query (e.g. the design topic) steers which sentences compaction keeps."""
+
+    def __init__(
+        self, kind: str, *, header: str = "", footer: str = "", query: str = "", budget: int | None = None
+    ) -> None:
+        self.kind = kind
+        self.header = header
+        self.footer = footer
+        self.query = query
+        self.budget = prompt_budget(kind) if budget is None else budget
+        self.tokens = 0
+        self._sections: list[_Section] = []
+
+    def section(
+        self, title: str, content: str | list[str], *, priority: int, empty: str = "(None provided.)"
+    ) -> None:
+        """Add a section (rendered in insertion order); content is text (one item per line) or a list of lines."""
+        lines = content.splitlines() if isinstance(content, str) else list(content)
+        self._sections.append(_Section(title, [line.rstrip() for line in lines if line.strip()], priority, empty))
+
+    def _render(self) -> str:
+        parts = [self.header, *(s.render() for s in self._sections), self.footer]
+        return "\n\n".join(p for p in parts if p)
+
+    def _dedupe(self) -> None:
+        """Drop near-duplicate lines, keeping the copy in the more important section."""
+        seen: list[set[str]] = []
+        for section in sorted(self._sections, key=lambda s: s.priority):
+            kept = []
+            for line in section.lines:
+                words = set(tokenize(line))
+                if section.priority > 0 and _near_duplicate(words, seen):
+                    continue
+                seen.append(words)
+                kept.append(line)
+            section.lines = kept
+
+    def _shrink(self, section: _Section, target: int) -> None:
+        """Compact section's lines to fit about target tokens, then drop trailing lines if needed."""
+        if not section.lines:
+            return
+        per_line = max(MIN_LINE_TOKENS, target // len(section.lines))
+        section.lines = [compact_text(line, per_line, self.query) for line in section.lines]
+        dropped = 0
+        while len(section.lines) > 1 and count_tokens(section.render()) > target:
+            section.lines.pop()
+            dropped += 1
+        if dropped:
+            section.lines.append(f"(… {dropped} more omitted)")
+
+    def build(self) -> str:
+        """The prompt text; self.tokens holds its token count."""
+        text = self._render()
+        tokens = count_tokens(text)
+        if tokens > self.budget:
+            metrics.incr(f"prompt.compacted.{self.kind}")
+            self._dedupe()
+            text = self._render()
+            tokens = count_tokens(text)
+            for section in sorted(self._sections, key=lambda s: -s.priority):
+                if tokens <= self.budget or section.priority == 0:
+                    break
+                section_tokens = count_tokens(section.render())
+                self._shrink(section, max(0, section_tokens - (tokens - self.budget)))
+                text = self._render()
+                tokens = count_tokens(text)
+        self.tokens = tokens
+        metrics.observe(f"prompt.tokens.{self.kind}", tokens)
+        return text
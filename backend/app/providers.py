@@ -0,0 +1,388 @@
+"""LLM providers behind one interface, plus a latency-aware router with failover.
+
+LLMProvider implementations: OpenAIProvider, AnthropicProvider and FakeProvider (local,
+deterministic; for tests, offline development and precompute dry runs). Each provider has its
+own circuit breaker and scheduler (concurrency / TPM bucket / retries), since rate limits and
+outages are per vendor.
+
+LLMRouter keeps EWMA latency, latency deviation and error rate per provider and sends each call
+to the provider with the best score (approx. p95 weighted by error rate); on failure it fails
+over to the next one. Providers without samples are tried first, and a small fraction of calls
+explores other providers so their statistics stay current. `secondary=True` asks for a different
+provider than the primary choice (the independent second opinion used by the *_2 reference
+generators); it is unavailable when only one provider is configured. `strong=True` runs the call on
+the provider's stronger (slower, pricier) model, used for the escalation tier of the coverage cascade.
+"""
+
+import asyncio
+import os
+import random
+import time
+from typing import Any, AsyncIterator, Callable
+
+from app import metrics
+from app.circuit_breaker import CircuitBreaker, CircuitOpenError, breaker_for
+from app.hedging import hedger
+from app.llm_scheduler import LLM_TOKENS_PER_MINUTE, LLMScheduler, estimate_tokens, is_retryable
+from app.llm_schemas import response_format_for
+
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+OPENAI_STRONG_MODEL = os.getenv("OPENAI_STRONG_MODEL", "gpt-4o")
+ANTHROPIC_MODEL = os.getenv("ANTHROPIC_MODEL", "claude-3-5-haiku-latest")
+ANTHROPIC_STRONG_MODEL = os.getenv("ANTHROPIC_STRONG_MODEL", "claude-3-5-sonnet-latest")
+ANTHROPIC_MAX_TOKENS = int(os.getenv("ANTHROPIC_MAX_TOKENS", "2048"))
+# Providers to route between, in preference order (unconfigured ones, e.g. without an API key, are skipped).
+LLM_PROVIDERS = [p.strip() for p in os.getenv("LLM_PROVIDERS", "openai,anthropic").split(",") if p.strip()]
+ROUTER_EWMA_ALPHA = float(os.getenv("ROUTER_EWMA_ALPHA", "0.2"))
+ROUTER_EXPLORE_RATE = float(os.getenv("ROUTER_EXPLORE_RATE", "0.05"))
+# Score multiplier per unit of error rate (0.5 error rate with penalty 4 -> 3x the latency score).
+ROUTER_ERROR_PENALTY = 4.0
+
+
+class LLMProvider:
+    """One vendor with a default model and an optional stronger one. Subclasses implement
+    complete_json and stream_json."""
+
+    name = "provider"
+
+    def __init__(self, model: str, strong_model: str | None = None) -> None:
+        self.model = model
+        self.strong_model = strong_model or model
+        self.breaker: CircuitBreaker = breaker_for(self.name, model)
+        self.strong_breaker: CircuitBreaker = (
+            breaker_for(self.name, self.strong_model) if self.strong_model != model else self.breaker
+        )
+        self.scheduler = LLMScheduler(
+            tokens_per_minute=int(os.getenv(f"{self.name.upper()}_TOKENS_PER_MINUTE", str(LLM_TOKENS_PER_MINUTE)))
+        )
+
+    def available(self) -> bool:
+        """True when the provider is configured (e.g. has an API key)."""
+        return True
+
+    async def complete_json(
+        self, kind: str, system_prompt: str, user_content: str, *, model: str | None = None
+    ) -> tuple[str | None, int | None]:
+        """One JSON-only completion on model (default: self.model); returns (content, total tokens used
+        if reported). kind names the prompt (e.g. "requirements"); real providers only use it for bookkeeping."""
+        raise NotImplementedError
+
+    def stream_json(self, kind: str, system_prompt: str, user_content: str) -> AsyncIterator[str]:
+        """Streaming JSON-only completion; yields content deltas."""
+        raise NotImplementedError
+
+
+class OpenAIProvider(LLMProvider):
+    """OpenAI Chat Completions with structured outputs (the kind's JSON schema, see app.llm_schemas)."""
+
+    name = "openai"
+
+    def __init__(
+        self,
+        model: str,
+        *,
+        client: Callable[[], Any],
+        api_key: Callable[[], str | None],
+        strong_model: str | None = None,
+    ) -> None:
+        super().__init__(model, strong_model)
+        # Resolved on every call so the shared client (and tests) can swap them.
+        self._client = client
+        self._api_key = api_key
+
+    def available(self) -> bool:
+        return bool(self._api_key())
+
+    def _messages(self, system_prompt: str, user_content: str) -> list[dict[str, str]]:
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_content},
+        ]
+
+    async def complete_json(
+        self, kind: str, system_prompt: str, user_content: str, *, model: str | None = None
+    ) -> tuple[str | None, int | None]:
+        response = await self._client().chat.completions.create(
+            model=model or self.model,
+            messages=self._messages(system_prompt, user_content),
+            response_format=response_format_for(kind),
+        )
+        usage = getattr(getattr(response, "usage", None), "total_tokens", None)
+        return response.choices[0].message.content, usage if isinstance(usage, int) else None
+
+    async def stream_json(self, kind: str, system_prompt: str, user_content: str) -> AsyncIterator[str]:
+        stream = await self._client().chat.completions.create(
+            model=self.model,
+            messages=self._messages(system_prompt, user_content),
+            response_format=response_format_for(kind),
+            stream=True,
+        )
+        try:
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    yield delta
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                await close()
+
+
+class AnthropicProvider(LLMProvider):
+    """Anthropic Messages API. JSON output is enforced by prefilling the assistant turn with "{"."""
+
+    name = "anthropic"
+
+    def __init__(
+        self,
+        model: str,
+        *,
+        client: Callable[[], Any],
+        api_key: Callable[[], str | None],
+        strong_model: str | None = None,
+    ) -> None:
+        super().__init__(model, strong_model)
+        self._client = client
+        self._api_key = api_key
+
+    def available(self) -> bool:
+        return bool(self._api_key())
+
+    def _request(self, system_prompt: str, user_content: str, model: str | None = None) -> dict[str, Any]:
+        return {
+            "model": model or self.model,
+            "max_tokens": ANTHROPIC_MAX_TOKENS,
+            "system": system_prompt + "\n\nRespond with a single JSON object only.",
+            "messages": [
+                {"role": "user", "content": user_content},
+                {"role": "assistant", "content": "{"},
+            ],
+        }
+
+    async def complete_json(
+        self, kind: str, system_prompt: str, user_content: str, *, model: str | None = None
+    ) -> tuple[str | None, int | None]:
+        response = await self._client().messages.create(**self._request(system_prompt, user_content, model))
+        text = "".join(getattr(block, "text", "") for block in response.content)
+        usage = getattr(response, "usage", None)
+        tokens = (getattr(usage, "input_tokens", 0) or 0) + (getattr(usage, "output_tokens", 0) or 0)
+        return "{" + text, tokens or None
+
+    async def stream_json(self, kind: str, system_prompt: str, user_content: str) -> AsyncIterator[str]:
+        stream = await self._client().messages.create(**self._request(system_prompt, user_content), stream=True)
+        yield "{"
+        try:
+            async for event in stream:
+                if getattr(event, "type", "") == "content_block_delta":
+                    text = getattr(event.delta, "text", None)
+                    if text:
+                        yield text
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                await close()
+
+
+class FakeProvider(LLMProvider):
+    """Local deterministic provider: responder(kind, system_prompt, user_content) -> JSON text. No network."""
+
+    name = "fake"
+
+    def __init__(
+        self,
+        responder: Callable[[str, str, str], str | None],
+        model: str = "fake-1",
+        *,
+        latency: float = 0.0,
+        name: str = "fake",
+    ) -> None:
+        self.name = name
+        super().__init__(model)
+        self.responder = responder
+        self.latency = latency
+
+    async def complete_json(
+        self, kind: str, system_prompt: str, user_content: str, *, model: str | None = None
+    ) -> tuple[str | None, int | None]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.responder(kind, system_prompt, user_content), None
+
+    async def stream_json(self, kind: str, system_prompt: str, user_content: str) -> AsyncIterator[str]:
+        content, _ = await self.complete_json(kind, system_prompt, user_content)
+        text = content or "{}"
+        for i in range(0, len(text), 16):
+            yield text[i : i + 16]
+
+
+class ProviderStats:
+    """EWMA latency (~p50), EWMA absolute deviation (p95 ~ mean + 2 * deviation) and error rate."""
+
+    def __init__(self, alpha: float = ROUTER_EWMA_ALPHA) -> None:
+        self.alpha = alpha
+        self.samples = 0
+        self.latency = 0.0
+        self.deviation = 0.0
+        self.error_rate = 0.0
+
+    def record(self, seconds: float | None, ok: bool) -> None:
+        a = self.alpha
+        if self.samples == 0:
+            self.error_rate = 0.0 if ok else 1.0
+            if seconds is not None:
+                self.latency = seconds
+        else:
+            self.error_rate += a * ((0.0 if ok else 1.0) - self.error_rate)
+            if seconds is not None:
+                self.deviation += a * (abs(seconds - self.latency) - self.deviation)
+                self.latency += a * (seconds - self.latency)
+        self.samples += 1
+
+    @property
+    def p50(self) -> float:
+        return self.latency
+
+    @property
+    def p95(self) -> float:
+        return self.latency + 2.0 * self.deviation
+
+    def score(self) -> float:
+        """Lower is better; providers without samples score 0 so they get tried."""
+        if self.samples == 0:
+            return 0.0
+        return self.p95 * (1.0 + ROUTER_ERROR_PENALTY * self.error_rate) + self.error_rate
+
+
+class NoProviderAvailable(Exception):
+    """No configured provider can take the call (none configured, or secondary with only one)."""
+
+
+class LLMRouter:
+    def __init__(self, providers: list[LLMProvider], *, explore_rate: float = ROUTER_EXPLORE_RATE) -> None:
+        self.providers = providers
+        self.explore_rate = explore_rate
+        self.stats: dict[str, ProviderStats] = {p.name: ProviderStats() for p in providers}
+
+    def configured(self) -> list[LLMProvider]:
+        return [p for p in self.providers if p.available()]
+
+    def available(self, *, secondary: bool = False) -> bool:
+        return len(self.configured()) >= (2 if secondary else 1)
+
+    def ranked(self, *, secondary: bool = False) -> list[LLMProvider]:
+        """Configured providers, best first (open circuits last). secondary rotates the best one to the end."""
+        providers = self.configured()
+        if secondary and len(providers) < 2:
+            raise NoProviderAvailable("secondary provider requested but only one is configured")
+        if not providers:
+            raise NoProviderAvailable("no LLM provider configured")
+        order = {p.name: i for i, p in enumerate(self.providers)}
+        ranked = sorted(
+            providers,
+            key=lambda p: (p.breaker.state == "open", self.stats[p.name].score(), order[p.name]),
+        )
+        if not secondary and len(ranked) > 1 and random.random() < self.explore_rate:
+            ranked.insert(0, ranked.pop(random.randrange(1, len(ranked))))
+            metrics.incr("llm.router.explore")
+        if secondary:
+            ranked = ranked[1:] + ranked[:1]
+        return ranked
+
+    def _record(self, provider: LLMProvider, seconds: float | None, exc: BaseException | None) -> None:
+        if isinstance(exc, CircuitOpenError):
+            return
+        if exc is not None and not is_retryable(exc):
+            return  # our request was bad, not the provider
+        self.stats[provider.name].record(seconds, exc is None)
+
+    async def _call(
+        self, provider: LLMProvider, kind: str, system_prompt: str, user_content: str, strong: bool = False
+    ) -> str | None:
+        tokens = estimate_tokens(system_prompt, user_content)
+        model = provider.strong_model if strong else provider.model
+        breaker = provider.strong_breaker if strong else provider.breaker
+
+        async def attempt() -> tuple[str | None, int | None]:
+            return await provider.scheduler.run(
+                lambda: provider.complete_json(kind, system_prompt, user_content, model=model), tokens=tokens
+            )
+
+        hedge_kind = f"{provider.name}.{kind}" + (".strong" if strong else "")
+        content, used = await breaker.call(lambda: hedger.run(hedge_kind, attempt))
+        if used is not None:
+            provider.scheduler.bucket.adjust(min(tokens, provider.scheduler.bucket.capacity) - used)
+        return content
+
+    async def complete(
+        self, kind: str, system_prompt: str, user_content: str, *, secondary: bool = False, strong: bool = False
+    ) -> str | None:
+        """JSON completion on the best provider, failing over to the others. Raises the last error if all fail.
+        strong: use each provider's strong model (its latency is not mixed into the routing statistics)."""
+        last_exc: Exception | None = None
+        for i, provider in enumerate(self.ranked(secondary=secondary)):
+            if i:
+                metrics.incr("llm.router.failover")
+            started = time.monotonic()
+            try:
+                content = await self._call(provider, kind, system_prompt, user_content, strong)
+            except Exception as exc:
+                self._record(provider, None, exc)
+                last_exc = exc
+                continue
+            self._record(provider, None if strong else time.monotonic() - started, None)
+            metrics.incr(f"llm.router.selected.{provider.name}")
+            return content
+        assert last_exc is not None
+        raise last_exc
+
+    async def stream(
+        self, kind: str, system_prompt: str, user_content: str, *, secondary: bool = False
+    ) -> AsyncIterator[str]:
+        """Streaming completion; fails over only until the first delta has been sent."""
+        last_exc: Exception | None = None
+        for provider in self.ranked(secondary=secondary):
+            started = time.monotonic()
+            sent = False
+            try:
+                provider.breaker.allow()
+            except CircuitOpenError as exc:
+                last_exc = exc
+                continue
+            try:
+                async with provider.scheduler.admit(estimate_tokens(system_prompt, user_content)):
+                    async for delta in provider.stream_json(kind, system_prompt, user_content):
+                        sent = True
+                        yield delta
+            except Exception as exc:
+                provider.breaker.record_failure(exc)
+                self._record(provider, None, exc)
+                if sent:
+                    raise
+                last_exc = exc
+                continue
+            except BaseException:
+                provider.breaker.release_probe()  # closed early / cancelled
+                raise
+            provider.breaker.record_success()
+            self._record(provider, time.monotonic() - started, None)
+            return
+        assert last_exc is not None
+        raise last_exc
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        """Per-provider routing statistics, scheduler load and circuit state (for /metrics)."""
+        return {
+            p.name: {
+                "model": p.model,
+                "strong_model": p.strong_model,
+                "configured": p.available(),
+                "p50_seconds": round(self.stats[p.name].p50, 3),
+                "p95_seconds": round(self.stats[p.name].p95, 3),
+                "error_rate": round(self.stats[p.name].error_rate, 3),
+                "samples": self.stats[p.name].samples,
+                "circuit": p.breaker.state,
+                **p.scheduler.stats(),
+            }
+            for p in self.providers
+        }
+
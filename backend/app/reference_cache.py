@@ -0,0 +1,284 @@
+"""Topic-keyed cache for LLM-generated reference artifacts (requirements, APIs, diagram, estimation,
+data model, per-sub-topic deep-dive suggestions).
+
+Two tiers: an in-process LRU front and a SQLite (WAL) file shared by all uvicorn workers.
+Entries are fresh for REFERENCE_CACHE_TTL_SECONDS; for a further REFERENCE_CACHE_STALE_SECONDS
+they are still served while one background task regenerates them (stale-while-revalidate).
+Only real LLM results are stored: compute functions return None on failure and the caller
+falls back to its stub.
+
+A precomputed topic bundle (app.topic_bundle, built by app.precompute) can be attached as a
+read-only tier in front of both: catalog topics are then served from the memory-mapped bundle
+without any LLM call. Bundle entries are not invalidated; ship a new bundle to change them.
+"""
+
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+from app import metrics
+from app.llm_scheduler import Priority, llm_priority
+from app.singleflight import SingleFlight
+from app.topic_bundle import TopicBundle
+
+# Defaults to backend/reference_cache.sqlite3 whatever the working directory.
+REFERENCE_CACHE_PATH = os.getenv(
+    "REFERENCE_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "reference_cache.sqlite3"),
+)
+REFERENCE_CACHE_MAX_ENTRIES = int(os.getenv("REFERENCE_CACHE_MAX_ENTRIES", "1024"))
+REFERENCE_CACHE_TTL_SECONDS = float(os.getenv("REFERENCE_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+REFERENCE_CACHE_STALE_SECONDS = float(os.getenv("REFERENCE_CACHE_STALE_SECONDS", str(24 * 3600)))
+# How long a worker trusts its memory copy before re-reading SQLite (bounds cross-worker staleness
+# after an invalidation).
+REFERENCE_CACHE_MEMORY_TTL_SECONDS = float(os.getenv("REFERENCE_CACHE_MEMORY_TTL_SECONDS", "300"))
+# Precomputed topic bundle loaded at startup when the file exists.
+TOPIC_BUNDLE_PATH = os.getenv("TOPIC_BUNDLE_PATH", "reference_bundle.bin")
+
+
+def normalize_topic(topic: str) -> str:
+    """Lowercase, drop punctuation, collapse whitespace: "URL  Shortener!" -> "url shortener"."""
+    s = re.sub(r"[^a-z0-9]+", " ", (topic or "").lower())
+    return " ".join(s.split())
+
+
+def inputs_hash(inputs: Any) -> str:
+    """Stable short hash of the non-topic inputs (e.g. API spec); empty inputs hash to "-"."""
+    if not inputs:
+        return "-"
+    raw = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class _Entry:
+    __slots__ = ("kind", "topic", "value", "created_at", "loaded_at")
+
+    def __init__(self, kind: str, topic: str, value: Any, created_at: float) -> None:
+        self.kind = kind
+        self.topic = topic
+        self.value = value
+        self.created_at = created_at
+        self.loaded_at = time.time()
+
+
+class ReferenceCache:
+    """LRU front + SQLite tier with TTL and stale-while-revalidate. path="" disables the SQLite tier."""
+
+    def __init__(
+        self,
+        path: str = REFERENCE_CACHE_PATH,
+        *,
+        max_entries: int = REFERENCE_CACHE_MAX_ENTRIES,
+        ttl: float = REFERENCE_CACHE_TTL_SECONDS,
+        stale_ttl: float = REFERENCE_CACHE_STALE_SECONDS,
+        memory_ttl: float = REFERENCE_CACHE_MEMORY_TTL_SECONDS,
+    ) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.memory_ttl = memory_ttl
+        self._memory: OrderedDict[str, _Entry] = OrderedDict()
+        self._db: sqlite3.Connection | None = None
+        self._db_lock = threading.Lock()
+        self._refreshing: dict[str, asyncio.Task] = {}
+        self._flights = SingleFlight("reference_cache.singleflight")
+        self.bundle: TopicBundle | None = None
+
+    # --- SQLite tier (blocking; called via asyncio.to_thread) ---
+
+    def _conn(self) -> sqlite3.Connection | None:
+        if not self.path:
+            return None
+        if self._db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False, timeout=5.0)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS reference_cache ("
+                " key TEXT PRIMARY KEY, kind TEXT NOT NULL, topic TEXT NOT NULL,"
+                " value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS reference_cache_topic ON reference_cache (topic)")
+            db.commit()
+            self._db = db
+        return self._db
+
+    def _db_get(self, key: str) -> _Entry | None:
+        with self._db_lock:
+            db = self._conn()
+            if db is None:
+                return None
+            row = db.execute(
+                "SELECT kind, topic, value, created_at FROM reference_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return _Entry(row[0], row[1], json.loads(row[2]), row[3])
+
+    def _db_put(self, key: str, entry: _Entry) -> None:
+        with self._db_lock:
+            db = self._conn()
+            if db is None:
+                return
+            db.execute(
+                "INSERT OR REPLACE INTO reference_cache (key, kind, topic, value, created_at) VALUES (?, ?, ?, ?, ?)",
+                (key, entry.kind, entry.topic, json.dumps(entry.value, ensure_ascii=False), entry.created_at),
+            )
+            db.commit()
+
+    def _db_delete(self, topic: str | None, kind: str | None) -> int:
+        with self._db_lock:
+            db = self._conn()
+            if db is None:
+                return 0
+            clauses, params = [], []
+            if topic is not None:
+                clauses.append("topic = ?")
+                params.append(topic)
+            if kind is not None:
+                clauses.append("kind = ?")
+                params.append(kind)
+            where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+            cur = db.execute(f"DELETE FROM reference_cache{where}", params)
+            db.commit()
+            return cur.rowcount
+
+    # --- memory tier ---
+
+    def _remember(self, key: str, entry: _Entry) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    async def _lookup(self, key: str) -> _Entry | None:
+        entry = self._memory.get(key)
+        if entry is not None and (not self.path or time.time() - entry.loaded_at <= self.memory_ttl):
+            self._memory.move_to_end(key)
+            metrics.incr("reference_cache.hit.memory")
+            return entry
+        entry = await asyncio.to_thread(self._db_get, key)
+        if entry is not None:
+            self._remember(key, entry)
+            metrics.incr("reference_cache.hit.sqlite")
+            return entry
+        self._memory.pop(key, None)
+        return None
+
+    async def _store(self, key: str, kind: str, topic: str, value: Any) -> None:
+        entry = _Entry(kind, topic, value, time.time())
+        self._remember(key, entry)
+        await asyncio.to_thread(self._db_put, key, entry)
+
+    # --- public API ---
+
+    @staticmethod
+    def make_key(kind: str, topic: str, inputs: Any = None) -> str:
+        return f"{kind}:{normalize_topic(topic)}:{inputs_hash(inputs)}"
+
+    def bundled(self, kind: str, topic: str, inputs: Any = None) -> Any:
+        """Artifact from the precomputed topic bundle, or None (no bundle or topic not in the catalog)."""
+        if self.bundle is None:
+            return None
+        value = self.bundle.get(self.make_key(kind, topic, inputs))
+        if value is not None:
+            metrics.incr("reference_cache.hit.bundle")
+        return value
+
+    async def get(self, kind: str, topic: str, inputs: Any = None) -> Any:
+        """Cached artifact if present and not expired (fresh or stale), else None. Never computes."""
+        bundled = self.bundled(kind, topic, inputs)
+        if bundled is not None:
+            return bundled
+        entry = await self._lookup(self.make_key(kind, topic, inputs))
+        if entry is None or time.time() - entry.created_at > self.ttl + self.stale_ttl:
+            return None
+        return entry.value
+
+    async def put(self, kind: str, topic: str, inputs: Any, value: Any) -> None:
+        """Store an artifact produced outside get_or_compute (e.g. by a fused reference + coverage call)."""
+        await self._store(self.make_key(kind, topic, inputs), kind, normalize_topic(topic), value)
+
+    async def get_or_compute(
+        self,
+        kind: str,
+        topic: str,
+        inputs: Any,
+        compute: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """Return the cached artifact for (kind, topic, inputs), computing it on a miss.
+        Concurrent misses for the same key share one computation.
+        Returns None (and caches nothing) when compute returns None."""
+        bundled = self.bundled(kind, topic, inputs)
+        if bundled is not None:
+            return bundled
+        key = self.make_key(kind, topic, inputs)
+        norm_topic = normalize_topic(topic)
+        entry = await self._lookup(key)
+        if entry is not None:
+            age = time.time() - entry.created_at
+            if age <= self.ttl:
+                return entry.value
+            if age <= self.ttl + self.stale_ttl:
+                metrics.incr("reference_cache.stale")
+                self._refresh_in_background(key, kind, norm_topic, compute)
+                return entry.value
+        metrics.incr("reference_cache.miss")
+
+        async def compute_and_store() -> Any:
+            value = await compute()
+            if value is not None:
+                await self._store(key, kind, norm_topic, value)
+            return value
+
+        return await self._flights.do(key, compute_and_store)
+
+    def _refresh_in_background(
+        self, key: str, kind: str, topic: str, compute: Callable[[], Awaitable[Any]]
+    ) -> None:
+        if key in self._refreshing:
+            return
+
+        async def refresh() -> None:
+            try:
+                with llm_priority(Priority.BACKGROUND):
+                    value = await compute()
+                if value is not None:
+                    await self._store(key, kind, topic, value)
+                    metrics.incr("reference_cache.refreshed")
+            finally:
+                self._refreshing.pop(key, None)
+
+        # Fresh context: the refresh must not inherit (or be cancelled by) the request's budget.
+        self._refreshing[key] = asyncio.create_task(refresh(), context=contextvars.Context())
+
+    async def invalidate(self, topic: str | None = None, kind: str | None = None) -> int:
+        """Drop entries for a topic and/or kind (all entries when both are None). Returns rows removed."""
+        norm_topic = normalize_topic(topic) if topic is not None else None
+        for key, entry in list(self._memory.items()):
+            if (norm_topic is None or entry.topic == norm_topic) and (kind is None or entry.kind == kind):
+                del self._memory[key]
+        removed = await asyncio.to_thread(self._db_delete, norm_topic, kind)
+        metrics.incr("reference_cache.invalidations")
+        return removed
+
+    def close(self) -> None:
+        if self.bundle is not None:
+            self.bundle.close()
+            self.bundle = None
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+reference_cache = ReferenceCache()
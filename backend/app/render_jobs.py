@@ -0,0 +1,159 @@
+"""Background render queue for suggested diagrams.
+
+Rendering a suggested diagram (natively, or through Kroki for the rest) must not hold back the
+feedback text it accompanies, so endpoints submit the Mermaid source here and respond with a job
+id right away. RENDER_JOB_WORKERS workers render queued jobs; the client collects the image URL
+through GET /renders/jobs/{id} (long-poll) or the SSE stream of the endpoint.
+
+A job's id is the render id of its source, so identical sources share one job: submitting a
+diagram that is already queued, rendering or rendered returns that job (a failed job is retried).
+At most RENDER_QUEUE_MAX jobs wait at once; further submissions are dropped rather than queued.
+The RENDER_JOBS_KEEP most recent finished jobs stay available for polling.
+"""
+
+import asyncio
+import contextvars
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from app import metrics
+from app.render_store import render_id
+
+RENDER_JOB_WORKERS = int(os.getenv("RENDER_JOB_WORKERS", "2"))
+RENDER_QUEUE_MAX = int(os.getenv("RENDER_QUEUE_MAX", "64"))
+RENDER_JOBS_KEEP = int(os.getenv("RENDER_JOBS_KEEP", "1024"))
+# Longest GET /renders/jobs/{id} long-poll (and SSE wait for the image).
+RENDER_JOB_MAX_WAIT_SECONDS = float(os.getenv("RENDER_JOB_MAX_WAIT_SECONDS", "25"))
+
+# Mermaid source -> image URL ("" when nothing could be rendered)
+JobRenderer = Callable[[str], Awaitable[str]]
+
+
+class RenderJob:
+    """One suggested-diagram render: status "pending", "done" or "failed", and the image URL."""
+
+    __slots__ = ("id", "source", "status", "url", "submitted", "finished", "_done")
+
+    def __init__(self, job_id: str, source: str) -> None:
+        self.id = job_id
+        self.source = source
+        self.status = "pending"
+        self.url = ""
+        self.submitted = time.monotonic()
+        self.finished: float | None = None
+        self._done = asyncio.Event()
+
+    @property
+    def pending(self) -> bool:
+        return self.status == "pending"
+
+
+class RenderJobQueue:
+    """Bounded, deduplicated queue of render jobs and the workers draining it."""
+
+    def __init__(
+        self,
+        render: JobRenderer,
+        *,
+        workers: int = RENDER_JOB_WORKERS,
+        max_queued: int = RENDER_QUEUE_MAX,
+        keep: int = RENDER_JOBS_KEEP,
+    ) -> None:
+        self.render = render
+        self.workers = workers
+        self.max_queued = max_queued
+        self.keep = keep
+        self._jobs: OrderedDict[str, RenderJob] = OrderedDict()
+        self._queue: asyncio.Queue[RenderJob] | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _ensure_workers(self) -> asyncio.Queue[RenderJob]:
+        loop = asyncio.get_running_loop()
+        if self._queue is None or self._loop is not loop:
+            # New event loop (first use, or tests): jobs still pending on the old one are re-queued.
+            self._queue, self._loop = asyncio.Queue(), loop
+            for job in self._jobs.values():
+                if job.pending:
+                    job._done = asyncio.Event()
+                    self._queue.put_nowait(job)
+            # Fresh context: the workers must not inherit (or be cancelled by) a request's budget.
+            self._tasks = [
+                asyncio.create_task(self._work(self._queue), context=contextvars.Context())
+                for _ in range(max(1, self.workers))
+            ]
+        return self._queue
+
+    def get(self, job_id: str) -> RenderJob | None:
+        return self._jobs.get(job_id)
+
+    def queued(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def submit(self, source: str) -> RenderJob | None:
+        """Job rendering source (an existing one for a known source); None when source is empty
+        or the queue is full."""
+        if not source.strip():
+            return None
+        queue = self._ensure_workers()
+        job_id = render_id("mermaid", source)
+        job = self._jobs.get(job_id)
+        if job is not None and job.status != "failed":
+            self._jobs.move_to_end(job_id)
+            metrics.incr("render_jobs.deduplicated")
+            return job
+        if queue.qsize() >= self.max_queued:
+            metrics.incr("render_jobs.dropped")
+            return None
+        job = RenderJob(job_id, source)
+        self._jobs[job_id] = job
+        self._jobs.move_to_end(job_id)
+        queue.put_nowait(job)
+        metrics.incr("render_jobs.submitted")
+        self._trim()
+        return job
+
+    async def wait(self, job_id: str, timeout: float) -> RenderJob | None:
+        """The job once it finished, or as it is after timeout seconds; None if unknown."""
+        job = self._jobs.get(job_id)
+        if job is None or not job.pending:
+            return job
+        try:
+            async with asyncio.timeout(timeout):
+                await job._done.wait()
+        except TimeoutError:
+            pass
+        return job
+
+    async def _work(self, queue: asyncio.Queue[RenderJob]) -> None:
+        while True:
+            job = await queue.get()
+            if not job.pending:  # re-queued after a loop change but already finished
+                continue
+            started = time.monotonic()
+            metrics.observe("render_jobs.queued_seconds", started - job.submitted)
+            try:
+                job.url = await self.render(job.source)
+            except Exception as e:
+                print(f"render job {job.id} failed: {e}")
+                job.url = ""
+            job.status = "done" if job.url else "failed"
+            job.finished = time.monotonic()
+            metrics.incr(f"render_jobs.{job.status}")
+            metrics.observe("render_jobs.seconds", job.finished - started)
+            job._done.set()
+
+    def _trim(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if not job.pending]
+        for job_id in finished[: max(0, len(self._jobs) - self.keep)]:
+            del self._jobs[job_id]
+
+    async def close(self) -> None:
+        """Stop the workers (shutdown); pending jobs are abandoned."""
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._queue = self._loop = None
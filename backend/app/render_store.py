@@ -0,0 +1,170 @@
+"""Content-addressed store for rendered diagrams (suggested Mermaid / D2 diagrams as PNG or SVG).
+
+A diagram's render id is a hash of its engine and normalized source (line endings and trailing
+whitespace do not matter); each format is stored under the id with its extension, so an artifact
+is addressed by (engine, format, source) and served as GET /renders/{id}.{format} with a strong
+ETag and an immutable Cache-Control. Renders are kept in an in-process LRU (bounded by bytes) in
+front of a directory on disk shared by all workers; the source is stored too, so a format that
+was never rendered (e.g. the SVG of a diagram returned as PNG) is rendered on first request.
+Concurrent renders of the same artifact share one renderer call. Failed renders are not stored.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from app import metrics
+from app.singleflight import SingleFlight
+
+# Defaults to backend/render_cache whatever the working directory; RENDER_CACHE_DIR= keeps renders in memory only.
+RENDER_CACHE_DIR = os.getenv(
+    "RENDER_CACHE_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "render_cache")
+)
+RENDER_CACHE_MAX_BYTES = int(os.getenv("RENDER_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+RENDER_FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+# Responses link renders as {RENDER_PUBLIC_URL}/renders/{id}.png (relative to the API when empty);
+# RENDER_INLINE_DATA_URL=1 returns base64 data URLs instead (the previous behaviour).
+RENDER_PUBLIC_URL = os.getenv("RENDER_PUBLIC_URL", "").rstrip("/")
+RENDER_INLINE_DATA_URL = os.getenv("RENDER_INLINE_DATA_URL", "0") == "1"
+
+_RENDER_ID = re.compile(r"^[0-9a-f]{32}$")
+
+# (engine, format, source) -> rendered bytes, or None when the renderer failed
+Renderer = Callable[[str, str, str], Awaitable[bytes | None]]
+
+
+def normalize_source(source: str) -> str:
+    lines = (source or "").replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+def render_id(engine: str, source: str) -> str:
+    raw = f"{engine}\0{normalize_source(source)}".encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()[:32]
+
+
+def is_render_id(value: str) -> bool:
+    return bool(_RENDER_ID.match(value))
+
+
+class RenderStore:
+    """Memory LRU + disk directory of rendered artifacts; path="" keeps everything in memory."""
+
+    def __init__(self, path: str = RENDER_CACHE_DIR, max_bytes: int = RENDER_CACHE_MAX_BYTES) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self._memory: OrderedDict[tuple[str, str], bytes] = OrderedDict()
+        self._memory_bytes = 0
+        self._sources: dict[str, dict[str, str]] = {}
+        self._lock = threading.Lock()
+        self._flights = SingleFlight("render_store.singleflight")
+
+    def _file(self, rid: str, ext: str) -> str:
+        return os.path.join(self.path, rid[:2], f"{rid}.{ext}")
+
+    def _remember(self, rid: str, fmt: str, data: bytes) -> None:
+        with self._lock:
+            key = (rid, fmt)
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return
+            self._memory[key] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.max_bytes and len(self._memory) > 1:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def _write(self, rid: str, ext: str, data: bytes) -> None:
+        if not self.path:
+            return
+        target = self._file(rid, ext)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = f"{target}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, target)
+
+    def get(self, rid: str, fmt: str) -> bytes | None:
+        """Stored artifact, or None. Never renders."""
+        with self._lock:
+            data = self._memory.get((rid, fmt))
+            if data is not None:
+                self._memory.move_to_end((rid, fmt))
+        if data is not None:
+            metrics.incr("render_store.hit.memory")
+            return data
+        if self.path:
+            try:
+                with open(self._file(rid, fmt), "rb") as f:
+                    data = f.read()
+            except OSError:
+                data = None
+            if data is not None:
+                metrics.incr("render_store.hit.disk")
+                self._remember(rid, fmt, data)
+                return data
+        return None
+
+    def source(self, rid: str) -> dict[str, str] | None:
+        """{"engine", "source"} of a known diagram, or None."""
+        with self._lock:
+            known = self._sources.get(rid)
+        if known is not None or not self.path:
+            return known
+        try:
+            with open(self._file(rid, "src.json"), encoding="utf-8") as f:
+                known = json.load(f)
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            self._sources[rid] = known
+        return known
+
+    def _put(self, rid: str, fmt: str, data: bytes) -> None:
+        self._remember(rid, fmt, data)
+        self._write(rid, fmt, data)
+
+    def _put_source(self, rid: str, engine: str, source: str) -> None:
+        entry = {"engine": engine, "source": normalize_source(source)}
+        with self._lock:
+            known = rid in self._sources
+            self._sources[rid] = entry
+        if not known:
+            self._write(rid, "src.json", json.dumps(entry).encode("utf-8"))
+
+    async def _render(self, rid: str, engine: str, fmt: str, source: str, renderer: Renderer) -> bytes | None:
+        data = await asyncio.to_thread(self.get, rid, fmt)
+        if data is not None:
+            return data
+        metrics.incr("render_store.miss")
+        data = await renderer(engine, fmt, source)
+        if data:
+            await asyncio.to_thread(self._put, rid, fmt, data)
+            await asyncio.to_thread(self._put_source, rid, engine, source)
+        return data or None
+
+    async def render(self, engine: str, fmt: str, source: str, renderer: Renderer) -> str | None:
+        """Render id of source in fmt (rendering it only if not stored yet); None when rendering failed."""
+        rid = render_id(engine, source)
+        source = normalize_source(source)
+        data = await self._flights.do((rid, fmt), lambda: self._render(rid, engine, fmt, source, renderer))
+        return rid if data is not None else None
+
+    async def fetch(self, rid: str, fmt: str, renderer: Renderer) -> bytes | None:
+        """Stored artifact, rendering it from the stored source if this format is new; None if unknown."""
+        data = await asyncio.to_thread(self.get, rid, fmt)
+        if data is not None:
+            return data
+        known = await asyncio.to_thread(self.source, rid)
+        if known is None:
+            return None
+        engine, source = known["engine"], known["source"]
+        return await self._flights.do((rid, fmt), lambda: self._render(rid, engine, fmt, source, renderer))
+
+
+render_store = RenderStore()
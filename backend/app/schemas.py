@@ -21,6 +21,21 @@ class ValidateRequest(BaseModel):
     model_config = {"populate_by_name": True}
 
 
+class TopicResolution(BaseModel):
+    """How a request's topic was mapped to a canonical topic (returned on validation responses)."""
+
+    input: str = Field(..., description="Topic as sent by the client")
+    canonical: str = Field(..., description="Topic used for reference generation and caching")
+    topicId: str | None = Field(
+        default=None, description="Canonical topic id; None when the topic is used as typed"
+    )
+    method: str = Field(..., description="exact, alias, fuzzy or none")
+    score: float = Field(default=0.0, description="Similarity of the match (1.0 for exact and alias)")
+    suggestion: str | None = Field(
+        default=None, description="Closest canonical topic of a fuzzy match that was not applied (TOPIC_APPLY_FUZZY=0)"
+    )
+
+
 class ValidateResponse(BaseModel):
     """Response body for POST /validate. Frontend expects camelCase."""
 
@@ -51,6 +66,15 @@ class ValidateResponse(BaseModel):
         description="From top 5 non-functional that the user did not cover",
     )
 
+    topicResolution: TopicResolution | None = Field(
+        default=None,
+        description="How the request topic was mapped to the canonical topic used for references",
+    )
+    degraded: bool = Field(
+        default=False,
+        description="True when the latency budget ran out and stub or deterministic results were returned for some parts",
+    )
+
     model_config = {"populate_by_name": True}
 
 
@@ -79,6 +103,15 @@ class ValidateApisResponse(BaseModel):
         description="From top 5 that the user did not cover",
     )
 
+    topicResolution: TopicResolution | None = Field(
+        default=None,
+        description="How the request topic was mapped to the canonical topic used for references",
+    )
+    degraded: bool = Field(
+        default=False,
+        description="True when the latency budget ran out and stub or deterministic results were returned for some parts",
+    )
+
     model_config = {"populate_by_name": True}
 
 
@@ -120,6 +153,21 @@ class ValidateDiagramResponse(BaseModel):
         alias="suggestedDiagram",
         description="High-level diagram from LLM (Mermaid flowchart) for the user to add to summary",
     )
+    suggestedDiagramSvg: str = Field(
+        default="",
+        alias="suggestedDiagramSvg",
+        description="suggestedDiagram rendered server-side: a /renders/{id}.svg URL (or a data URL in inline mode); "
+        "empty when it uses Mermaid syntax outside the natively rendered subset",
+    )
+
+    topicResolution: TopicResolution | None = Field(
+        default=None,
+        description="How the request topic was mapped to the canonical topic used for references",
+    )
+    degraded: bool = Field(
+        default=False,
+        description="True when the latency budget ran out and stub or deterministic results were returned for some parts",
+    )
 
     model_config = {"populate_by_name": True}
 
@@ -158,6 +206,15 @@ class ValidateFlowResponse(BaseModel):
         description="Suggested improvements, missing steps, or corrections",
     )
 
+    topicResolution: TopicResolution | None = Field(
+        default=None,
+        description="How the request topic was mapped to the canonical topic used for references",
+    )
+    degraded: bool = Field(
+        default=False,
+        description="True when the latency budget ran out and stub or deterministic results were returned for some parts",
+    )
+
     model_config = {"populate_by_name": True}
 
 
@@ -217,6 +274,15 @@ class ValidateDeepDivesResponse(BaseModel):
         description="Up to 3 important deep dive topics the user missed (LLM-suggested)",
     )
 
+    topicResolution: TopicResolution | None = Field(
+        default=None,
+        description="How the request topic was mapped to the canonical topic used for references",
+    )
+    degraded: bool = Field(
+        default=False,
+        description="True when the latency budget ran out and stub or deterministic results were returned for some parts",
+    )
+
     model_config = {"populate_by_name": True}
 
 
@@ -322,7 +388,24 @@ class ValidateDetailedDiagramResponse(BaseModel):
     suggestedDiagramPng: str = Field(
         default="",
         alias="suggestedDiagramPng",
-        description="LLM-generated diagram rendered as PNG (data URL) for feedback",
+        description="LLM-generated diagram rendered server-side: a /renders/{id}.svg URL (native Mermaid "
+        "renderer) or /renders/{id}.png URL (Kroki fallback), or a data URL in inline mode. Empty while "
+        "the render job is still running",
+    )
+    renderJobId: str = Field(
+        default="",
+        alias="renderJobId",
+        description="Background render job for suggestedDiagram (GET /renders/jobs/{id}); empty when there "
+        "is nothing to render",
+    )
+
+    topicResolution: TopicResolution | None = Field(
+        default=None,
+        description="How the request topic was mapped to the canonical topic used for references",
+    )
+    degraded: bool = Field(
+        default=False,
+        description="True when the latency budget ran out and stub or deterministic results were returned for some parts",
     )
 
     model_config = {"populate_by_name": True}
@@ -426,6 +509,15 @@ class ValidateEstimationResponse(BaseModel):
         description="Short summary of estimate quality and top gaps",
     )
 
+    topicResolution: TopicResolution | None = Field(
+        default=None,
+        description="How the request topic was mapped to the canonical topic used for references",
+    )
+    degraded: bool = Field(
+        default=False,
+        description="True when the latency budget ran out and stub or deterministic results were returned for some parts",
+    )
+
     model_config = {"populate_by_name": True}
 
 
@@ -482,4 +574,46 @@ class ValidateDataModelResponse(BaseModel):
         description="Tables suggested by feedback LLM based on API design (missing from user's schema)",
     )
 
-    model_config = {"populate_by_name": True}
\ No newline at end of file
+    topicResolution: TopicResolution | None = Field(
+        default=None,
+        description="How the request topic was mapped to the canonical topic used for references",
+    )
+    degraded: bool = Field(
+        default=False,
+        description="True when the latency budget ran out and stub or deterministic results were returned for some parts",
+    )
+
+    model_config = {"populate_by_name": True}
+
+
+class InvalidateReferenceCacheResponse(BaseModel):
+    """Response body for DELETE /admin/reference-cache."""
+
+    removed: int = Field(..., description="Number of persisted cache entries removed")
+
+
+class PrefetchResponse(BaseModel):
+    """Response body for POST /topics/{topic}/prefetch."""
+
+    topic: str = Field(..., description="Canonical topic being warmed")
+    scheduled: bool = Field(
+        ...,
+        description="False when already warming, too many topics are in flight or no LLM is configured",
+    )
+    stages: list[str] = Field(default_factory=list, description="Reference kinds the warm-up generates")
+    topicResolution: TopicResolution | None = Field(default=None, description="How the topic was resolved")
+
+
+class RenderJobResponse(BaseModel):
+    """Response body for GET /renders/jobs/{job_id}."""
+
+    id: str = Field(..., description="Render job id")
+    status: str = Field(..., description="Job state when the response was sent: pending, done or failed")
+    url: str = Field(default="", description="Rendered image URL (as suggestedDiagramPng) once done")
+
+
+class TopicAliases(BaseModel):
+    """A canonical topic and its aliases (GET /admin/topics, PUT /admin/topics/{topic_id})."""
+
+    name: str = Field(..., min_length=1, description="Canonical topic name used for references")
+    aliases: list[str] = Field(default_factory=list, description="Other names that resolve to this topic")
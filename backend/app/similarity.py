@@ -0,0 +1,218 @@
+"""Deterministic similarity pre-pass for coverage classification (requirements, diagram, schema, estimation).
+
+Text is normalized with a small synonym/abbreviation lexicon (taken from the examples in the
+COVERAGE_*_PROMPT texts, e.g. "1:1" = direct, "LB" = load balancer), tokenized and stemmed,
+then embedded as TF-IDF word vectors plus character-trigram vectors. A NumPy cosine matrix over
+reference items x user answers settles clear matches and clear non-matches locally; only the
+borderline band is left for the LLM.
+"""
+
+import os
+import re
+from typing import TypedDict
+
+import numpy as np
+
+SIMILARITY_MATCH_THRESHOLD = float(os.getenv("SIMILARITY_MATCH_THRESHOLD", "0.75"))
+# An item is missed only when nothing in the answer shares a stem with it: items no answer covers
+# score <= ~0.035 (stray character trigrams), while loose paraphrases the LLM should judge start
+# around 0.05 ("Shorten a long URL" vs "create short links"). See test_similarity.py.
+SIMILARITY_MISS_THRESHOLD = float(os.getenv("SIMILARITY_MISS_THRESHOLD", "0.04"))
+WORD_WEIGHT = 0.7
+CHAR_WEIGHT = 0.3
+
+# Multi-word phrases and abbreviations -> one concept token. Applied to lowercased text, longest first.
+PHRASES: dict[str, str] = {
+    "one-to-one": "direct",
+    "one to one": "direct",
+    "1:1": "direct",
+    "1-1": "direct",
+    "dm": "direct",
+    "dms": "direct",
+    "real-time": "realtime",
+    "real time": "realtime",
+    "instant": "realtime",
+    "group chats": "group messaging",
+    "group chat": "group messaging",
+    "group conversations": "group messaging",
+    "chat groups": "group messaging",
+    "sign in": "auth",
+    "sign-in": "auth",
+    "signin": "auth",
+    "log in": "auth",
+    "login": "auth",
+    "authentication": "auth",
+    "authenticate": "auth",
+    "access control": "authz",
+    "authorization": "authz",
+    "roles": "authz",
+    "scale horizontally": "scale",
+    "horizontal scalability": "scale",
+    "scalability": "scale",
+    "scalable": "scale",
+    "millions": "scale",
+    "high load": "scale",
+    "1m+": "scale",
+    "response time": "latency",
+    "low latency": "latency",
+    "uptime": "availability",
+    "highly available": "availability",
+    "high availability": "availability",
+    "fault tolerance": "availability",
+    "acid": "consistency",
+    "consistent": "consistency",
+    "persist": "storage",
+    "persistence": "storage",
+    "store": "storage",
+    "retrieval": "storage",
+    "fetch": "storage",
+    "restful": "api",
+    "rest api": "api",
+    "http api": "api",
+    "api endpoints": "api",
+    "load balancer": "loadbalancer",
+    "load balancing": "loadbalancer",
+    "l4 lb": "loadbalancer",
+    "l7 lb": "loadbalancer",
+    "lb": "loadbalancer",
+    "traefik": "loadbalancer",
+    "nginx": "loadbalancer",
+    "database": "database storage",
+    "db": "database storage",
+    "postgres": "database storage",
+    "postgresql": "database storage",
+    "mysql": "database storage",
+    "dynamo db": "database storage",
+    "dynamodb": "database storage",
+    "cassandra": "database storage",
+    "api gateway": "apiserver",
+    "api server": "apiserver",
+    "backend": "apiserver",
+    "bff": "apiserver",
+    "app server": "apiserver",
+    "application server": "apiserver",
+    "web server": "apiserver",
+    "redis": "cache",
+    "memcached": "cache",
+    "caching": "cache",
+    "message queue": "queue",
+    "event bus": "queue",
+    "kafka": "queue",
+    "rabbitmq": "queue",
+    "sqs": "queue",
+    "requests per second": "qps",
+    "queries per second": "qps",
+    "rps": "qps",
+    "daily active users": "dau",
+    "monthly active users": "mau",
+    "conversations": "conversation",
+    "chats": "conversation",
+    "rooms": "conversation",
+    "threads": "conversation",
+    "messaging": "message",
+    "messages": "message",
+}
+
+STOPWORDS = frozenset(
+    "a an and or the of to for in on with by from as at be is are can should must able "
+    "system support supports will into per via e g s".split()
+)
+
+_PHRASE_PATTERN = re.compile(
+    "|".join(
+        r"(?<![a-z0-9])" + re.escape(p) + r"(?![a-z0-9])"
+        for p in sorted(PHRASES, key=len, reverse=True)
+    )
+)
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def _stem(word: str) -> str:
+    """Tiny suffix stripper: messages/message/messaging -> messag, caching/cache -> cach."""
+    if len(word) <= 3 or word.isdigit():
+        return word
+    for suffix in ("ations", "ation", "ments", "ment", "ings", "ing", "ies", "ed"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[: -len(suffix)] + ("y" if suffix == "ies" else "")
+            break
+    if word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+        word = word[:-1]
+    if word.endswith("e") and len(word) > 4:
+        word = word[:-1]
+    return word
+
+
+def tokenize(text: str) -> list[str]:
+    """Lexicon-normalized, stemmed content tokens."""
+    s = (text or "").lower()
+    s = _PHRASE_PATTERN.sub(lambda m: f" {PHRASES[m.group(0)]} ", s)
+    return [_stem(t) for t in _TOKEN_PATTERN.findall(s) if t not in STOPWORDS]
+
+
+def _char_ngrams(tokens: list[str], n: int = 3) -> list[str]:
+    grams: list[str] = []
+    for t in tokens:
+        padded = f" {t} "
+        grams.extend(padded[i : i + n] for i in range(max(1, len(padded) - n + 1)))
+    return grams
+
+
+def _tfidf_matrix(docs: list[list[str]]) -> np.ndarray:
+    """Row-normalized TF-IDF matrix (smoothed idf) for the given token lists."""
+    vocab: dict[str, int] = {}
+    for doc in docs:
+        for term in doc:
+            vocab.setdefault(term, len(vocab))
+    matrix = np.zeros((len(docs), max(len(vocab), 1)), dtype=np.float64)
+    for row, doc in enumerate(docs):
+        for term in doc:
+            matrix[row, vocab[term]] += 1.0
+    df = (matrix > 0).sum(axis=0)
+    idf = np.log((1 + len(docs)) / (1 + df)) + 1.0
+    matrix *= idf
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def similarity_matrix(reference: list[str], answers: list[str]) -> np.ndarray:
+    """Cosine similarity (references x answers), blending word TF-IDF and char-trigram TF-IDF."""
+    if not reference or not answers:
+        return np.zeros((len(reference), len(answers)))
+    token_docs = [tokenize(t) for t in reference + answers]
+    words = _tfidf_matrix(token_docs)
+    chars = _tfidf_matrix([_char_ngrams(d) for d in token_docs])
+    n = len(reference)
+    word_sim = words[:n] @ words[n:].T
+    char_sim = chars[:n] @ chars[n:].T
+    return WORD_WEIGHT * word_sim + CHAR_WEIGHT * char_sim
+
+
+class LocalCoverage(TypedDict):
+    matched: list[str]
+    missed: list[str]
+    borderline: list[str]
+
+
+def settle_coverage(
+    reference: list[str],
+    answers: list[str],
+    *,
+    match_threshold: float = SIMILARITY_MATCH_THRESHOLD,
+    miss_threshold: float = SIMILARITY_MISS_THRESHOLD,
+) -> LocalCoverage:
+    """Split reference items by their best answer score: >= match_threshold matched,
+    < miss_threshold missed, anything in between borderline (for the LLM)."""
+    answers = [a for a in answers if tokenize(a)]
+    if not answers:
+        return {"matched": [], "missed": list(reference), "borderline": []}
+    best = similarity_matrix(reference, answers).max(axis=1)
+    result: LocalCoverage = {"matched": [], "missed": [], "borderline": []}
+    for ref, score in zip(reference, best):
+        if score >= match_threshold:
+            result["matched"].append(ref)
+        elif score < miss_threshold:
+            result["missed"].append(ref)
+        else:
+            result["borderline"].append(ref)
+    return result
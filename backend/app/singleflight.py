@@ -0,0 +1,57 @@
+"""Single-flight coalescing: concurrent callers with the same key share one in-flight call.
+
+The first caller (leader) starts the work as a task; later callers await the same task.
+Each caller waits through asyncio.shield, so cancelling one waiter (e.g. its request budget ran
+out) does not cancel the shared call for the others; the call is cancelled only when its last
+waiter leaves. Results and exceptions fan out to every waiter.
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+from app import metrics
+
+T = TypeVar("T")
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Future) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Group of keyed in-flight calls; name is used as the metrics prefix."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._flights: dict[Hashable, _Flight] = {}
+
+    def _forget(self, key: Hashable, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run fn() once per key at a time; concurrent callers with the same key get its result."""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(fn()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _t: self._forget(key, flight))
+            metrics.incr(f"{self.name}.leader")
+        else:
+            metrics.incr(f"{self.name}.coalesced")
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Last waiter gave up: stop the call and make sure no new caller joins it.
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def in_flight(self) -> int:
+        return len(self._flights)
@@ -0,0 +1,128 @@
+"""Read-only bundle of precomputed reference artifacts for a topic catalog (see app.precompute).
+
+Layout (little-endian):
+    header   MAGIC (8 bytes), format version (u16), reserved (u16), entry count (u32),
+             index offset (u64), index length (u64)
+    records  one zlib-compressed JSON value per entry
+    index    zlib-compressed JSON {"meta": {...}, "entries": {cache key: [offset, length]}}
+
+Keys are ReferenceCache keys (kind:normalized topic:inputs hash). TopicBundle memory-maps the
+file and keeps only the index in the heap; a value is decompressed from the mapping when it is
+looked up, so every worker shares the same page-cache copy of the records.
+"""
+
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+from typing import Any
+
+MAGIC = b"SDREFBND"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<8sHHIQQ")
+
+
+class BundleFormatError(ValueError):
+    """The file is not a topic bundle this code can read."""
+
+
+def _compact_json(value: Any) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def write_bundle(path: str, entries: dict[str, Any], meta: dict[str, Any] | None = None) -> None:
+    """Write entries (cache key -> JSON-serializable value) as a bundle, atomically and read-only."""
+    index: dict[str, list[int]] = {}
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(b"\0" * _HEADER.size)
+        for key in sorted(entries):
+            record = zlib.compress(_compact_json(entries[key]))
+            index[key] = [f.tell(), len(record)]
+            f.write(record)
+        index_offset = f.tell()
+        full_meta = {"format": FORMAT_VERSION, "created_at": time.time(), "entries": len(entries), **(meta or {})}
+        index_blob = zlib.compress(_compact_json({"meta": full_meta, "entries": index}))
+        f.write(index_blob)
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(entries), index_offset, len(index_blob)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.chmod(tmp, 0o444)
+    os.replace(tmp, path)
+
+
+class TopicBundle:
+    """Memory-mapped bundle; get(key) returns the stored value, or None when the key is missing or
+    its record is unreadable (callers then fall back to the reference cache or an LLM call)."""
+
+    def __init__(self, path: str) -> None:
+        """Open and validate the bundle at path; raises OSError if it cannot be opened and
+        BundleFormatError for anything that is not a complete bundle (empty, truncated, corrupt)."""
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as e:  # an empty file cannot be mapped
+                raise BundleFormatError(f"{path}: {e}") from None
+        try:
+            if len(self._map) < _HEADER.size:
+                raise BundleFormatError(f"{path}: too short for a topic bundle")
+            magic, version, _, count, index_offset, index_length = _HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC:
+                raise BundleFormatError(f"{path}: not a topic bundle")
+            if version != FORMAT_VERSION:
+                raise BundleFormatError(f"{path}: bundle format {version}, expected {FORMAT_VERSION}")
+            if index_offset + index_length > len(self._map):
+                raise BundleFormatError(f"{path}: truncated (index ends past the end of the file)")
+            index = json.loads(zlib.decompress(self._map[index_offset : index_offset + index_length]))
+            self.meta: dict[str, Any] = index["meta"]
+            self._index: dict[str, tuple[int, int]] = {k: (v[0], v[1]) for k, v in index["entries"].items()}
+            if len(self._index) != count:
+                raise BundleFormatError(f"{path}: index has {len(self._index)} entries, header says {count}")
+        except BundleFormatError:
+            self._map.close()
+            raise
+        except (struct.error, zlib.error, ValueError, KeyError, TypeError, IndexError, AttributeError) as e:
+            self._map.close()
+            raise BundleFormatError(f"{path}: unreadable index ({e})") from None
+        except BaseException:
+            self._map.close()
+            raise
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    def keys(self) -> list[str]:
+        return list(self._index)
+
+    def get(self, key: str) -> Any:
+        location = self._index.get(key)
+        if location is None:
+            return None
+        offset, length = location
+        try:
+            return json.loads(zlib.decompress(self._map[offset : offset + length]))
+        except (zlib.error, ValueError) as e:
+            print(f"Ignoring unreadable record {key!r} in topic bundle {self.path}: {e}")
+            return None
+
+    def info(self) -> dict[str, Any]:
+        """Summary for /health: path, build time, version, topic and entry counts, size in bytes."""
+        return {
+            "path": self.path,
+            "built_at": self.meta.get("created_at"),
+            "version": self.meta.get("version", ""),
+            "topics": len(self.meta.get("topics", [])),
+            "entries": len(self._index),
+            "bytes": len(self._map),
+        }
+
+    def close(self) -> None:
+        if not self._map.closed:
+            self._map.close()
@@ -0,0 +1,299 @@
+"""Canonical topic resolution.
+
+Free-text topics ("url-shortner", "TinyURL", "design a link shortener") are mapped to one canonical
+topic so that every topic-keyed cache (reference cache, topic bundle, coverage memo) sees a single
+key per design problem. A topic resolves, in order, by:
+
+    exact  its core form (normalized, filler words such as "design a" dropped) is a canonical name
+    alias  its core form is a listed alias of a canonical topic
+    fuzzy  a close match to a canonical name or alias (see below); TOPIC_APPLY_FUZZY=0 only reports
+           it as a suggestion and uses the topic as typed
+    none   no match; the topic is used as typed
+
+A near miss on a different design problem would give the user references for the wrong system, so
+the fuzzy score is strict. It compares the distinctive words of both forms: generic words ("distributed", "service", "app", ...) are ignored, the rest are
+weighted by inverse topic frequency, and words match by character-trigram similarity (so typos
+like "shortner" still match). The score is the weighted share of the query's words found in the
+candidate or of the candidate's words found in the query, whichever is lower, so "Slack bot" is
+not "Slack" and "web crawler" is not "web crawler and search". A fuzzy match needs a score of at
+least TOPIC_MATCH_THRESHOLD and a lead of TOPIC_MATCH_MARGIN over the best other topic.
+
+Candidate words come from a trigram inverted index, so lookups stay cheap as the table grows;
+results are memoized per core form. The alias table ships as app/topic_aliases.json;
+edits (PUT /admin/topics/{topic_id}) are saved to TOPIC_ALIASES_PATH, which overrides the shipped
+entries by topic id. Topics of a loaded topic bundle are added as canonical topics too.
+"""
+
+import contextvars
+import functools
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+from app import metrics
+from app.reference_cache import normalize_topic
+from app.schemas import TopicResolution
+
+TOPIC_MATCH_THRESHOLD = float(os.getenv("TOPIC_MATCH_THRESHOLD", "0.8"))
+TOPIC_MATCH_MARGIN = float(os.getenv("TOPIC_MATCH_MARGIN", "0.15"))
+TOPIC_APPLY_FUZZY = os.getenv("TOPIC_APPLY_FUZZY", "1") == "1"
+TOPIC_ALIASES_PATH = os.getenv("TOPIC_ALIASES_PATH", "topic_aliases.json")
+SEED_ALIASES_PATH = os.path.join(os.path.dirname(__file__), "topic_aliases.json")
+TOPIC_RESOLUTION_MEMO_SIZE = 4096
+
+# Words that do not change which design problem is meant.
+FILLER_WORDS = frozenset(
+    {"a", "an", "the", "design", "designing", "build", "building", "implement", "how", "to", "for", "of", "system"}
+)
+# Words shared by many different design problems; they never make two topics the same one.
+GENERIC_WORDS = frozenset(
+    {
+        "and", "or", "with", "like", "clone", "distributed", "scalable", "large", "scale", "online",
+        "service", "services", "system", "systems", "app", "application", "platform", "server", "tool",
+    }
+)
+# Two words count as the same word from this character-trigram Dice similarity (typos, plurals).
+WORD_MATCH_THRESHOLD = 0.6
+
+
+def core_form(topic: str) -> str:
+    """Normalized topic without filler words: "Design a URL-Shortener!" -> "url shortener"."""
+    words = normalize_topic(topic).split()
+    core = [w for w in words if w not in FILLER_WORDS]
+    return " ".join(core or words)
+
+
+def topic_id_for(name: str) -> str:
+    return core_form(name).replace(" ", "-")
+
+
+def _trigrams(text: str) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def _distinctive_words(form: str) -> set[str]:
+    words = set(form.split())
+    return (words - GENERIC_WORDS) or words
+
+
+def _word_similarity(a: str, b: str) -> float:
+    if a == b:
+        return 1.0
+    ga, gb = _trigrams(a), _trigrams(b)
+    return 2 * len(ga & gb) / (len(ga) + len(gb))
+
+
+class TopicIndex:
+    """Canonical topics with aliases, an exact-form map and a trigram inverted index."""
+
+    def __init__(
+        self,
+        threshold: float = TOPIC_MATCH_THRESHOLD,
+        overrides_path: str | None = None,
+        margin: float = TOPIC_MATCH_MARGIN,
+        apply_fuzzy: bool = TOPIC_APPLY_FUZZY,
+    ) -> None:
+        self.threshold = threshold
+        self.margin = margin
+        self.apply_fuzzy = apply_fuzzy
+        self.overrides_path = overrides_path
+        self._lock = threading.Lock()
+        self._topics: dict[str, dict[str, Any]] = {}  # topic id -> {"name", "aliases"}
+        self._overrides: dict[str, dict[str, Any]] = {}
+        self._forms: dict[str, tuple[str, str]] = {}  # core form -> (topic id, "exact" | "alias")
+        self._words: dict[str, set[str]] = {}  # core form -> its distinctive words
+        self._word_forms: dict[str, set[str]] = {}  # distinctive word -> core forms containing it
+        self._grams: dict[str, set[str]] = {}  # trigram -> distinctive words containing it
+        self._idf: dict[str, float] = {}  # distinctive word -> weight
+        self._max_idf = 1.0  # weight of a word no topic uses
+        self._memo: OrderedDict[str, tuple[str | None, str, float]] = OrderedDict()
+
+    def load(self, seed_path: str | None = SEED_ALIASES_PATH) -> None:
+        """Load the shipped table, then the saved edits on top of it."""
+        for path, is_override in ((seed_path, False), (self.overrides_path, True)):
+            if not path or not os.path.exists(path):
+                continue
+            try:
+                with open(path, encoding="utf-8") as f:
+                    table = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring topic alias table {path}: {e}")
+                continue
+            for topic_id, entry in table.items():
+                self.set_topic(topic_id, entry["name"], entry.get("aliases", []), persist=False)
+                if is_override:
+                    self._overrides[topic_id] = self._topics[topic_id]
+
+    def table(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            return {tid: {"name": e["name"], "aliases": list(e["aliases"])} for tid, e in self._topics.items()}
+
+    def set_topic(self, topic_id: str, name: str, aliases: list[str], *, persist: bool = True) -> None:
+        """Add or replace a canonical topic and its aliases; persist saves it to the overrides file."""
+        entry = {"name": name, "aliases": sorted({a.strip() for a in aliases if a.strip()})}
+        with self._lock:
+            self._topics[topic_id] = entry
+            if persist:
+                self._overrides[topic_id] = entry
+            self._rebuild()
+        if persist:
+            self._save()
+
+    def add_topics(self, names: list[str]) -> int:
+        """Register names (e.g. a bundle's catalog) as canonical topics unless they already resolve
+        exactly or by alias. Returns how many were added."""
+        added = 0
+        with self._lock:
+            for name in names:
+                form = core_form(name)
+                if form and form not in self._forms:
+                    self._topics.setdefault(topic_id_for(name), {"name": name, "aliases": []})
+                    self._forms[form] = (topic_id_for(name), "exact")  # skip later duplicates
+                    added += 1
+            if added:
+                self._rebuild()
+        return added
+
+    def _rebuild(self) -> None:
+        forms: dict[str, tuple[str, str]] = {}
+        for topic_id, entry in self._topics.items():
+            for alias in entry["aliases"]:
+                forms.setdefault(core_form(alias), (topic_id, "alias"))
+        for topic_id, entry in self._topics.items():
+            forms[core_form(entry["name"])] = (topic_id, "exact")
+        words = {form: _distinctive_words(form) for form in forms}
+        word_forms: dict[str, set[str]] = {}
+        word_topics: dict[str, set[str]] = {}
+        for form, form_words in words.items():
+            for word in form_words:
+                word_forms.setdefault(word, set()).add(form)
+                word_topics.setdefault(word, set()).add(forms[form][0])
+        grams: dict[str, set[str]] = {}
+        for word in word_forms:
+            for gram in _trigrams(word):
+                grams.setdefault(gram, set()).add(word)
+        n = max(1, len(self._topics))
+        self._idf = {word: 1 + math.log(n / len(ids)) for word, ids in word_topics.items()}
+        self._max_idf = 1 + math.log(n)
+        self._forms, self._words, self._word_forms, self._grams = forms, words, word_forms, grams
+        self._memo.clear()
+
+    def _save(self) -> None:
+        if not self.overrides_path:
+            return
+        with self._lock:
+            data = json.dumps(self._overrides, indent=2, ensure_ascii=False)
+        tmp = f"{self.overrides_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data + "\n")
+        os.replace(tmp, self.overrides_path)
+
+    def _score(self, query: dict[str, tuple[str, float]], form: str) -> float:
+        """min(query coverage, candidate coverage) of the candidate form, IDF-weighted."""
+        query_weight = sum(self._idf.get(w, self._max_idf) for w in query)
+        form_words = self._words[form]
+        form_weight = sum(self._idf[w] for w in form_words)
+        found_query = found_form = 0.0
+        for word, (best, similarity) in query.items():
+            if best in form_words:
+                found_query += self._idf.get(word, self._max_idf) * similarity
+                found_form += self._idf[best] * similarity
+        return min(found_query / query_weight, found_form / form_weight) if query_weight and form_weight else 0.0
+
+    def _match(self, form: str) -> tuple[str | None, str, float]:
+        hit = self._forms.get(form)
+        if hit is not None:
+            return hit[0], hit[1], 1.0
+        # Each distinctive query word -> the known words it matches, then the forms using them.
+        query: dict[str, dict[str, float]] = {}
+        for word in _distinctive_words(form):
+            candidates = {known for gram in _trigrams(word) for known in self._grams.get(gram, ())}
+            query[word] = {
+                known: sim for known in candidates if (sim := _word_similarity(word, known)) >= WORD_MATCH_THRESHOLD
+            }
+        forms = {f for matches in query.values() for known in matches for f in self._word_forms[known]}
+        best_by_topic: dict[str, float] = {}
+        for candidate in forms:
+            form_words = self._words[candidate]
+            # Per query word, its best match among this candidate's words.
+            aligned = {}
+            for word, matches in query.items():
+                in_form = [(sim, known) for known, sim in matches.items() if known in form_words]
+                aligned[word] = (max(in_form)[1], max(in_form)[0]) if in_form else ("", 0.0)
+            score = self._score(aligned, candidate)
+            topic_id = self._forms[candidate][0]
+            best_by_topic[topic_id] = max(score, best_by_topic.get(topic_id, 0.0))
+        ranked = sorted(best_by_topic.items(), key=lambda item: item[1], reverse=True)
+        if not ranked:
+            return None, "none", 0.0
+        best_id, best_score = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        if best_score < self.threshold or best_score - runner_up < self.margin:
+            return None, "none", round(best_score, 3)
+        return best_id, "fuzzy", round(best_score, 3)
+
+    def resolve(self, topic: str) -> TopicResolution:
+        form = core_form(topic)
+        with self._lock:
+            match = self._memo.get(form)
+            if match is None:
+                match = self._match(form)
+                self._memo[form] = match
+                if len(self._memo) > TOPIC_RESOLUTION_MEMO_SIZE:
+                    self._memo.popitem(last=False)
+            else:
+                self._memo.move_to_end(form)
+            topic_id, method, score = match
+            name = self._topics[topic_id]["name"] if topic_id is not None else None
+        if method == "fuzzy" and not self.apply_fuzzy:
+            return TopicResolution(input=topic, canonical=topic, method=method, score=score, suggestion=name)
+        return TopicResolution(input=topic, canonical=name or topic, topicId=topic_id, method=method, score=score)
+
+
+topic_index = TopicIndex(overrides_path=TOPIC_ALIASES_PATH)
+topic_index.load()
+
+
+_current_resolution: contextvars.ContextVar[TopicResolution | None] = contextvars.ContextVar(
+    "topic_resolution", default=None
+)
+
+
+def current_topic_resolution() -> TopicResolution | None:
+    """Resolution of the current request's topic (inside a with_topic_resolution handler)."""
+    return _current_resolution.get()
+
+
+def with_topic_resolution(fn: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """Endpoint decorator: replace req.topic with its canonical topic before the handler runs, count
+    the resolution method, log alias and fuzzy resolutions and set `topicResolution` on the response
+    model. Streaming handlers read it with current_topic_resolution() for their "done" body."""
+
+    @functools.wraps(fn)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        req = kwargs.get("req")
+        if req is None:
+            return await fn(*args, **kwargs)
+        resolution = topic_index.resolve(req.topic)
+        metrics.incr(f"topic.resolution.{resolution.method}")
+        if resolution.method in ("alias", "fuzzy"):
+            applied = "" if resolution.suggestion is None else ", not applied"
+            print(
+                f"topic resolution: {resolution.input!r} -> {resolution.suggestion or resolution.canonical!r} "
+                f"({resolution.method}, score {resolution.score}{applied})"
+            )
+        req.topic = resolution.canonical
+        token = _current_resolution.set(resolution)
+        try:
+            result = await fn(*args, **kwargs)
+        finally:
+            _current_resolution.reset(token)
+        if hasattr(result, "topicResolution"):
+            result.topicResolution = resolution
+        return result
+
+    return wrapper
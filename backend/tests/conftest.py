@@ -0,0 +1,24 @@
+"""Shared fixtures."""
+
+import pytest
+
+from app.render_store import RenderStore
+
+
+@pytest.fixture(autouse=True)
+def _only_patched_providers(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Ignore a developer's ANTHROPIC_API_KEY so tests only see the providers they configure."""
+    monkeypatch.setattr("app.llm.ANTHROPIC_API_KEY", None)
+
+
+@pytest.fixture(autouse=True)
+def _no_prefetch_on_validate(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Ignore a developer's PREFETCH_ON_VALIDATE=1: /validate tests must not start background
+    warm-ups against their fake clients."""
+    monkeypatch.setattr("app.main.PREFETCH_ON_VALIDATE", False)
+
+
+@pytest.fixture(autouse=True)
+def _in_memory_render_store(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Keep rendered diagrams out of RENDER_CACHE_DIR (and renders of earlier tests out of reach)."""
+    monkeypatch.setattr("app.main.render_store", RenderStore(path=""))
@@ -67,9 +67,9 @@ async def test_classify_apis_parses_object_based_json(monkeypatch: pytest.Monkey
         def __init__(self, *args: Any, **kwargs: Any) -> None:
             self.chat = _FakeChat()
 
-    # Patch AsyncOpenAI used inside classify_requirements_coverage
+    # Patch the shared LLM client used inside classify_requirements_coverage
     monkeypatch.setenv("OPENAI_API_KEY", "test-key")
-    monkeypatch.setattr("app.llm.AsyncOpenAI", _FakeClient)
+    monkeypatch.setattr("app.llm.get_llm_client", _FakeClient)
 
     result = await classify_requirements_coverage(
         reference,
@@ -0,0 +1,84 @@
+"""Tests for the per-provider LLM circuit breaker."""
+
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.llm as app_llm
+from app.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from app.main import app
+
+
+class _ServerError(Exception):
+    status_code = 503
+
+
+async def _fail() -> Any:
+    raise _ServerError("upstream unavailable")
+
+
+async def _ok() -> str:
+    return "ok"
+
+
+@pytest.mark.asyncio
+async def test_opens_after_threshold_and_short_circuits() -> None:
+    breaker = CircuitBreaker("test", failure_threshold=2, open_seconds=60)
+    for _ in range(2):
+        with pytest.raises(_ServerError):
+            await breaker.call(_fail)
+    assert breaker.state == OPEN
+
+    with pytest.raises(CircuitOpenError):
+        await breaker.call(_ok)
+
+
+@pytest.mark.asyncio
+async def test_half_open_probe_success_closes_and_failure_reopens() -> None:
+    breaker = CircuitBreaker("test", failure_threshold=1, open_seconds=0)
+    with pytest.raises(_ServerError):
+        await breaker.call(_fail)
+    assert breaker.state == HALF_OPEN
+
+    with pytest.raises(_ServerError):
+        await breaker.call(_fail)
+    assert breaker.state == HALF_OPEN
+    assert await breaker.call(_ok) == "ok"
+    assert breaker.state == CLOSED
+
+
+@pytest.mark.asyncio
+async def test_caller_errors_do_not_count() -> None:
+    breaker = CircuitBreaker("test", failure_threshold=1)
+
+    async def bad_request() -> Any:
+        raise ValueError("invalid prompt")
+
+    with pytest.raises(ValueError):
+        await breaker.call(bad_request)
+    assert breaker.state == CLOSED
+
+
+def test_open_circuit_returns_stub_with_degraded_flag(monkeypatch: pytest.MonkeyPatch) -> None:
+    calls = 0
+
+    def client() -> Any:
+        nonlocal calls
+        calls += 1
+        raise AssertionError("provider must not be called while the circuit is open")
+
+    breaker = CircuitBreaker("openai:test", failure_threshold=1, open_seconds=60)
+    breaker.record_failure(_ServerError())
+    openai_provider = next(p for p in app_llm.llm_router.providers if p.name == "openai")
+    monkeypatch.setattr(openai_provider, "breaker", breaker)
+    monkeypatch.setattr("app.llm.OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr("app.llm.get_llm_client", client)
+
+    response = TestClient(app).post(
+        "/validate-flow", json={"topic": "URL Shortener", "flowSummary": "Client -> API -> DB"}
+    )
+
+    assert response.status_code == 200
+    assert response.json()["degraded"] is True
+    assert calls == 0
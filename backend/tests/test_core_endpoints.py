@@ -10,7 +10,9 @@ def test_health_returns_ok() -> None:
     response = client.get("/health")
 
     assert response.status_code == 200
-    assert response.json() == {"status": "ok"}
+    body = response.json()
+    assert body["status"] == "ok"
+    assert body["circuits"]["openai:gpt-4o-mini"]["state"] in ("closed", "open", "half_open")
 
 
 def test_validate_returns_merged_and_coverage_fields() -> None:
@@ -0,0 +1,78 @@
+"""Tests for the coverage model cascade (fast model with confidence, strong model for unsure items)."""
+
+import json
+from typing import Any
+
+import pytest
+
+from app import metrics
+from app.coverage_memo import CoverageVerdictMemo
+from app.llm import classify_requirements_coverage
+
+REFERENCE = ["Shorten long URLs", "Custom aliases", "Link expiration"]
+
+
+class _TieredClient:
+    """Fake LLM client: the fast model matches everything but is unsure about "Custom aliases";
+    the strong model says "Custom aliases" is missed."""
+
+    def __init__(self) -> None:
+        self.models: list[str] = []
+        self.strong_refs: list[str] = []
+        outer = self
+
+        class _Completions:
+            async def create(self, *args: Any, **kwargs: Any) -> Any:
+                model = kwargs["model"]
+                outer.models.append(model)
+                ref_block = kwargs["messages"][1]["content"].split("\n\n")[0]
+                refs = [line[2:] for line in ref_block.splitlines()[1:]]
+                if model == "gpt-4o-mini":
+                    confidence = {r: 0.3 if r == "Custom aliases" else 0.95 for r in refs}
+                    payload: dict[str, Any] = {"matched": refs, "missed": [], "confidence": confidence}
+                else:
+                    outer.strong_refs = refs
+                    payload = {"matched": [], "missed": refs}
+                message = type("Msg", (), {"content": json.dumps(payload)})()
+                return type("Resp", (), {"choices": [type("Choice", (), {"message": message})()]})()
+
+        self.chat = type("Chat", (), {"completions": _Completions()})()
+
+
+@pytest.fixture
+def tiered_client(monkeypatch: pytest.MonkeyPatch) -> _TieredClient:
+    client = _TieredClient()
+    monkeypatch.setattr("app.llm.OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr("app.llm.get_llm_client", lambda: client)
+    monkeypatch.setattr("app.llm.coverage_memo", CoverageVerdictMemo())
+    monkeypatch.setattr(
+        "app.llm.settle_coverage", lambda refs, answers: {"matched": [], "missed": [], "borderline": list(refs)}
+    )
+    metrics.reset()
+    return client
+
+
+@pytest.mark.asyncio
+async def test_only_low_confidence_items_escalate(
+    tiered_client: _TieredClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr("app.llm.COVERAGE_CASCADE", True)
+
+    result = await classify_requirements_coverage(REFERENCE, ["shorten links"], for_requirements=True)
+
+    assert tiered_client.models == ["gpt-4o-mini", "gpt-4o"]
+    assert tiered_client.strong_refs == ["Custom aliases"]
+    assert result == {"matched": ["Shorten long URLs", "Link expiration"], "missed": ["Custom aliases"]}
+    counters = metrics.snapshot()["counters"]
+    assert counters["coverage.tier.fast"] == 2
+    assert counters["coverage.tier.strong"] == 1
+    assert counters["coverage.cascade.changed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cascade_off_uses_fast_verdicts_only(tiered_client: _TieredClient) -> None:
+    result = await classify_requirements_coverage(REFERENCE, ["shorten links"], for_requirements=True)
+
+    assert tiered_client.models == ["gpt-4o-mini"]
+    assert result["matched"] == REFERENCE
+    assert metrics.snapshot()["counters"]["coverage.tier.fast"] == 3
@@ -0,0 +1,84 @@
+"""Tests for the pairwise coverage-verdict memo used by classify_requirements_coverage."""
+
+import json
+from typing import Any
+
+import pytest
+
+from app.coverage_memo import CoverageVerdictMemo
+from app.llm import classify_requirements_coverage
+
+
+class _RecordingClient:
+    """Fake LLM client: matches every reference item to the first user answer, records prompts."""
+
+    def __init__(self) -> None:
+        self.prompts: list[str] = []
+        outer = self
+
+        class _Completions:
+            async def create(self, *args: Any, **kwargs: Any) -> Any:
+                user_content = kwargs["messages"][1]["content"]
+                outer.prompts.append(user_content)
+                ref_block = user_content.split("\n\n")[0]
+                refs = [line[2:] for line in ref_block.splitlines()[1:]]
+                first_answer = user_content.split("User's requirements:\n- ")[1].splitlines()[0]
+                payload = {"matched": refs, "missed": [], "evidence": {r: first_answer for r in refs}}
+                message = type("Msg", (), {"content": json.dumps(payload)})()
+                return type("Resp", (), {"choices": [type("Choice", (), {"message": message})()]})()
+
+        self.chat = type("Chat", (), {"completions": _Completions()})()
+
+
+def test_resolve_uses_known_matches_and_all_known_misses() -> None:
+    memo = CoverageVerdictMemo()
+    memo.put("k", "Low latency", "fast API", True)
+    memo.put("k", "High availability", "fast API", False)
+    memo.put("k", "High availability", "Scale to millions", False)
+
+    matched, missed, unresolved = memo.resolve(
+        "k", ["Low latency", "High availability", "Durability"], ["Fast API ", "scale to millions"]
+    )
+    assert matched == ["Low latency"]
+    assert missed == ["High availability"]
+    assert unresolved == ["Durability"]
+
+
+def test_no_answers_means_everything_missed_without_llm() -> None:
+    memo = CoverageVerdictMemo()
+    assert memo.resolve("k", ["Low latency"], ["", "  "]) == ([], ["Low latency"], [])
+
+
+def test_record_learns_misses_for_all_answers_and_matches_from_evidence() -> None:
+    memo = CoverageVerdictMemo()
+    memo.record("k", ["a", "b"], matched=["R1"], missed=["R2"], evidence={"R1": "b"})
+    assert memo.get("k", "R1", "b") is True
+    assert memo.get("k", "R1", "a") is None
+    assert memo.get("k", "R2", "a") is False and memo.get("k", "R2", "b") is False
+
+
+@pytest.mark.asyncio
+async def test_resubmission_only_sends_unresolved_items(monkeypatch: pytest.MonkeyPatch) -> None:
+    client = _RecordingClient()
+    monkeypatch.setattr("app.llm.OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr("app.llm.get_llm_client", lambda: client)
+    monkeypatch.setattr("app.llm.coverage_memo", CoverageVerdictMemo())
+    # Keep every item borderline so only the memo can settle it locally.
+    monkeypatch.setattr(
+        "app.llm.settle_coverage", lambda refs, _answers: {"matched": [], "missed": [], "borderline": list(refs)}
+    )
+    reference = ["Users can shorten URLs", "Users can see click analytics"]
+
+    first = await classify_requirements_coverage(reference, ["shorten links"], for_requirements=True)
+    assert first["matched"] == reference
+    assert len(client.prompts) == 1
+
+    again = await classify_requirements_coverage(reference, ["shorten links"], for_requirements=True)
+    assert again == first
+    assert len(client.prompts) == 1
+
+    edited = await classify_requirements_coverage(
+        reference, ["shorten links", "custom aliases"], for_requirements=True
+    )
+    assert edited["matched"] == reference
+    assert len(client.prompts) == 1
@@ -0,0 +1,53 @@
+"""Tests for per-endpoint latency budgets and the degraded fallback."""
+
+import asyncio
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.deadline import request_budget, run_within_budget
+from app.main import app
+
+
+class _SlowCompletions:
+    async def create(self, *args: Any, **kwargs: Any) -> Any:
+        await asyncio.sleep(5)
+        raise AssertionError("should have been cancelled by the request budget")
+
+
+class _SlowClient:
+    def __init__(self) -> None:
+        self.chat = type("Chat", (), {"completions": _SlowCompletions()})()
+
+
+@pytest.mark.asyncio
+async def test_run_within_budget_times_out_and_marks_degraded(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("LLM_DEADLINE_VALIDATE", "0.05")
+    with request_budget("validate") as budget:
+        with pytest.raises(TimeoutError):
+            await run_within_budget(asyncio.sleep(1))
+    assert budget.degraded is True
+
+
+@pytest.mark.asyncio
+async def test_run_within_budget_without_budget_awaits_normally() -> None:
+    assert await run_within_budget(asyncio.sleep(0, result="done")) == "done"
+
+
+def test_validate_flow_returns_stub_with_degraded_flag_when_budget_runs_out(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("LLM_DEADLINE_VALIDATE_FLOW", "0.05")
+    monkeypatch.setattr("app.llm.OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr("app.llm.get_llm_client", _SlowClient)
+
+    response = TestClient(app).post(
+        "/validate-flow",
+        json={"topic": "URL Shortener", "flowSummary": "Client -> LB -> API -> DB"},
+    )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["degraded"] is True
+    assert body["feedback"].startswith("Flow summary was not validated")
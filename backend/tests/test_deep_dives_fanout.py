@@ -0,0 +1,103 @@
+"""Tests for the per-topic deep-dive fan-out mode (DEEP_DIVES_FANOUT=1)."""
+
+import asyncio
+import json
+from typing import Any
+
+import pytest
+
+from app.llm import call_llm_deep_dives
+from app.reference_cache import ReferenceCache
+
+
+class _FanoutClient:
+    """Fake LLM client: answers item and missing-topic prompts, records calls and peak concurrency."""
+
+    def __init__(self, fail_topic: str | None = None) -> None:
+        self.item_calls: list[str] = []
+        self.missing_calls = 0
+        self.active = 0
+        self.peak = 0
+        outer = self
+
+        class _Completions:
+            async def create(self, *args: Any, **kwargs: Any) -> Any:
+                system, user = (m["content"] for m in kwargs["messages"])
+                outer.active += 1
+                outer.peak = max(outer.peak, outer.active)
+                try:
+                    await asyncio.sleep(0.01)
+                finally:
+                    outer.active -= 1
+                if "suggestedMissingTopics" in system:
+                    outer.missing_calls += 1
+                    payload: dict = {"suggestedMissingTopics": ["Monitoring", "Replication", "Rate limiting"]}
+                else:
+                    sub_topic = user.split("Deep dive sub-topic: ")[1].splitlines()[0]
+                    outer.item_calls.append(sub_topic)
+                    if sub_topic == fail_topic:
+                        raise RuntimeError("upstream error")
+                    payload = {"suggestedSummary": f"About {sub_topic}.", "feedback": "ok" if "User's summary" in user else ""}
+                message = type("Msg", (), {"content": json.dumps(payload)})()
+                return type("Resp", (), {"choices": [type("Choice", (), {"message": message})()]})()
+
+        self.chat = type("Chat", (), {"completions": _Completions()})()
+
+
+@pytest.fixture
+def fanout(monkeypatch: pytest.MonkeyPatch):
+    def install(client: _FanoutClient, concurrency: int = 4) -> _FanoutClient:
+        monkeypatch.setattr("app.llm.OPENAI_API_KEY", "test-key")
+        monkeypatch.setattr("app.llm.DEEP_DIVES_FANOUT", True)
+        monkeypatch.setattr("app.llm.DEEP_DIVES_CONCURRENCY", concurrency)
+        monkeypatch.setattr("app.llm.get_llm_client", lambda: client)
+        monkeypatch.setattr("app.llm.reference_cache", ReferenceCache(path=""))
+        return client
+
+    return install
+
+
+DIVES = [
+    {"topic": "Caching", "userSummary": "Redis in front of the DB"},
+    {"topic": "Sharding", "userSummary": ""},
+    {"topic": "Rate limiting", "userSummary": "Token bucket"},
+]
+
+
+@pytest.mark.asyncio
+async def test_one_call_per_topic_and_results_in_user_order(fanout) -> None:
+    client = fanout(_FanoutClient(), concurrency=2)
+
+    result = await call_llm_deep_dives("URL Shortener", DIVES)
+
+    assert [x["topic"] for x in result["items"]] == ["Caching", "Sharding", "Rate limiting"]
+    assert result["items"][0] == {"topic": "Caching", "suggestedSummary": "About Caching.", "feedback": "ok"}
+    assert result["items"][1]["feedback"] == ""
+    assert result["suggestedMissingTopics"] == ["Monitoring", "Replication", "Rate limiting"]
+    assert sorted(client.item_calls) == ["Caching", "Rate limiting", "Sharding"]
+    assert client.missing_calls == 1
+    assert client.peak <= 2
+
+
+@pytest.mark.asyncio
+async def test_editing_one_summary_reruns_only_that_item(fanout) -> None:
+    client = fanout(_FanoutClient())
+    await call_llm_deep_dives("URL Shortener", DIVES)
+    client.item_calls.clear()
+
+    edited = [dict(d) for d in DIVES]
+    edited[2]["userSummary"] = "Sliding window in Redis"
+    await call_llm_deep_dives("URL Shortener", edited)
+
+    assert client.item_calls == ["Rate limiting"]
+    assert client.missing_calls == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_item_does_not_blank_the_others(fanout) -> None:
+    fanout(_FanoutClient(fail_topic="Sharding"))
+
+    result = await call_llm_deep_dives("URL Shortener", DIVES)
+
+    summaries = {x["topic"]: x["suggestedSummary"] for x in result["items"]}
+    assert summaries == {"Caching": "About Caching.", "Sharding": "", "Rate limiting": "About Rate limiting."}
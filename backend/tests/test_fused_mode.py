@@ -0,0 +1,93 @@
+"""Tests for fused mode: one LLM call returns the reference list and the coverage verdicts."""
+
+import json
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import llm as app_llm
+from app.coverage_memo import CoverageVerdictMemo
+from app.main import app
+from app.reference_cache import ReferenceCache
+
+REFERENCE_APIS = [
+    "POST /urls - create short URL",
+    "GET /{code} - redirect",
+    "GET /urls/{code}/stats - analytics",
+    "DELETE /urls/{code} - delete URL",
+    "PUT /urls/{code} - update URL",
+]
+
+
+class _FusedClient:
+    """Fake LLM client: answers the fused APIs prompt with a reference list plus apis_matched."""
+
+    def __init__(self) -> None:
+        self.calls: list[str] = []
+        self.payload: dict[str, Any] = {"apis": REFERENCE_APIS, "apis_matched": [REFERENCE_APIS[0], REFERENCE_APIS[1]]}
+        outer = self
+
+        class _Completions:
+            async def create(self, *args: Any, **kwargs: Any) -> Any:
+                outer.calls.append(kwargs["messages"][0]["content"])
+                payload = outer.payload
+                message = type("Msg", (), {"content": json.dumps(payload)})()
+                return type("Resp", (), {"choices": [type("Choice", (), {"message": message})()]})()
+
+        self.chat = type("Chat", (), {"completions": _Completions()})()
+
+
+@pytest.fixture
+def fused_client(monkeypatch: pytest.MonkeyPatch) -> _FusedClient:
+    client = _FusedClient()
+    monkeypatch.setattr("app.main.LLM_FUSED_MODE", True)
+    monkeypatch.setattr("app.llm.OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr("app.llm.get_llm_client", lambda: client)
+    monkeypatch.setattr("app.llm.reference_cache", ReferenceCache(path=""))
+    monkeypatch.setattr("app.llm.coverage_memo", CoverageVerdictMemo())
+    return client
+
+
+def test_validate_apis_uses_one_fused_call(fused_client: _FusedClient) -> None:
+    response = TestClient(app).post(
+        "/validate-apis",
+        json={"topic": "URL shortener", "apis": ["POST /shorten", "GET /:code redirects"]},
+    )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert len(fused_client.calls) == 1
+    assert "apis_matched" in fused_client.calls[0]
+    assert body["matched"] == [a for a in body["apis"] if a in REFERENCE_APIS[:2]]
+    assert set(body["matched"]) | set(body["missed"]) == set(body["apis"])
+
+
+def test_fused_reference_is_cached_and_next_request_uses_regular_path(fused_client: _FusedClient) -> None:
+    client = TestClient(app)
+    payload = {"topic": "URL shortener", "apis": ["POST /shorten"]}
+    client.post("/validate-apis", json=payload)
+    calls_after_first = len(fused_client.calls)
+
+    response = client.post("/validate-apis", json=payload)
+
+    assert response.status_code == 200
+    # Reference now comes from the cache; no second fused call is made.
+    assert not any("apis_matched" in c for c in fused_client.calls[calls_after_first:])
+
+
+@pytest.mark.asyncio
+async def test_fused_estimation_verdicts_seed_the_regular_coverage_memo(fused_client: _FusedClient) -> None:
+    elements = ["DAU", "Peak QPS", "Storage per year"]
+    answers = ["100M DAU, 1,200 QPS at peak"]
+    fused_client.payload = {"elements": elements, "elements_matched": elements[:2]}
+
+    fused = await app_llm.call_llm_fused("estimation", "URL shortener", {"elements": answers})
+    assert fused is not None and len(fused_client.calls) == 1
+
+    # /validate-estimation classifies without flags; those verdicts are now memo hits.
+    matched, missed, unresolved = app_llm.coverage_memo.resolve(app_llm.coverage_kind(), elements, answers)
+    assert (matched, missed, unresolved) == (elements[:2], elements[2:], [])
+    coverage = await app_llm.classify_requirements_coverage(elements, answers)
+    assert coverage == {"matched": elements[:2], "missed": elements[2:]}
+    assert len(fused_client.calls) == 1
@@ -0,0 +1,96 @@
+"""Tests for hedged LLM requests."""
+
+import asyncio
+
+import pytest
+
+from app.hedging import Hedger, LatencyTracker
+from app.llm_scheduler import LLMScheduler
+
+
+def _warm_tracker(kind: str, seconds: float, n: int = 20) -> LatencyTracker:
+    tracker = LatencyTracker()
+    for _ in range(n):
+        tracker.record(kind, seconds)
+    return tracker
+
+
+def test_percentile_needs_min_samples() -> None:
+    tracker = LatencyTracker()
+    for i in range(1, 11):
+        tracker.record("flow", i / 10)
+    assert tracker.percentile("flow", 90, min_samples=20) is None
+    assert tracker.percentile("flow", 90, min_samples=10) == pytest.approx(0.9)
+
+
+@pytest.mark.asyncio
+async def test_slow_call_is_hedged_and_fast_duplicate_wins() -> None:
+    hedger = Hedger(enabled=True, percentile=95, budget=1.0, tracker=_warm_tracker("flow", 0.01))
+    durations = iter([5.0, 0.01])
+    started: list[float] = []
+    cancelled = 0
+
+    async def call() -> float:
+        nonlocal cancelled
+        duration = next(durations)
+        started.append(duration)
+        try:
+            await asyncio.sleep(duration)
+        except asyncio.CancelledError:
+            cancelled += 1
+            raise
+        return duration
+
+    assert await asyncio.wait_for(hedger.run("flow", call), timeout=1) == 0.01
+    assert started == [5.0, 0.01]
+    assert cancelled == 1
+    assert hedger.hedges == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_loser_refunds_its_token_reservation() -> None:
+    hedger = Hedger(enabled=True, percentile=95, budget=1.0, tracker=_warm_tracker("flow", 0.01))
+    scheduler = LLMScheduler(max_in_flight=4, tokens_per_minute=6000)
+    durations = iter([5.0, 0.01])
+
+    async def call() -> str:
+        await asyncio.sleep(next(durations))
+        return "done"
+
+    result = await asyncio.wait_for(hedger.run("flow", lambda: scheduler.run(call, tokens=1000)), timeout=1)
+    assert result == "done"
+    # Both copies reserved 1000 tokens; only the winner's charge stays (no usage reported).
+    assert 4900 <= scheduler.bucket.tokens <= 5100
+
+
+@pytest.mark.asyncio
+async def test_budget_caps_extra_calls() -> None:
+    hedger = Hedger(enabled=True, percentile=50, budget=0.05, tracker=_warm_tracker("apis", 0.001))
+    calls = 0
+
+    async def slowish() -> str:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "ok"
+
+    for _ in range(40):
+        await hedger.run("apis", slowish)
+
+    assert hedger.hedges <= 0.05 * hedger.calls
+    assert calls == 40 + hedger.hedges
+
+
+@pytest.mark.asyncio
+async def test_disabled_hedger_never_duplicates() -> None:
+    hedger = Hedger(enabled=False, tracker=_warm_tracker("flow", 0.001))
+    calls = 0
+
+    async def call() -> str:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "ok"
+
+    assert await hedger.run("flow", call) == "ok"
+    assert calls == 1
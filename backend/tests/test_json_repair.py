@@ -0,0 +1,57 @@
+"""Tests for tolerant parsing of LLM JSON replies."""
+
+import json
+
+import pytest
+
+from app.json_repair import UnparseableJSON, parse_llm_json, parse_stats, repair_json
+from app.llm_schemas import SCHEMAS, response_format_for
+
+
+def test_truncated_reply_keeps_complete_fields_and_drops_partial_list_item() -> None:
+    text = '{"functional_requirements": ["Shorten URLs", "Redirect"], "non_functional_requirements": ["Low lat'
+
+    assert repair_json(text) == {
+        "functional_requirements": ["Shorten URLs", "Redirect"],
+        "non_functional_requirements": [],
+    }
+
+
+def test_unterminated_text_field_is_closed() -> None:
+    assert repair_json('{"correct": true, "feedback": "Missing the cache lay') == {
+        "correct": True,
+        "feedback": "Missing the cache lay",
+    }
+
+
+def test_fenced_reply_with_trailing_text() -> None:
+    assert repair_json('```json\n{"apis": ["GET /x"]}\n```') == {"apis": ["GET /x"]}
+    assert repair_json('Here you go: {"apis": []} Hope this helps!') == {"apis": []}
+
+
+def test_parse_outcomes_are_counted_per_kind() -> None:
+    assert parse_llm_json("test_kind", json.dumps({"a": 1})) == {"a": 1}
+    assert parse_llm_json("test_kind", '{"a": 1, "b": [1, 2') == {"a": 1, "b": [1, 2]}
+    with pytest.raises(UnparseableJSON):
+        parse_llm_json("test_kind", "no json here")
+
+    stats = parse_stats()["test_kind"]
+    assert (stats["ok"], stats["repaired"], stats["failed"]) == (1, 1, 1)
+    assert stats["success_rate"] == pytest.approx(0.667)
+
+
+def test_strict_schemas_require_every_property() -> None:
+    def check(schema: dict) -> None:
+        if schema.get("type") == "object" and "properties" in schema:
+            assert schema["required"] == list(schema["properties"])
+            assert schema["additionalProperties"] is False
+            for child in schema["properties"].values():
+                check(child)
+        if schema.get("type") == "array":
+            check(schema["items"])
+
+    for kind, (schema, strict) in SCHEMAS.items():
+        if strict:
+            check(schema)
+    assert response_format_for("flow")["json_schema"]["strict"] is True
+    assert response_format_for("fused_apis") == {"type": "json_object"}
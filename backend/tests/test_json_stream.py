@@ -0,0 +1,46 @@
+"""Tests for the incremental JSON parser used by the SSE endpoints."""
+
+import json
+
+import pytest
+
+from app.json_stream import JsonStreamParser
+
+DOC = json.dumps(
+    {
+        "correct": True,
+        "feedback": 'Has "quotes", commas } and braces',
+        "items": [{"topic": "Caching", "tags": ["a", "b"]}, "plain", None, 3.5],
+        "nested": {"inner": [1]},
+        "last": False,
+    }
+)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, len(DOC)])
+def test_fields_and_array_items_are_reported_in_order_for_any_chunking(chunk_size: int) -> None:
+    parser = JsonStreamParser()
+    events = []
+    for i in range(0, len(DOC), chunk_size):
+        events += parser.feed(DOC[i : i + chunk_size])
+
+    assert parser.done
+    assert events == [
+        (("correct",), True),
+        (("feedback",), 'Has "quotes", commas } and braces'),
+        (("items", 0), {"topic": "Caching", "tags": ["a", "b"]}),
+        (("items", 1), "plain"),
+        (("items", 2), None),
+        (("items", 3), 3.5),
+        (("items",), [{"topic": "Caching", "tags": ["a", "b"]}, "plain", None, 3.5]),
+        (("nested", "inner"), [1]),
+        (("nested",), {"inner": [1]}),
+        (("last",), False),
+    ]
+
+
+def test_field_is_reported_as_soon_as_it_closes() -> None:
+    parser = JsonStreamParser()
+    assert parser.feed('{"feedback": "Looks go') == []
+    assert parser.feed('od", "improvements": "') == [(("feedback",), "Looks good")]
+    assert not parser.done
@@ -0,0 +1,89 @@
+"""Tests for the pooled Kroki renderer against the local fake Kroki."""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.fake_kroki import create_fake_kroki, first_valid
+from app.kroki import KrokiRenderer, is_valid_image
+
+MERMAID = "flowchart TB\n  C[Client] --> API[API]"
+D2 = "client -> api: HTTPS"
+
+
+def _renderer(timeout: float = 2.0, max_concurrency: int = 8, **fake_options: float) -> KrokiRenderer:
+    fake = create_fake_kroki(**fake_options)
+    return KrokiRenderer(
+        "http://fake-kroki", timeout=timeout, max_concurrency=max_concurrency, transport=httpx.ASGITransport(app=fake)
+    )
+
+
+@pytest.mark.asyncio
+async def test_renders_valid_images_and_rejects_wrong_engine() -> None:
+    renderer = _renderer()
+    png = await renderer.render("mermaid", "png", MERMAID)
+    svg = await renderer.render("d2", "svg", D2)
+    assert png is not None and is_valid_image("png", png)
+    assert svg is not None and is_valid_image("svg", svg)
+    assert await renderer.render("mermaid", "png", D2) is None
+    assert await renderer.render("plantuml", "png", MERMAID) is None
+    await renderer.close()
+
+
+@pytest.mark.asyncio
+async def test_hanging_render_times_out() -> None:
+    renderer = _renderer(timeout=0.1, hang_rate=1.0)
+    started = time.monotonic()
+    assert await renderer.render("mermaid", "png", MERMAID) is None
+    assert time.monotonic() - started < 1.0
+    await renderer.close()
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limit_bounds_in_flight_renders() -> None:
+    renderer = _renderer(max_concurrency=2, latency_ms=50)
+    started = time.monotonic()
+    results = await asyncio.gather(*(renderer.render("mermaid", "png", MERMAID) for _ in range(6)))
+    assert all(results)
+    assert time.monotonic() - started >= 0.07  # three waves of two (each 25-75ms)
+    await renderer.close()
+
+
+@pytest.mark.asyncio
+async def test_race_keeps_first_valid_image_and_cancels_the_rest() -> None:
+    cancelled = asyncio.Event()
+
+    async def slow_success() -> str:
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        return "slow"
+
+    async def fast_failure() -> None:
+        return None
+
+    async def medium_success() -> str:
+        await asyncio.sleep(0.01)
+        return "medium"
+
+    started = time.monotonic()
+    assert await first_valid([slow_success, fast_failure, medium_success], race=True) == "medium"
+    assert time.monotonic() - started < 1.0
+    await asyncio.sleep(0)
+    assert cancelled.is_set()
+    assert await first_valid([fast_failure, medium_success], race=False) == "medium"
+    assert await first_valid([fast_failure], race=True) is None
+
+
+@pytest.mark.asyncio
+async def test_d2_source_falls_back_without_waiting_for_mermaid() -> None:
+    renderer = _renderer(latency_ms=10)
+    image = await first_valid(
+        [lambda: renderer.render("mermaid", "png", D2), lambda: renderer.render("d2", "png", D2)], race=True
+    )
+    assert image is not None and is_valid_image("png", image)
+    await renderer.close()
@@ -0,0 +1,23 @@
+"""Tests for the shared pooled LLM client lifecycle."""
+
+import pytest
+
+from app import llm_client
+
+
+@pytest.mark.asyncio
+async def test_get_llm_client_reuses_one_instance_until_closed(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    first = llm_client.get_llm_client()
+    assert llm_client.get_llm_client() is first
+
+    await llm_client.close_llm_client()
+    second = llm_client.get_llm_client()
+    assert second is not first
+    await llm_client.close_llm_client()
+
+
+@pytest.mark.asyncio
+async def test_open_llm_client_is_noop_without_api_key(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    assert await llm_client.open_llm_client() is None
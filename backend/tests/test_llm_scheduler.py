@@ -0,0 +1,116 @@
+"""Tests for outbound LLM admission control (concurrency, priorities, TPM bucket, retries)."""
+
+import asyncio
+from typing import Any
+
+import httpx
+import pytest
+
+from app.deadline import request_budget
+from app.llm_scheduler import LLMScheduler, Priority, TokenBucket
+
+
+class _RateLimited(Exception):
+    """Shaped like openai.RateLimitError: status_code + response with headers."""
+
+    status_code = 429
+
+    def __init__(self, retry_after: str) -> None:
+        super().__init__("rate limited")
+        self.response = httpx.Response(429, headers={"retry-after": retry_after})
+
+
+@pytest.mark.asyncio
+async def test_max_in_flight_is_enforced() -> None:
+    scheduler = LLMScheduler(max_in_flight=2)
+    active = peak = 0
+
+    async def call() -> None:
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+
+    await asyncio.gather(*(scheduler.run(call, tokens=10) for _ in range(6)))
+    assert peak == 2
+    assert scheduler.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_interactive_waiters_are_admitted_before_background() -> None:
+    scheduler = LLMScheduler(max_in_flight=1)
+    order: list[str] = []
+    gate = asyncio.Event()
+
+    async def hold() -> None:
+        await gate.wait()
+
+    async def record(name: str) -> None:
+        order.append(name)
+
+    holder = asyncio.create_task(scheduler.run(hold, tokens=1))
+    await asyncio.sleep(0)
+    background = asyncio.create_task(scheduler.run(lambda: record("background"), tokens=1, priority=Priority.BACKGROUND))
+    interactive = asyncio.create_task(scheduler.run(lambda: record("interactive"), tokens=1, priority=Priority.INTERACTIVE))
+    await asyncio.sleep(0)
+    gate.set()
+    await asyncio.gather(holder, background, interactive)
+
+    assert order == ["interactive", "background"]
+
+
+def test_token_bucket_refuses_when_empty_and_reports_wait() -> None:
+    bucket = TokenBucket(per_minute=600)  # 10 tokens/s
+    assert bucket.try_take(600)
+    assert not bucket.try_take(100)
+    assert 9.0 < bucket.wait_time(100) <= 10.0
+    bucket.adjust(100)
+    assert bucket.try_take(100)
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_is_retried_after_retry_after_and_pauses_bucket() -> None:
+    scheduler = LLMScheduler(tokens_per_minute=60000, retry_base=0.001)
+    calls = 0
+
+    async def flaky() -> str:
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise _RateLimited("0.05")
+        return "ok"
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    assert await scheduler.run(flaky, tokens=10) == "ok"
+    assert calls == 2
+    assert loop.time() - started >= 0.05
+
+
+@pytest.mark.asyncio
+async def test_non_retryable_errors_propagate_immediately() -> None:
+    scheduler = LLMScheduler()
+    calls = 0
+
+    async def broken() -> Any:
+        nonlocal calls
+        calls += 1
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        await scheduler.run(broken, tokens=10)
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_retry_that_would_outlast_the_budget_gives_up(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("LLM_DEADLINE_VALIDATE", "1")
+    scheduler = LLMScheduler()
+
+    async def limited() -> Any:
+        raise _RateLimited("30")
+
+    with request_budget("validate"):
+        with pytest.raises(_RateLimited):
+            await scheduler.run(limited, tokens=10)
@@ -0,0 +1,160 @@
+"""Tests for the in-process Mermaid flowchart renderer and its use for suggested diagrams."""
+
+import asyncio
+import re
+import xml.etree.ElementTree as ET
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.mermaid_svg import NativeMermaidRenderer, UnsupportedMermaid, is_supported, parse, render_svg
+from app.render_store import render_id
+
+DIAGRAM = """flowchart TB
+  %% prompt-style diagram
+  subgraph client[Client tier]
+    U[User] --> LB[Load Balancer]
+  end
+  subgraph data[Data tier]
+    DB[(Postgres)]
+    C[Cache<br>Redis]
+  end
+  LB --> API[API Server] --> C
+  API --> DB
+  C --> DB
+"""
+
+SVG = "{http://www.w3.org/2000/svg}"
+
+
+def _node_boxes(svg: str) -> dict[str, tuple[float, float]]:
+    """Label -> (x, y) of the first tspan, i.e. where each label is drawn."""
+    root = ET.fromstring(svg)
+    return {
+        span.text: (float(span.get("x")), float(span.get("y")))
+        for group in root.iter(f"{SVG}g")
+        if "node" in (group.get("class") or "")
+        for span in group.iter(f"{SVG}tspan")
+    }
+
+
+def test_parses_the_prompted_subset() -> None:
+    chart = parse(DIAGRAM)
+    assert chart.direction == "TB"
+    assert list(chart.nodes) == ["U", "LB", "DB", "C", "API"]
+    assert chart.nodes["DB"].shape == "db"
+    assert chart.nodes["API"].label == "API Server"
+    assert chart.edges == [("U", "LB"), ("LB", "API"), ("API", "C"), ("API", "DB"), ("C", "DB")]
+    assert chart.clusters["client"].title == "Client tier"
+    assert chart.clusters["data"].nodes == ["DB", "C"]
+    assert parse("graph LR; A-->B").direction == "LR"
+    assert parse('flowchart TD\n  subgraph "Edge"\n    A["CDN (global)"]\n  end').nodes["A"].label == "CDN (global)"
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        "",
+        "sequenceDiagram\n  A->>B: hi",
+        "flowchart TB\n  A -->|HTTPS| B",
+        "flowchart TB\n  A -.-> B",
+        "flowchart TB\n  A{Decision} --> B",
+        "flowchart TB\n  A & B --> C",
+        "flowchart TB\n  subgraph s[S]\n  A --> B",
+        "flowchart TB\n  A --> B\n  end",
+        "flowchart TB\n  classDef hot fill:#f00",
+    ],
+)
+def test_rejects_syntax_outside_the_subset(source: str) -> None:
+    with pytest.raises(UnsupportedMermaid):
+        parse(source)
+    assert not is_supported(source)
+
+
+def test_layered_layout_top_to_bottom() -> None:
+    svg = render_svg(DIAGRAM)
+    ET.fromstring(svg)  # well-formed
+    boxes = _node_boxes(svg)
+    assert boxes["User"][1] < boxes["Load Balancer"][1] < boxes["API Server"][1] < boxes["Cache"][1] < boxes["Postgres"][1]
+    assert "Redis" in boxes  # <br> splits the label over two lines
+    assert svg.count('class="edge"') == 5
+    assert 'class="node db"' in svg
+    assert svg.count('class="cluster"') == 2
+
+
+def test_left_to_right_and_cycles() -> None:
+    svg = render_svg("flowchart LR\n  A[Alpha] --> B[Beta] --> C[Gamma] --> A")
+    boxes = _node_boxes(svg)
+    assert boxes["Alpha"][0] < boxes["Beta"][0] < boxes["Gamma"][0]
+    width, height = (float(v) for v in re.search(r'width="(\d+)" height="(\d+)"', svg).groups())
+    assert width > height
+    # The back edge keeps its direction: it ends at Alpha.
+    back = re.findall(r'class="edge" d="([^"]+)"', svg)[-1]
+    end_x = float(back.split()[-1].lstrip("L").split(",")[0])
+    assert abs(end_x - boxes["Alpha"][0]) < abs(end_x - boxes["Gamma"][0])
+
+
+def test_labels_are_escaped() -> None:
+    svg = render_svg('flowchart TB\n  A["<script>&"] --> B')
+    assert "<script>" not in svg and "&lt;script&gt;&amp;" in svg
+
+
+@pytest.mark.parametrize("workers", [0, 1])
+def test_native_renderer_runs_off_the_event_loop(workers: int) -> None:
+    renderer = NativeMermaidRenderer(workers=workers)
+
+    async def run() -> list[bytes | None]:
+        return await asyncio.gather(
+            renderer.render("mermaid", "svg", DIAGRAM),
+            renderer.render("mermaid", "svg", "flowchart TB\n  A -->|x| B"),
+            renderer.render("mermaid", "png", DIAGRAM),
+        )
+
+    try:
+        svg, unsupported, png = asyncio.run(run())
+    finally:
+        renderer.close()
+    assert svg is not None and svg.startswith(b"<svg")
+    assert unsupported is None and png is None
+
+
+def test_unsupported_syntax_falls_back_to_kroki(monkeypatch: pytest.MonkeyPatch) -> None:
+    from app.main import _render_suggested_image
+
+    calls: list[tuple[str, str]] = []
+
+    async def kroki(engine: str, fmt: str, source: str) -> bytes | None:
+        calls.append((engine, fmt))
+        return b"\x89PNG\r\n\x1a\n" if engine == "mermaid" else None
+
+    source = "flowchart TB\n  A -->|HTTPS| B"
+    monkeypatch.setattr("app.main.kroki_renderer", SimpleNamespace(render=kroki))
+    assert asyncio.run(_render_suggested_image(source)) == f"/renders/{render_id('mermaid', source)}.png"
+    assert ("mermaid", "png") in calls
+
+    calls.clear()
+    monkeypatch.setattr("app.main.KROKI_FALLBACK", False)
+    assert asyncio.run(_render_suggested_image(source)) == ""
+    assert calls == []
+
+
+def test_validate_diagram_renders_the_suggestion(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr("app.main.kroki_renderer", SimpleNamespace(render=AsyncMock(return_value=None)))
+    with patch("app.main.call_llm_diagram_1", new_callable=AsyncMock) as llm1, patch(
+        "app.main.call_llm_diagram_2", new_callable=AsyncMock
+    ) as llm2:
+        llm1.return_value = {"elements": ["API Server"], "suggested_diagram": DIAGRAM}
+        llm2.return_value = ["API Server"]
+        client = TestClient(app)
+        data = client.post("/validate-diagram", json={"topic": "Design a URL Shortener"}).json()
+        assert data["suggestedDiagramSvg"] == f"/renders/{render_id('mermaid', DIAGRAM)}.svg"
+        image = client.get(data["suggestedDiagramSvg"])
+        assert image.headers["content-type"] == "image/svg+xml"
+        assert b"API Server" in image.content
+
+        llm1.return_value = {"elements": ["API Server"], "suggested_diagram": "flowchart TB\n  A -->|x| B"}
+        data = client.post("/validate-diagram", json={"topic": "Design a URL Shortener"}).json()
+        assert data["suggestedDiagramSvg"] == ""
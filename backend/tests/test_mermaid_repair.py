@@ -0,0 +1,108 @@
+"""Tests for local validation and repair of LLM Mermaid flowcharts."""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.mermaid_repair import (
+    InvalidMermaid,
+    check_mermaid,
+    clean_mermaid,
+    is_valid_mermaid,
+    mermaid_parse_stats,
+    repair_mermaid,
+)
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        "flowchart TB\n  A[Client] --> B[Load Balancer]\n  B --> C[(Database)]",
+        "graph LR; A-->B; B-->C",
+        "flowchart TB\n  subgraph client[Client tier]\n    U[User]\n  end\n  U -->|HTTPS| API(API) -.-> Q{{Queue}}",
+        "flowchart TB\n  A -- calls --> B\n  A --- C & D\n  A ==> E\n  classDef hot fill:#f00\n  class A hot",
+        'flowchart TD\n  subgraph "Edge tier"\n    CDN["CDN (global)"]\n  end',
+    ],
+)
+def test_valid_flowcharts_pass(source: str) -> None:
+    check_mermaid(source)
+
+
+@pytest.mark.parametrize(
+    ("source", "error"),
+    [
+        ("sequenceDiagram\n  A->>B: hi", "line 1: unsupported diagram type"),
+        ("flowchart TB\n  A[Client --> B", "line 2: missing ']'"),
+        ("flowchart TB\n  A ->> B", "line 2: expected an arrow"),
+        ("flowchart TB\n  A -->", "line 2: arrow without a target node"),
+        ("flowchart TB\n  API Server --> DB", "line 2: node id 'API Server' contains spaces"),
+        ("flowchart TB\n  C[Cache (Redis)] --> DB", "needs quotes"),
+        ("flowchart TB\n  subgraph s[S]\n  A --> B", "1 subgraph(s) without 'end'"),
+        ("flowchart TB\n  A --> B\n  end", "line 3: 'end' without a subgraph"),
+        ("A --> B", "missing 'flowchart' header"),
+    ],
+)
+def test_invalid_flowcharts_name_the_problem(source: str, error: str) -> None:
+    with pytest.raises(InvalidMermaid, match=error.replace("(", r"\(").replace(")", r"\)")):
+        check_mermaid(source)
+
+
+def test_common_llm_mistakes_are_repaired() -> None:
+    raw = (
+        "Here is the diagram:\n```mermaid\n"
+        "  API Server[API Server] --> Cache[Cache (Redis)]\n"
+        "  subgraph data[Data (primary)]\n"
+        "    DB[(Postgres)]\n"
+        "```\nHope this helps!"
+    )
+    assert repair_mermaid(raw) == (
+        "flowchart TB\n"
+        '  API_Server[API Server] --> Cache["Cache (Redis)"]\n'
+        '  subgraph data["Data (primary)"]\n'
+        "    DB[(Postgres)]\n"
+        "end"
+    )
+    assert repair_mermaid("flowchart LR\\n  A --> B\\n  end") == "flowchart LR\n  A --> B"
+    with pytest.raises(InvalidMermaid):
+        repair_mermaid("flowchart TB\n  A[Client --> B")
+
+
+def test_clean_outcomes_are_counted_per_kind() -> None:
+    assert clean_mermaid("test_kind", "flowchart TB\n  A --> B") == "flowchart TB\n  A --> B"
+    assert clean_mermaid("test_kind", "```\nflowchart TB\n  A B --> C\n```") == "flowchart TB\n  A_B --> C"
+    # Unrepairable: returned for display, but not renderable.
+    assert clean_mermaid("test_kind", "flowchart TB\n  A[x --> B") == "flowchart TB\n  A[x --> B"
+    assert clean_mermaid("test_kind", "") == ""
+
+    stats = mermaid_parse_stats()["test_kind"]
+    assert (stats["ok"], stats["repaired"], stats["failed"]) == (1, 1, 1)
+    assert stats["error_rate"] == pytest.approx(0.333)
+
+
+def test_invalid_diagrams_are_never_rendered(monkeypatch: pytest.MonkeyPatch) -> None:
+    from app.main import _render_suggested_image
+
+    calls: list[tuple[str, str]] = []
+
+    async def kroki(engine: str, fmt: str, source: str) -> bytes | None:
+        calls.append((engine, fmt))
+        return b"\x89PNG\r\n\x1a\n"
+
+    monkeypatch.setattr("app.main.kroki_renderer", SimpleNamespace(render=kroki))
+    assert not is_valid_mermaid("flowchart TB\n  A[x --> B")
+    assert asyncio.run(_render_suggested_image("flowchart TB\n  A[x --> B")) == ""
+    assert asyncio.run(_render_suggested_image("sequenceDiagram\n  A->>B: hi")) == ""
+    assert calls == []
+    # Valid but outside the native subset: one Kroki render as Mermaid, no D2 attempt.
+    assert asyncio.run(_render_suggested_image("flowchart TB\n  A -->|x| B")).endswith(".png")
+    assert calls == [("mermaid", "png")]
+
+
+def test_diagram_key_drift_is_tolerated() -> None:
+    from app.llm import _detailed_diagram_result, _diagram_source
+
+    assert _diagram_source({"mermaid_diagram": "flowchart TB\n  A --> B"}) == "flowchart TB\n  A --> B"
+    assert _diagram_source({"suggested_diagram": "", "mermaid": "graph LR; A-->B"}) == "graph LR; A-->B"
+    result = _detailed_diagram_result({"feedback": "Ok.", "mermaid_diagram": "```mermaid\nA[Web App] --> B\n```"})
+    assert result["suggested_diagram"] == "flowchart TB\n  A[Web App] --> B"
@@ -0,0 +1,87 @@
+"""Tests for cross-request micro-batching of coverage calls."""
+
+import asyncio
+import json
+from typing import Any, Hashable
+
+import pytest
+
+from app.coverage_memo import CoverageVerdictMemo
+from app.llm import classify_requirements_coverage
+from app.micro_batch import MicroBatcher
+
+
+@pytest.mark.asyncio
+async def test_jobs_with_same_key_share_one_batch_and_errors_stay_per_job() -> None:
+    batches: list[list[int]] = []
+
+    async def run_batch(key: Hashable, jobs: list[int]) -> list[int | BaseException]:
+        batches.append(jobs)
+        return [ValueError("bad job") if job < 0 else job * 10 for job in jobs]
+
+    batcher: MicroBatcher[int, int] = MicroBatcher("test_batch", run_batch, max_jobs=3, window_seconds=60)
+    results = await asyncio.gather(
+        batcher.submit("k", 1), batcher.submit("k", -1), batcher.submit("k", 2), return_exceptions=True
+    )
+
+    assert batches == [[1, -1, 2]]
+    assert results[0] == 10 and results[2] == 20
+    assert isinstance(results[1], ValueError)
+
+
+@pytest.mark.asyncio
+async def test_window_flushes_partial_batch_per_key() -> None:
+    batches: list[tuple[Hashable, list[str]]] = []
+
+    async def run_batch(key: Hashable, jobs: list[str]) -> list[str | BaseException]:
+        batches.append((key, jobs))
+        return [job.upper() for job in jobs]
+
+    batcher: MicroBatcher[str, str] = MicroBatcher("test_batch", run_batch, max_jobs=10, window_seconds=0.01)
+    results = await asyncio.gather(batcher.submit("a", "x"), batcher.submit("b", "y"), batcher.submit("a", "z"))
+
+    assert results == ["X", "Y", "Z"]
+    assert sorted(batches) == [("a", ["x", "z"]), ("b", ["y"])]
+
+
+class _BatchClient:
+    """Fake LLM client: answers batch prompts with per-job results, leaving job j2 malformed."""
+
+    def __init__(self) -> None:
+        self.prompts: list[str] = []
+        outer = self
+
+        class _Completions:
+            async def create(self, *args: Any, **kwargs: Any) -> Any:
+                user_content = kwargs["messages"][1]["content"]
+                outer.prompts.append(user_content)
+                if user_content.startswith("### Job"):
+                    payload: dict[str, Any] = {"results": {"j1": {"matched": ["Low latency"]}, "j2": "oops"}}
+                else:
+                    payload = {"matched": ["High availability"]}
+                message = type("Msg", (), {"content": json.dumps(payload)})()
+                return type("Resp", (), {"choices": [type("Choice", (), {"message": message})()]})()
+
+        self.chat = type("Chat", (), {"completions": _Completions()})()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_coverage_calls_are_batched_with_per_job_fallback(monkeypatch: pytest.MonkeyPatch) -> None:
+    client = _BatchClient()
+    monkeypatch.setattr("app.llm.COVERAGE_BATCHING", True)
+    monkeypatch.setattr("app.llm.OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr("app.llm.get_llm_client", lambda: client)
+    monkeypatch.setattr("app.llm.coverage_memo", CoverageVerdictMemo())
+    monkeypatch.setattr(
+        "app.llm.settle_coverage", lambda refs, answers: {"matched": [], "missed": [], "borderline": list(refs)}
+    )
+
+    first, second = await asyncio.gather(
+        classify_requirements_coverage(["Low latency"], ["fast responses"], for_requirements=True),
+        classify_requirements_coverage(["High availability"], ["99.99% uptime"], for_requirements=True),
+    )
+
+    assert first == {"matched": ["Low latency"], "missed": []}
+    assert second == {"matched": ["High availability"], "missed": []}
+    assert len(client.prompts) == 2  # one batch call + one solo retry for the malformed job
+    assert client.prompts[0].count("### Job") == 2
@@ -0,0 +1,146 @@
+"""Tests for the offline reference precompute and the memory-mapped topic bundle."""
+
+from pathlib import Path
+
+import pytest
+
+from app import llm as app_llm
+from app.llm import call_llm1, call_llm_apis_1, call_llm_estimation_evaluation
+from app.precompute import _load_existing, main, read_topics, run
+from app.providers import FakeProvider, LLMRouter
+from app.reference_cache import ReferenceCache
+from app.topic_bundle import BundleFormatError, TopicBundle, write_bundle
+
+
+def test_bundle_round_trip_and_bad_file_rejected(tmp_path: Path) -> None:
+    path = str(tmp_path / "bundle.bin")
+    write_bundle(path, {"apis:x:-": ["POST /a"], "requirements:x:-": {"functional_requirements": ["F"]}}, {"version": "v1"})
+    bundle = TopicBundle(path)
+    assert len(bundle) == 2 and "apis:x:-" in bundle
+    assert bundle.get("apis:x:-") == ["POST /a"]
+    assert bundle.get("missing") is None
+    info = bundle.info()
+    assert (info["version"], info["entries"], info["topics"]) == ("v1", 2, 0)
+    assert info["bytes"] == Path(path).stat().st_size and info["built_at"] > 0
+    bundle.close()
+
+    bogus = tmp_path / "bogus.bin"
+    bogus.write_bytes(b"not a bundle at all, just some bytes here")
+    with pytest.raises(BundleFormatError):
+        TopicBundle(str(bogus))
+
+
+def test_read_topics_canonicalizes_and_skips_comments_blanks_and_duplicates(tmp_path: Path) -> None:
+    catalog = tmp_path / "topics.txt"
+    catalog.write_text("# catalog\nURL Shortener\n\nChat App\nurl  shortener\nDesign Uber\n")
+    assert read_topics(str(catalog)) == ["Design a URL Shortener", "Design a Chat Application", "Design Uber"]
+
+
+@pytest.mark.parametrize(
+    "damage",
+    [
+        lambda data: b"",  # empty file
+        lambda data: data[:10],  # cut inside the header
+        lambda data: data[:-5],  # cut inside the index
+        lambda data: data[:-5] + b"\0" * 5,  # index no longer decompresses
+    ],
+)
+def test_empty_or_truncated_bundle_is_rejected(tmp_path: Path, damage) -> None:
+    path = tmp_path / "bundle.bin"
+    write_bundle(str(path), {"apis:x:-": ["POST /a"]}, {"topics": ["x"]})
+    data = path.read_bytes()
+    path.chmod(0o644)
+    path.write_bytes(damage(data))
+    with pytest.raises(BundleFormatError):
+        TopicBundle(str(path))
+    assert _load_existing(str(path)) == {}
+
+
+def test_startup_skips_an_empty_bundle(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    from fastapi.testclient import TestClient
+
+    from app.main import app, reference_cache
+
+    empty = tmp_path / "bundle.bin"
+    empty.write_bytes(b"")
+    monkeypatch.setattr("app.main.TOPIC_BUNDLE_PATH", str(empty))
+    monkeypatch.setattr(reference_cache, "bundle", None)
+    with TestClient(app) as client:
+        assert client.get("/health").json()["topic_bundle"] is None
+
+
+def test_unreadable_record_is_a_miss(tmp_path: Path) -> None:
+    path = tmp_path / "bundle.bin"
+    write_bundle(str(path), {"apis:x:-": ["POST /a"], "apis:y:-": ["POST /b"]})
+    bundle = TopicBundle(str(path))
+    offset, length = bundle._index["apis:x:-"]
+    bundle.close()
+    data = bytearray(path.read_bytes())
+    data[offset : offset + length] = b"\xff" * length
+    path.chmod(0o644)
+    path.write_bytes(bytes(data))
+    bundle = TopicBundle(str(path))
+    assert bundle.get("apis:x:-") is None
+    assert bundle.get("apis:y:-") == ["POST /b"]
+    bundle.close()
+
+
+@pytest.mark.asyncio
+async def test_precompute_builds_bundle_and_resumes(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    calls: list[str] = []
+
+    def responder(kind: str, system_prompt: str, user_content: str) -> str | None:
+        calls.append(kind)
+        return app_llm._fake_completion(kind, system_prompt, user_content)
+
+    monkeypatch.setattr(app_llm, "llm_router", LLMRouter([FakeProvider(responder)]))
+    out = str(tmp_path / "bundle.bin")
+
+    summary = await run(["URL Shortener", "Chat App"], out, concurrency=3, version="test")
+    kinds = len(app_llm.topic_artifacts())
+    assert summary["computed"] == 2 * kinds and summary["failed"] == 0
+    assert not Path(f"{out}.partial.jsonl").exists()
+
+    bundle = TopicBundle(out)
+    assert len(bundle) == 2 * kinds
+    assert bundle.get(ReferenceCache.make_key("apis", "chat app")) == app_llm._stub_apis_1("")
+    assert bundle.meta["version"] == "test" and bundle.meta["providers"] == ["fake"]
+    bundle.close()
+
+    calls.clear()
+    again = await run(["URL Shortener", "Chat App"], out)
+    assert calls == [] and again["reused"] == 2 * kinds
+
+
+@pytest.mark.asyncio
+async def test_bundle_serves_references_without_a_provider(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    out = str(tmp_path / "bundle.bin")
+    expected = [{"item": "QPS", "expected_value": "~1,200", "derivation": "100M DAU x 1 / 86,400"}]
+    write_bundle(
+        out,
+        {
+            ReferenceCache.make_key("apis", "Chat App"): ["POST /messages"],
+            ReferenceCache.make_key("requirements", "Chat App"): {
+                "functional_requirements": ["Send messages"],
+                "non_functional_requirements": ["Low latency"],
+            },
+            ReferenceCache.make_key("estimation_expected", "Chat App"): expected,
+        },
+    )
+    cache = ReferenceCache(path="")
+    cache.bundle = TopicBundle(out)
+    monkeypatch.setattr(app_llm, "reference_cache", cache)
+    monkeypatch.setattr(app_llm, "OPENAI_API_KEY", None)
+
+    assert await call_llm_apis_1("chat app") == ["POST /messages"]
+    assert (await call_llm1("Chat App"))["functional_requirements"] == ["Send messages"]
+    assert (await call_llm_estimation_evaluation("Chat App", []))["expected_estimations"] == expected
+    assert await call_llm_apis_1("Unknown Topic") == app_llm._stub_apis_1("")
+    cache.close()
+
+
+def test_cli_without_provider_exits_with_error(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    catalog = tmp_path / "topics.txt"
+    catalog.write_text("Chat App\n")
+    monkeypatch.setattr(app_llm, "OPENAI_API_KEY", None)
+    assert main([str(catalog), "-o", str(tmp_path / "bundle.bin")]) == 2
@@ -0,0 +1,93 @@
+"""Tests for background warm-up of later-stage references."""
+
+import asyncio
+import inspect
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import metrics
+from app.llm_scheduler import Priority, _priority
+from app.main import app
+from app.prefetch import STAGES, TopicPrefetcher
+from app.reference_cache import ReferenceCache
+
+
+def test_only_topic_keyed_references_are_prefetched() -> None:
+    # A call that also takes the user's API design is cached under that design, never under the
+    # topic alone, so warming it per topic would be wasted.
+    for name, call in STAGES.items():
+        assert list(inspect.signature(call).parameters) == ["topic"], name
+
+
+@pytest.mark.asyncio
+async def test_prefetch_warms_reference_cache_at_background_priority(monkeypatch: pytest.MonkeyPatch) -> None:
+    cache = ReferenceCache(path="")
+    priorities: list[Priority] = []
+
+    async def apis(topic: str) -> list[str]:
+        async def generate() -> list[str]:
+            priorities.append(_priority.get())
+            return ["POST /shorten"]
+
+        return await cache.get_or_compute("apis", topic, None, generate)
+
+    monkeypatch.setattr("app.prefetch.llm_available", lambda: True)
+    prefetcher = TopicPrefetcher({"apis": apis}, max_topics=4, concurrency=1)
+    assert prefetcher.schedule("URL Shortener")
+    assert not prefetcher.schedule("url  shortener")  # same normalized topic already warming
+    await asyncio.gather(*prefetcher._tasks.values())
+
+    assert priorities == [Priority.BACKGROUND]
+    assert await cache.get("apis", "URL Shortener") == ["POST /shorten"]
+    assert prefetcher.in_flight() == []
+
+
+@pytest.mark.asyncio
+async def test_prefetch_is_bounded_and_isolated_from_failures(monkeypatch: pytest.MonkeyPatch) -> None:
+    release = asyncio.Event()
+    done: list[str] = []
+
+    async def slow(topic: str) -> None:
+        await release.wait()
+        done.append(topic)
+
+    async def broken(topic: str) -> None:
+        raise RuntimeError("provider down")
+
+    monkeypatch.setattr("app.prefetch.llm_available", lambda: True)
+    metrics.reset()
+    prefetcher = TopicPrefetcher({"slow": slow, "broken": broken}, max_topics=1, concurrency=2)
+    assert prefetcher.schedule("Chat App")
+    assert not prefetcher.schedule("Rate Limiter")
+    release.set()
+    await asyncio.gather(*prefetcher._tasks.values())
+
+    assert done == ["Chat App"]
+    counters = metrics.snapshot()["counters"]
+    assert counters["prefetch.dropped"] == 1
+    assert counters["prefetch.stage_failed"] == 1
+
+
+def test_prefetch_endpoint_resolves_topic_and_returns_immediately() -> None:
+    with patch("app.main.topic_prefetcher.schedule", return_value=True) as schedule:
+        response = TestClient(app).post("/topics/tinyurl/prefetch")
+
+    assert response.status_code == 202
+    body = response.json()
+    assert body["topic"] == "Design a URL Shortener" and body["scheduled"] is True
+    assert "apis" in body["stages"] and body["topicResolution"]["method"] == "alias"
+    schedule.assert_called_once_with("Design a URL Shortener")
+
+
+def test_validate_starts_prefetch_when_enabled(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr("app.main.PREFETCH_ON_VALIDATE", True)
+    payload = {"functional_requirements": ["Shorten"], "non_functional_requirements": ["Fast"]}
+    with patch("app.main.topic_prefetcher.schedule", return_value=True) as schedule, patch(
+        "app.main.call_llm1", new_callable=AsyncMock, return_value=payload
+    ), patch("app.main.call_llm2", new_callable=AsyncMock, return_value=payload):
+        response = TestClient(app).post("/validate", json={"topic": "URL Shortener"})
+
+    assert response.status_code == 200
+    schedule.assert_called_once_with("Design a URL Shortener")
@@ -0,0 +1,65 @@
+"""Tests for the token-budgeted prompt builder."""
+
+from app import metrics
+from app.llm import _detailed_diagram_user_content
+from app.prompt_budget import PromptBuilder, compact_text, count_tokens
+
+
+def test_prompt_within_budget_is_unchanged() -> None:
+    prompt = PromptBuilder("test", header="Topic: chat", budget=1000)
+    prompt.section("Requirements", ["Send messages", "Group chats"], priority=1)
+    prompt.section("Deep dives", [], priority=2, empty="(none)")
+
+    assert prompt.build() == "Topic: chat\n\nRequirements:\nSend messages\nGroup chats\n\nDeep dives:\n(none)"
+    assert prompt.tokens == count_tokens(prompt.build())
+
+
+def test_compaction_keeps_topic_relevant_sentences_in_order() -> None:
+    text = (
+        "Messages are sharded by conversation id. "
+        "I like coffee in the morning. "
+        "Each shard replicates messages to two followers. "
+        "The weather was nice."
+    )
+
+    compacted = compact_text(text, 30, query="messages shard replication")
+
+    assert compacted == "Messages are sharded by conversation id. Each shard replicates messages to two followers."
+
+
+def test_low_priority_sections_shrink_first_and_priority_zero_is_kept() -> None:
+    metrics.reset()
+    labels = ", ".join(f"Service{i}" for i in range(20))
+    dives = [
+        f"- Topic {i}: " + " ".join(f"Component{i} handles concern{j} with strategy{i * j}." for j in range(20))
+        for i in range(10)
+    ]
+    prompt = PromptBuilder("test_budget", header="Topic: feed", budget=400)
+    prompt.section("Labels", labels, priority=0)
+    prompt.section("Requirements", "Functional: post; follow; timeline", priority=1)
+    prompt.section("Deep dives", dives, priority=4)
+
+    text = prompt.build()
+
+    assert prompt.tokens <= 400
+    assert labels in text
+    assert "Functional: post; follow; timeline" in text
+    assert all(len(line) < len(dives[0]) for line in text.split("Deep dives:\n")[1].splitlines())
+    assert metrics.snapshot()["timings"]["prompt.tokens.test_budget"]["max"] == prompt.tokens
+
+
+def test_detailed_diagram_prompt_respects_budget(monkeypatch) -> None:
+    monkeypatch.setenv("PROMPT_BUDGET_DETAILED_DIAGRAM", "600")
+    text = _detailed_diagram_user_content(
+        "Chat app",
+        "Functional: send messages; presence",
+        "\n".join(f"- POST /messages/{i} (request: " + "field, " * 50 + ")" for i in range(40)),
+        "\n".join(f"Table{i} (id, body, created_at)" for i in range(60)),
+        ["Client", "Gateway"],
+        "Client sends a message to the gateway which writes it to the store. " * 30,
+        [{"topic": "Fan-out", "userSummary": "Push to online users. " * 40, "suggestedSummary": ""}],
+        ["Client", "Gateway", "Chat Service", "Message Store"],
+    )
+
+    assert count_tokens(text) <= 600
+    assert "Client, Gateway, Chat Service, Message Store" in text
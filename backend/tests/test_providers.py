@@ -0,0 +1,96 @@
+"""Tests for the LLM provider router (latency-aware selection, failover, secondary provider)."""
+
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.providers import FakeProvider, LLMRouter, NoProviderAvailable
+
+
+class _Unavailable(Exception):
+    status_code = 503
+
+
+def _answer(name: str):
+    def responder(kind: str, system_prompt: str, user_content: str) -> str:
+        return json.dumps({"provider": name})
+
+    return responder
+
+
+def _failing(kind: str, system_prompt: str, user_content: str) -> str:
+    raise _Unavailable("provider down")
+
+
+@pytest.mark.asyncio
+async def test_routes_to_provider_with_lower_latency() -> None:
+    slow = FakeProvider(_answer("slow"), name="route-slow")
+    fast = FakeProvider(_answer("fast"), name="route-fast")
+    router = LLMRouter([slow, fast], explore_rate=0)
+    router.stats["route-slow"].record(2.0, ok=True)
+    router.stats["route-fast"].record(0.2, ok=True)
+
+    content = await router.complete("requirements", "sys", "topic")
+
+    assert json.loads(content or "") == {"provider": "fast"}
+
+
+@pytest.mark.asyncio
+async def test_fails_over_on_retryable_error_and_penalizes_provider() -> None:
+    broken = FakeProvider(_failing, name="failover-broken")
+    healthy = FakeProvider(_answer("healthy"), name="failover-healthy")
+    broken.scheduler.max_retries = 0
+    router = LLMRouter([broken, healthy], explore_rate=0)
+
+    content = await router.complete("apis", "sys", "topic")
+
+    assert json.loads(content or "") == {"provider": "healthy"}
+    assert router.stats["failover-broken"].error_rate == 1.0
+    assert router.ranked()[0] is healthy
+
+
+@pytest.mark.asyncio
+async def test_secondary_uses_a_different_provider() -> None:
+    first = FakeProvider(_answer("first"), name="secondary-first")
+    second = FakeProvider(_answer("second"), name="secondary-second")
+    router = LLMRouter([first, second], explore_rate=0)
+
+    router.stats["secondary-first"].record(0.1, ok=True)
+    router.stats["secondary-second"].record(0.5, ok=True)
+
+    primary = await router.complete("requirements", "sys", "topic")
+    other = await router.complete("requirements", "sys", "topic", secondary=True)
+
+    assert json.loads(primary or "") == {"provider": "first"}
+    assert json.loads(other or "") == {"provider": "second"}
+    with pytest.raises(NoProviderAvailable):
+        LLMRouter([first]).ranked(secondary=True)
+
+
+@pytest.mark.asyncio
+async def test_stream_fails_over_before_first_delta() -> None:
+    broken = FakeProvider(_failing, name="stream-broken")
+    healthy = FakeProvider(_answer("healthy"), name="stream-healthy")
+    router = LLMRouter([broken, healthy], explore_rate=0)
+
+    text = "".join([delta async for delta in router.stream("flow", "sys", "topic")])
+
+    assert json.loads(text) == {"provider": "healthy"}
+
+
+def test_fake_provider_serves_endpoints_without_api_keys(monkeypatch: pytest.MonkeyPatch) -> None:
+    from app import llm
+    from app.reference_cache import ReferenceCache
+
+    monkeypatch.setattr("app.llm.OPENAI_API_KEY", None)
+    monkeypatch.setattr("app.llm.reference_cache", ReferenceCache(path=""))
+    monkeypatch.setattr("app.llm.llm_router", LLMRouter([FakeProvider(llm._fake_completion, name="e2e-fake")]))
+
+    response = TestClient(app).post(
+        "/validate-flow", json={"topic": "URL Shortener", "flowSummary": "Client -> API -> DB"}
+    )
+
+    assert response.status_code == 200
+    assert response.json()["feedback"] == "Flow looks plausible (fake provider)."
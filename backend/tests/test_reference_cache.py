@@ -0,0 +1,129 @@
+"""Tests for the topic-keyed reference artifact cache."""
+
+import asyncio
+import time
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import metrics
+from app.main import app
+from app.reference_cache import ReferenceCache, normalize_topic
+
+
+class _Counter:
+    def __init__(self, value: object = ("POST /shorten",)) -> None:
+        self.calls = 0
+        self.value = value
+
+    async def __call__(self) -> object:
+        self.calls += 1
+        return list(self.value) if isinstance(self.value, tuple) else self.value
+
+
+def test_normalize_topic_ignores_case_punctuation_and_spacing() -> None:
+    assert normalize_topic("  URL   Shortener! ") == normalize_topic("url shortener")
+
+
+@pytest.mark.asyncio
+async def test_second_lookup_is_a_hit_and_normalized_topics_share_entries(tmp_path: Path) -> None:
+    cache = ReferenceCache(str(tmp_path / "cache.sqlite3"))
+    compute = _Counter()
+    first = await cache.get_or_compute("apis", "URL Shortener", None, compute)
+    second = await cache.get_or_compute("apis", "url  shortener", None, compute)
+    assert first == second == ["POST /shorten"]
+    assert compute.calls == 1
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_generation_is_not_cached(tmp_path: Path) -> None:
+    cache = ReferenceCache(str(tmp_path / "cache.sqlite3"))
+    compute = _Counter(value=None)
+    assert await cache.get_or_compute("apis", "Chat app", None, compute) is None
+    assert await cache.get_or_compute("apis", "Chat app", None, compute) is None
+    assert compute.calls == 2
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_tier_is_shared_between_instances(tmp_path: Path) -> None:
+    path = str(tmp_path / "cache.sqlite3")
+    writer, reader = ReferenceCache(path), ReferenceCache(path)
+    await writer.get_or_compute("diagram", "Chat app", "GET /messages", _Counter())
+    compute = _Counter()
+    assert await reader.get_or_compute("diagram", "Chat app", "GET /messages", compute) == ["POST /shorten"]
+    assert compute.calls == 0
+    # Different inputs hash to a different key.
+    await reader.get_or_compute("diagram", "Chat app", "POST /messages", compute)
+    assert compute.calls == 1
+    writer.close()
+    reader.close()
+
+
+@pytest.mark.asyncio
+async def test_stale_entry_is_served_while_refreshing_in_background() -> None:
+    cache = ReferenceCache("", ttl=0.01, stale_ttl=60)
+    await cache.get_or_compute("apis", "Chat app", None, _Counter(value=("old",)))
+    time.sleep(0.02)
+    refresh = _Counter(value=("new",))
+    assert await cache.get_or_compute("apis", "Chat app", None, refresh) == ["old"]
+    await asyncio.sleep(0.05)
+    assert refresh.calls == 1
+    cache.ttl = 60
+    assert await cache.get_or_compute("apis", "Chat app", None, refresh) == ["new"]
+
+
+@pytest.mark.asyncio
+async def test_invalidate_by_topic_removes_only_that_topic(tmp_path: Path) -> None:
+    cache = ReferenceCache(str(tmp_path / "cache.sqlite3"))
+    await cache.get_or_compute("apis", "Chat app", None, _Counter())
+    await cache.get_or_compute("apis", "URL Shortener", None, _Counter())
+    assert await cache.invalidate(topic="chat APP") == 1
+    compute = _Counter()
+    await cache.get_or_compute("apis", "Chat app", None, compute)
+    await cache.get_or_compute("apis", "URL Shortener", None, compute)
+    assert compute.calls == 1
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_hit_and_miss_counters() -> None:
+    metrics.reset()
+    cache = ReferenceCache("")
+    await cache.get_or_compute("apis", "Chat app", None, _Counter())
+    await cache.get_or_compute("apis", "Chat app", None, _Counter())
+    counters = metrics.snapshot()["counters"]
+    assert counters["reference_cache.miss"] == 1
+    assert counters["reference_cache.hit.memory"] == 1
+
+
+def test_admin_invalidation_requires_token(monkeypatch: pytest.MonkeyPatch) -> None:
+    client = TestClient(app)
+    monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+    assert client.delete("/admin/reference-cache").status_code == 403
+
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    monkeypatch.setattr("app.main.reference_cache", ReferenceCache(""))
+    assert client.delete("/admin/reference-cache", headers={"X-Admin-Token": "wrong"}).status_code == 401
+    response = client.delete(
+        "/admin/reference-cache", params={"topic": "Chat app"}, headers={"X-Admin-Token": "secret"}
+    )
+    assert response.status_code == 200
+    assert response.json() == {"removed": 0}
+
+
+@pytest.mark.parametrize("method", ["DELETE", "PUT"])
+def test_admin_endpoints_pass_the_cors_preflight(method: str) -> None:
+    response = TestClient(app).options(
+        "/admin/reference-cache",
+        headers={
+            "Origin": "http://localhost:3000",
+            "Access-Control-Request-Method": method,
+            "Access-Control-Request-Headers": "X-Admin-Token",
+        },
+    )
+    assert response.status_code == 200
+    assert method in response.headers["access-control-allow-methods"]
+    assert "x-admin-token" in response.headers["access-control-allow-headers"].lower()
@@ -0,0 +1,111 @@
+"""Tests for the background render queue and GET /renders/jobs/{id}."""
+
+import asyncio
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.render_jobs import RenderJobQueue
+from app.render_store import render_id
+
+
+@pytest.mark.asyncio
+async def test_identical_sources_share_one_job_and_workers_are_bounded() -> None:
+    active = peak = 0
+    calls: list[str] = []
+
+    async def render(source: str) -> str:
+        nonlocal active, peak
+        calls.append(source)
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.02)
+        active -= 1
+        return "" if "fail" in source else f"/renders/{len(calls)}.svg"
+
+    queue = RenderJobQueue(render, workers=2, max_queued=3)
+    try:
+        first = queue.submit("flowchart TB\n  A --> B")
+        assert queue.submit("flowchart TB  \r\n  A --> B") is first
+        assert first.id == render_id("mermaid", "flowchart TB\n  A --> B")
+        others = [queue.submit(f"flowchart TB\n  N{i} --> M") for i in range(3)]
+        assert others[2] is None  # three jobs already waiting
+        await asyncio.gather(*(queue.wait(job.id, 1) for job in [first, *others[:2]]))
+        assert first.status == "done" and first.url.endswith(".svg")
+        assert peak == 2 and len(calls) == 3
+        assert queue.submit("flowchart TB\n  A --> B") is first  # finished jobs are reused too
+
+        failed = await queue.wait(queue.submit("flowchart TB\n  fail --> B").id, 1)
+        assert failed.status == "failed" and failed.url == ""
+        assert queue.submit("flowchart TB\n  fail --> B") is not failed  # failed jobs are retried
+    finally:
+        await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_wait_returns_pending_job_after_timeout() -> None:
+    gate = asyncio.Event()
+
+    async def render(_source: str) -> str:
+        await gate.wait()
+        return "/renders/x.svg"
+
+    queue = RenderJobQueue(render, workers=1)
+    try:
+        job = queue.submit("flowchart TB\n  A --> B")
+        assert (await queue.wait(job.id, 0.01)).status == "pending"
+        assert await queue.wait("unknown", 0.01) is None
+        gate.set()
+        assert (await queue.wait(job.id, 1)).url == "/renders/x.svg"
+    finally:
+        await queue.close()
+
+
+def test_detailed_diagram_responds_before_the_render(monkeypatch: pytest.MonkeyPatch) -> None:
+    gate = threading.Event()
+
+    async def render(source: str) -> str:
+        await asyncio.to_thread(gate.wait, 5)
+        return f"/renders/{render_id('mermaid', source)}.svg"
+
+    monkeypatch.setattr("app.main.render_jobs", RenderJobQueue(render, workers=1))
+    with TestClient(app) as client:
+        data = client.post("/validate-detailed-diagram", json={"topic": "Design a URL Shortener"}).json()
+        assert data["feedback"] and data["suggestedDiagram"].startswith("flowchart")
+        assert data["suggestedDiagramPng"] == ""
+        job_id = data["renderJobId"]
+        assert job_id == render_id("mermaid", data["suggestedDiagram"])
+
+        pending = client.get(f"/renders/jobs/{job_id}", params={"wait": 0})
+        assert pending.json() == {"id": job_id, "status": "pending", "url": ""}
+        assert pending.headers["cache-control"] == "no-store"
+
+        gate.set()
+        done = client.get(f"/renders/jobs/{job_id}").json()
+        assert done == {"id": job_id, "status": "done", "url": f"/renders/{job_id}.svg"}
+
+        # Same diagram again: the finished job is reused and its image returned inline.
+        again = client.post("/validate-detailed-diagram", json={"topic": "Design a URL Shortener"}).json()
+        assert again["renderJobId"] == job_id and again["suggestedDiagramPng"] == done["url"]
+
+        assert client.get("/renders/jobs/unknown").status_code == 404
+        assert client.get(f"/renders/jobs/{job_id}", params={"wait": 3600}).status_code == 422
+
+
+def test_job_unknown_to_this_worker_is_found_in_the_render_store(monkeypatch: pytest.MonkeyPatch) -> None:
+    import app.main as main
+
+    async def render(_engine: str, _fmt: str, _source: str) -> bytes:
+        return b"<svg/>"
+
+    source = "flowchart TB\n  A --> B"
+    job_id = asyncio.run(main.render_store.render("mermaid", "svg", source, render))
+    assert job_id == render_id("mermaid", source)
+    # Rendered by another worker (or before a restart): this worker's queue has no such job.
+    monkeypatch.setattr("app.main.render_jobs", RenderJobQueue(render, workers=1))
+    client = TestClient(app)
+    done = client.get(f"/renders/jobs/{job_id}", params={"wait": 0}).json()
+    assert done == {"id": job_id, "status": "done", "url": f"/renders/{job_id}.svg"}
+    assert client.get(f"/renders/jobs/{render_id('mermaid', 'flowchart TB')}", params={"wait": 0}).status_code == 404
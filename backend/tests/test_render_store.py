@@ -0,0 +1,79 @@
+"""Tests for the content-addressed render store and GET /renders."""
+
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.render_store import RenderStore, render_id
+
+
+class _Renderer:
+    def __init__(self, fail: bool = False) -> None:
+        self.calls: list[tuple[str, str]] = []
+        self.fail = fail
+
+    async def __call__(self, engine: str, fmt: str, source: str) -> bytes | None:
+        self.calls.append((engine, fmt))
+        await asyncio.sleep(0.01)
+        return None if self.fail else f"{fmt}:{source}".encode()
+
+
+@pytest.mark.asyncio
+async def test_same_diagram_renders_once_and_survives_restart(tmp_path: Path) -> None:
+    renderer = _Renderer()
+    store = RenderStore(str(tmp_path))
+    ids = await asyncio.gather(
+        store.render("mermaid", "png", "flowchart TB\n  A --> B\n", renderer),
+        store.render("mermaid", "png", "flowchart TB  \r\n  A --> B", renderer),
+    )
+    assert ids[0] == ids[1] == render_id("mermaid", "flowchart TB\n  A --> B")
+    assert renderer.calls == [("mermaid", "png")]
+
+    restarted = RenderStore(str(tmp_path))
+    assert restarted.get(ids[0], "png") == b"png:flowchart TB\n  A --> B"
+    # A format that was never rendered is rendered from the stored source on demand.
+    assert await restarted.fetch(ids[0], "svg", renderer) == b"svg:flowchart TB\n  A --> B"
+    assert renderer.calls == [("mermaid", "png"), ("mermaid", "svg")]
+
+
+@pytest.mark.asyncio
+async def test_failed_render_is_not_stored() -> None:
+    store = RenderStore(path="")
+    assert await store.render("mermaid", "png", "graph TD; A-->B", _Renderer(fail=True)) is None
+    assert store.get(render_id("mermaid", "graph TD; A-->B"), "png") is None
+
+
+def test_render_endpoint_serves_immutable_artifacts(monkeypatch: pytest.MonkeyPatch) -> None:
+    renderer = _Renderer()
+    store = RenderStore(path="")
+    monkeypatch.setattr("app.main.render_store", store)
+    monkeypatch.setattr("app.main.kroki_renderer", SimpleNamespace(render=renderer))
+    rid = asyncio.run(store.render("mermaid", "png", "graph TD; A-->B", renderer))
+    client = TestClient(app)
+
+    response = client.get(f"/renders/{rid}.png")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/png"
+    assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert response.content == b"png:graph TD; A-->B"
+
+    etag = response.headers["etag"]
+    assert client.get(f"/renders/{rid}.png", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(f"/renders/{rid}.svg").headers["content-type"] == "image/svg+xml"
+    assert client.get(f"/renders/{'0' * 32}.png").status_code == 404
+    # A guessed ETag does not turn an unknown render into a 304.
+    assert client.get(f"/renders/{'0' * 32}.png", headers={"If-None-Match": f'"{"0" * 32}.png"'}).status_code == 404
+    assert client.get("/renders/../../etc.png").status_code == 404
+
+
+def test_inline_mode_returns_data_url(monkeypatch: pytest.MonkeyPatch) -> None:
+    from app.main import _render_suggested_image
+
+    monkeypatch.setattr("app.main.kroki_renderer", SimpleNamespace(render=_Renderer()))
+    monkeypatch.setattr("app.main.RENDER_INLINE_DATA_URL", True)
+    assert asyncio.run(_render_suggested_image("graph TD; A-->B")).startswith("data:image/svg+xml;base64,")
+    assert asyncio.run(_render_suggested_image("graph TD; A-->|x|B")).startswith("data:image/png;base64,")
@@ -0,0 +1,67 @@
+"""Tests for the local similarity pre-pass used by coverage classification."""
+
+import pytest
+
+from app.llm import classify_requirements_coverage
+from app.similarity import settle_coverage, tokenize
+
+
+def test_lexicon_normalizes_abbreviations_and_shorthand() -> None:
+    assert tokenize("L4 LB") == tokenize("Load Balancer")
+    assert "direct" in tokenize("1:1 messaging")
+    assert tokenize("messages") == tokenize("messaging")
+
+
+def test_diagram_labels_settle_clear_matches_and_misses_locally() -> None:
+    result = settle_coverage(
+        ["Load Balancer", "API Server", "Database", "Cache", "Message Queue"],
+        ["LB", "Backend", "Postgres", "Redis"],
+    )
+    assert result["matched"] == ["Load Balancer", "API Server", "Database", "Cache"]
+    assert result["missed"] == ["Message Queue"]
+    assert result["borderline"] == []
+
+
+def test_paraphrases_are_left_for_the_llm_not_missed() -> None:
+    result = settle_coverage(["Users can create and join chat groups"], ["group chats"])
+    assert result["missed"] == []
+
+
+def test_miss_threshold_separates_uncovered_items_from_loose_paraphrases() -> None:
+    reference = [
+        "Shorten a long URL into a short code",
+        "Custom aliases",
+        "Click analytics",
+        "Push notifications",
+        "Read receipts",
+        "End-to-end encryption",
+        "Message ordering",
+        "Search Index",
+    ]
+    answers = ["create short links", "notify offline users", "users can dm each other", "App servers"]
+    result = settle_coverage(reference, answers)
+    assert result["missed"] == [
+        "Custom aliases",
+        "Click analytics",
+        "Read receipts",
+        "End-to-end encryption",
+        "Message ordering",
+        "Search Index",
+    ]
+    assert result["borderline"] == ["Shorten a long URL into a short code", "Push notifications"]
+
+
+def test_generic_words_are_not_rewritten_to_concepts() -> None:
+    assert "direct" not in tokenize("private data")
+    assert "realtime" not in tokenize("live video")
+    assert "latency" not in tokenize("fast lookup")
+    assert "apiserver" not in tokenize("REST API")
+
+
+@pytest.mark.asyncio
+async def test_coverage_without_llm_uses_local_verdicts(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr("app.llm.OPENAI_API_KEY", None)
+    result = await classify_requirements_coverage(
+        ["Load Balancer", "Message Queue"], ["L7 LB"], for_diagram=True
+    )
+    assert result == {"matched": ["Load Balancer"], "missed": ["Message Queue"]}
@@ -0,0 +1,75 @@
+"""Tests for single-flight coalescing of identical in-flight calls."""
+
+import asyncio
+from typing import Any
+
+import pytest
+
+from app.singleflight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_callers_share_one_call() -> None:
+    group = SingleFlight("test")
+    calls = 0
+
+    async def work() -> str:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "result"
+
+    results = await asyncio.gather(*(group.do("k", work) for _ in range(5)))
+    assert results == ["result"] * 5
+    assert calls == 1
+    assert group.in_flight() == 0
+
+
+@pytest.mark.asyncio
+async def test_errors_fan_out_to_every_waiter() -> None:
+    group = SingleFlight("test")
+
+    async def boom() -> None:
+        await asyncio.sleep(0.01)
+        raise ValueError("provider error")
+
+    results = await asyncio.gather(*(group.do("k", boom) for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+@pytest.mark.asyncio
+async def test_cancelling_one_waiter_keeps_call_alive_for_others() -> None:
+    group = SingleFlight("test")
+    started = asyncio.Event()
+
+    async def work() -> str:
+        started.set()
+        await asyncio.sleep(0.05)
+        return "done"
+
+    first = asyncio.create_task(group.do("k", work))
+    second = asyncio.create_task(group.do("k", work))
+    await started.wait()
+    first.cancel()
+    assert await second == "done"
+    with pytest.raises(asyncio.CancelledError):
+        await first
+
+
+@pytest.mark.asyncio
+async def test_call_is_cancelled_when_last_waiter_leaves() -> None:
+    group = SingleFlight("test")
+    cancelled = asyncio.Event()
+
+    async def work() -> Any:
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    waiter = asyncio.create_task(group.do("k", work))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    await asyncio.wait_for(cancelled.wait(), timeout=1)
+    assert group.in_flight() == 0
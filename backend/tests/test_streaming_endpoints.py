@@ -0,0 +1,158 @@
+"""Tests for the SSE /stream variants of flow, deep-dives and detailed-diagram validation."""
+
+import asyncio
+import json
+from typing import Any, AsyncIterator
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app.fake_kroki import create_fake_kroki
+from app.kroki import KrokiRenderer
+from app.main import app
+from app.render_store import render_id
+
+
+def _chunk(text: str) -> Any:
+    delta = type("Delta", (), {"content": text})()
+    return type("Chunk", (), {"choices": [type("Choice", (), {"delta": delta})()]})()
+
+
+class _StreamingClient:
+    """Fake LLM client: streams the given text in small pieces, optionally stalling after `stall_after` chars."""
+
+    def __init__(self, text: str, stall_after: int | None = None) -> None:
+        outer = self
+        self.text = text
+        self.stall_after = stall_after
+
+        class _Completions:
+            async def create(self, *args: Any, **kwargs: Any) -> AsyncIterator[Any]:
+                assert kwargs.get("stream") is True
+
+                async def gen() -> AsyncIterator[Any]:
+                    for i in range(0, len(outer.text), 7):
+                        if outer.stall_after is not None and i >= outer.stall_after:
+                            await asyncio.sleep(5)
+                        yield _chunk(outer.text[i : i + 7])
+
+                return gen()
+
+        self.chat = type("Chat", (), {"completions": _Completions()})()
+
+
+def _events(body: str) -> list[tuple[str, Any]]:
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_flow_stream_emits_fields_then_done(monkeypatch: pytest.MonkeyPatch) -> None:
+    text = json.dumps({"correct": False, "feedback": "Skips the cache.", "improvements": "Add a cache."})
+    monkeypatch.setattr("app.llm.OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr("app.llm.get_llm_client", lambda: _StreamingClient(text))
+
+    response = TestClient(app).post(
+        "/validate-flow/stream", json={"topic": "URL Shortener", "flowSummary": "Client -> API -> DB"}
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert _events(response.text) == [
+        ("correct", False),
+        ("feedback", "Skips the cache."),
+        ("improvements", "Add a cache."),
+        (
+            "done",
+            {
+                "correct": False,
+                "feedback": "Skips the cache.",
+                "improvements": "Add a cache.",
+                "topicResolution": {
+                    "input": "URL Shortener",
+                    "canonical": "Design a URL Shortener",
+                    "topicId": "url-shortener",
+                    "method": "exact",
+                    "score": 1.0,
+                    "suggestion": None,
+                },
+                "degraded": False,
+            },
+        ),
+    ]
+
+
+def test_flow_stream_sends_finished_fields_before_budget_runs_out(monkeypatch: pytest.MonkeyPatch) -> None:
+    text = json.dumps({"feedback": "Good start.", "correct": True, "improvements": "x" * 200})
+    monkeypatch.setenv("LLM_DEADLINE_VALIDATE_FLOW", "0.3")
+    monkeypatch.setattr("app.llm.OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr("app.llm.get_llm_client", lambda: _StreamingClient(text, stall_after=40))
+
+    response = TestClient(app).post(
+        "/validate-flow/stream", json={"topic": "URL Shortener", "flowSummary": "Client -> API -> DB"}
+    )
+
+    events = _events(response.text)
+    assert events[0] == ("feedback", "Good start.")
+    assert events[-1][0] == "done"
+    assert events[-1][1]["degraded"] is True
+
+
+def test_deep_dives_stream_emits_each_item(monkeypatch: pytest.MonkeyPatch) -> None:
+    text = json.dumps(
+        {
+            "items": [
+                {"topic": "Caching", "suggestedSummary": "Use Redis.", "feedback": ""},
+                {"topic": "Sharding", "suggestedSummary": "Hash by id.", "feedback": "Good."},
+            ],
+            "suggestedMissingTopics": ["Monitoring", "Rate limiting", "Replication", "Extra"],
+        }
+    )
+    monkeypatch.setattr("app.llm.OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr("app.llm.get_llm_client", lambda: _StreamingClient(text))
+
+    response = TestClient(app).post(
+        "/validate-deep-dives/stream",
+        json={"topic": "URL Shortener", "deepDives": [{"topic": "Sharding"}, {"topic": "Caching"}]},
+    )
+
+    events = _events(response.text)
+    assert [e for e, _ in events] == ["item", "item", "suggestedMissingTopics", "done"]
+    assert events[0][1] == {"topic": "Caching", "suggestedSummary": "Use Redis.", "feedback": ""}
+    done = events[-1][1]
+    assert [x["topic"] for x in done["items"]] == ["Sharding", "Caching"]
+    assert done["suggestedMissingTopics"] == ["Monitoring", "Rate limiting", "Replication"]
+
+
+def test_detailed_diagram_stream_sends_png_last(monkeypatch: pytest.MonkeyPatch) -> None:
+    text = json.dumps(
+        {"feedback": "Solid.", "improvements": "", "suggested_diagram": "flowchart TB\n  C[Client] --> API[API]"}
+    )
+    monkeypatch.setattr("app.llm.OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr("app.llm.get_llm_client", lambda: _StreamingClient(text))
+
+    fake_kroki = create_fake_kroki()
+    kroki = KrokiRenderer("http://fake-kroki", transport=httpx.ASGITransport(app=fake_kroki))
+    monkeypatch.setattr("app.main.kroki_renderer", kroki)
+    # In the natively rendered Mermaid subset: an SVG render, no Kroki call.
+    image_url = "/renders/" + render_id("mermaid", "flowchart TB\n  C[Client] --> API[API]") + ".svg"
+
+    response = TestClient(app).post("/validate-detailed-diagram/stream", json={"topic": "URL Shortener"})
+
+    events = _events(response.text)
+    assert [e for e, _ in events] == [
+        "feedback",
+        "improvements",
+        "suggestedDiagram",
+        "renderJob",
+        "suggestedDiagramPng",
+        "done",
+    ]
+    assert events[2][1] == "flowchart TB\n  C[Client] --> API[API]"
+    assert events[3][1] == {"id": render_id("mermaid", "flowchart TB\n  C[Client] --> API[API]")}
+    assert events[4][1] == image_url
+    assert events[-1][1]["suggestedDiagramPng"] == image_url
+    assert fake_kroki.state.requests == 0
@@ -0,0 +1,121 @@
+"""Tests for canonical topic resolution (alias table + trigram index)."""
+
+import json
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.topic_index import TopicIndex, core_form
+
+
+def test_core_form_drops_filler_words_and_punctuation() -> None:
+    assert core_form("Design a URL-Shortener!") == "url shortener"
+    assert core_form("Design") == "design"
+
+
+@pytest.mark.parametrize(
+    ("topic", "method"),
+    [
+        ("Design a URL Shortener", "exact"),
+        ("URL shortener", "exact"),
+        ("TinyURL", "alias"),
+        ("design a link shortener", "alias"),
+        ("url-shortner", "fuzzy"),
+    ],
+)
+def test_variants_resolve_to_one_canonical_topic(topic: str, method: str) -> None:
+    index = TopicIndex()
+    index.load()
+    resolution = index.resolve(topic)
+    assert resolution.canonical == "Design a URL Shortener"
+    assert resolution.topicId == "url-shortener"
+    assert resolution.method == method
+    assert resolution.input == topic
+
+
+def test_fuzzy_match_is_only_suggested_when_not_applied() -> None:
+    assert TopicIndex().apply_fuzzy
+    index = TopicIndex(apply_fuzzy=False)
+    index.load()
+    resolution = index.resolve("url-shortner")
+    assert (resolution.canonical, resolution.topicId, resolution.method) == ("url-shortner", None, "fuzzy")
+    assert resolution.suggestion == "Design a URL Shortener"
+
+
+@pytest.mark.parametrize(
+    "topic",
+    [
+        "Design Uber",
+        "distributed lock",
+        "distributed queue",
+        "distributed tracing",
+        "Design a distributed counter",
+        "Google Docs",
+        "web crawler",
+        "Design Twitter",
+        "Slack bot",
+        "Messenger bot",
+    ],
+)
+def test_different_problems_sharing_words_are_not_matched(topic: str) -> None:
+    index = TopicIndex()
+    index.load()
+    resolution = index.resolve(topic)
+    assert (resolution.canonical, resolution.topicId, resolution.method) == (topic, None, "none")
+
+
+def test_alias_edits_are_persisted_and_override_the_shipped_table(tmp_path: Path) -> None:
+    overrides = tmp_path / "aliases.json"
+    index = TopicIndex(overrides_path=str(overrides))
+    index.load()
+    index.set_topic("ride-sharing", "Design a Ride Sharing Service", ["Uber", "Lyft"])
+    assert index.resolve("Design Uber").canonical == "Design a Ride Sharing Service"
+    assert json.loads(overrides.read_text())["ride-sharing"]["aliases"] == ["Lyft", "Uber"]
+
+    reloaded = TopicIndex(overrides_path=str(overrides))
+    reloaded.load()
+    assert reloaded.resolve("lyft").method == "alias"
+    assert reloaded.resolve("TinyURL").topicId == "url-shortener"
+
+
+def test_bundle_topics_become_canonical_without_duplicating_known_ones() -> None:
+    index = TopicIndex()
+    index.load()
+    assert index.add_topics(["Design a Web Crawler", "URL Shortener"]) == 1
+    assert index.resolve("web crawler").canonical == "Design a Web Crawler"
+    assert index.resolve("web crawlers").canonical == "Design a Web Crawler"
+
+
+def test_endpoint_uses_canonical_topic_and_returns_resolution() -> None:
+    with patch("app.main.call_llm_apis_1", new_callable=AsyncMock) as mock_apis_1, patch(
+        "app.main.call_llm_apis_2", new_callable=AsyncMock
+    ) as mock_apis_2, patch("app.main.classify_requirements_coverage", new_callable=AsyncMock) as mock_coverage:
+        mock_apis_1.return_value = ["POST /shorten"]
+        mock_apis_2.return_value = ["GET /{code}"]
+        mock_coverage.return_value = {"matched": [], "missed": ["POST /shorten"]}
+        response = TestClient(app).post("/validate-apis", json={"topic": "tinyurl", "apis": []})
+
+    assert response.status_code == 200
+    mock_apis_1.assert_awaited_with("Design a URL Shortener")
+    resolution = response.json()["topicResolution"]
+    assert resolution["input"] == "tinyurl"
+    assert resolution["canonical"] == "Design a URL Shortener"
+    assert resolution["method"] == "alias"
+
+
+def test_endpoint_applies_and_logs_a_fuzzy_topic(capsys: pytest.CaptureFixture[str]) -> None:
+    with patch("app.main.call_llm_apis_1", new_callable=AsyncMock) as mock_apis_1, patch(
+        "app.main.call_llm_apis_2", new_callable=AsyncMock
+    ) as mock_apis_2, patch("app.main.classify_requirements_coverage", new_callable=AsyncMock) as mock_coverage:
+        mock_apis_1.return_value = ["POST /shorten"]
+        mock_apis_2.return_value = []
+        mock_coverage.return_value = {"matched": [], "missed": []}
+        response = TestClient(app).post("/validate-apis", json={"topic": "url-shortner", "apis": []})
+
+    mock_apis_1.assert_awaited_with("Design a URL Shortener")
+    resolution = response.json()["topicResolution"]
+    assert (resolution["canonical"], resolution["method"]) == ("Design a URL Shortener", "fuzzy")
+    assert "'url-shortner' -> 'Design a URL Shortener' (fuzzy" in capsys.readouterr().out